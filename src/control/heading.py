@@ -0,0 +1,101 @@
+"""
+Heading control, the fixed rate task that keeps the boat on a course
+
+Heading.step runs from system.scheduler at the control rate. It reads the
+latest heading the fusion task left in the AHRS, ahrs.yaw in degrees from true
+north, which converts the quaternion at most once per fusion step and never
+touches the bus, and runs a control.pid.PID with the angle wrap on it. The
+result is the rudder angle in radians, -pi/2 to pi/2 as course() of the
+pseudocode takes it, kept in rudder and handed to the actuator, e.g. the
+thruster mixer, when one is set.
+
+The time step is the measured time since the last tick, so a late tick gets
+the derivative and integral of the time that really passed. While no course
+is set the rudder stays at 0. The first tick with a course, and the first
+after a gap of more than GAP seconds, starts over from a rudder of 0 without
+derivative or integral history.
+
+Every tick records its execution time and the tick to tick period in
+system.timing histograms. A tick longer than the budget, the control period,
+counts as an overrun.
+
+    from control.heading import Heading
+    pilot = Heading(ahrs, actuator=mixer)
+    scheduler.add(pilot.step, 50, 'control')
+    pilot.course = 135.0
+    pilot.pid.tune(kp=0.05)
+    >>> pilot.report()
+"""
+import utime
+from math import pi
+from control.pid import PID
+from system.timing import Histogram
+
+KP = 0.04       # radians of rudder per degree of heading error
+KI = 0.001      # per degree second
+KD = 0.02       # per degree per second of turn
+SLEW = 3.0      # radians per second, the rudder does not swing faster
+GAP = 0.5       # seconds without a tick after which the controller restarts
+
+
+class Heading(object):
+
+    def __init__( self, ahrs, rate=50, actuator=None, kp=KP, ki=KI, kd=KD ):
+        """
+        ahrs: anything with a yaw property in degrees
+        rate: the ticks per second the scheduler runs step at, the overrun budget
+        actuator: called with the rudder angle after every tick, or None
+        """
+        self.ahrs = ahrs
+        self.actuator = actuator
+        self.pid = PID(kp, ki, kd, low=-pi / 2, high=pi / 2, slew=SLEW, wrap=360.0)
+        self.course = None      # degrees from true north, None holds the rudder at 0
+        self.rudder = 0.0       # radians, positive turns to starboard
+        self.budget = 1000000 // rate
+        self.last = None        # ticks_us of the last tick
+        self.time = Histogram()     # execution time of a tick, microseconds
+        self.period = Histogram()   # tick to tick, microseconds
+        self.ticks = 0
+        self.overruns = 0
+
+    def step( self ):
+        """ one control tick """
+        start = utime.ticks_us()
+        last = self.last
+        self.last = start
+        dt = 0.0
+        if last is not None:
+            interval = utime.ticks_diff(start, last)
+            self.period.add(interval)
+            dt = interval / 1000000
+
+        if self.course is None or last is None or dt > GAP:
+            # start over from a rudder of 0, without derivative or integral history
+            self.pid.reset()
+            dt = 0.0
+        if self.course is None:
+            rudder = 0.0
+        else:
+            rudder = self.pid.update(self.course, self.ahrs.yaw, dt)
+        self.rudder = rudder
+        if self.actuator is not None:
+            self.actuator(rudder)
+
+        elapsed = utime.ticks_diff(utime.ticks_us(), start)
+        self.time.add(elapsed)
+        self.ticks += 1
+        if elapsed > self.budget:
+            self.overruns += 1
+
+    def reset( self ):
+        """ clears the histograms and counters """
+        self.time.reset()
+        self.period.reset()
+        self.ticks = self.overruns = 0
+
+    def report( self ):
+        """ prints the tick counters and percentiles, for the REPL """
+        print("heading {:7d} ticks {:5d} over {}us  course {}  rudder {:.3f}".format(
+            self.ticks, self.overruns, self.budget, self.course, self.rudder))
+        self.time.report("  tick")
+        self.period.report("  period")
@@ -0,0 +1,119 @@
+"""
+PID controller on preallocated state
+
+update() takes the setpoint, the measurement and the time step and returns
+the output. The state is an array('f') of the integral, the last measurement
+and the last output, so an update builds nothing but the floats it computes.
+
+- derivative on measurement: the D term follows the measurement, not the
+  error, so a step in the setpoint gives no derivative kick
+- wrap: for angles the error and the measurement change are taken the short
+  way round, a heading of 359 degrees is 2 degrees from 1
+- anti-windup by clamping: the integral only grows while neither the limits
+  nor the slew cut the output back, or while the error pulls it back in
+- slew: the output moves by at most slew per second
+
+The integral is kept in output units, the sum of ki * error * dt, so a
+change of ki at runtime does not jump the output. kp, ki, kd, the limits and
+slew are plain attributes, set them at any time.
+
+    from control.pid import PID
+    pid = PID(0.04, 0.001, 0.02, low=-1.0, high=1.0, slew=2.0, wrap=360.0)
+    rudder = pid.update(course, ahrs.yaw, 0.02)
+"""
+from array import array
+from micropython import const
+
+_INTEGRAL = const(0)
+_LAST = const(1)        # the last measurement
+_OUTPUT = const(2)      # the last output
+
+
+def _wrap( x, period ):
+    """ x within half a period of 0 """
+    half = period / 2
+    if x >= half or x < -half:
+        x = (x + half) % period - half
+    return x
+
+
+class PID(object):
+
+    def __init__( self, kp, ki=0.0, kd=0.0, low=-1.0, high=1.0, slew=None, wrap=None ):
+        """
+        low, high: the output limits
+        slew: the largest output change per second, None for no limit
+        wrap: the period of an angular measurement, e.g. 360.0 for degrees, None for a linear one
+        """
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.low = low
+        self.high = high
+        self.slew = slew
+        self.wrap = wrap
+        self.state = array('f', [0.0, 0.0, 0.0])
+        self.first = True
+
+    def tune( self, kp=None, ki=None, kd=None ):
+        """ sets the gains given, the others stay """
+        if kp is not None:
+            self.kp = kp
+        if ki is not None:
+            self.ki = ki
+        if kd is not None:
+            self.kd = kd
+
+    def reset( self, output=0.0 ):
+        """ clears the integral, the next update starts without a derivative from output """
+        state = self.state
+        state[_INTEGRAL] = 0.0
+        state[_OUTPUT] = output
+        self.first = True
+
+    def update( self, setpoint, measurement, dt ):
+        """ the output for the measurement dt seconds after the last update """
+        state = self.state
+        wrap = self.wrap
+        error = setpoint - measurement
+        if self.first:
+            change = 0.0
+            self.first = False
+        else:
+            change = measurement - state[_LAST]
+        if wrap:
+            error = _wrap(error, wrap)
+            change = _wrap(change, wrap)
+        state[_LAST] = measurement
+
+        p = self.kp * error
+        d = -self.kd * change / dt if dt > 0 else 0.0
+        integral = state[_INTEGRAL] + self.ki * error * dt
+        wanted = p + integral + d
+
+        output = wanted
+        if output > self.high:
+            output = self.high
+        elif output < self.low:
+            output = self.low
+        if self.slew is not None:
+            last = state[_OUTPUT]
+            step = self.slew * dt
+            if output > last + step:
+                output = last + step
+            elif output < last - step:
+                output = last - step
+
+        # clamping: keep the new integral unless the output was cut back the way the error pushes it
+        if not (output < wanted and error > 0 or output > wanted and error < 0):
+            state[_INTEGRAL] = integral
+        state[_OUTPUT] = output
+        return output
+
+    @property
+    def integral( self ):
+        return self.state[_INTEGRAL]
+
+    @property
+    def output( self ):
+        return self.state[_OUTPUT]
@@ -1,44 +1,115 @@
 
 import utime
 import uasyncio
-from struct import pack, unpack
-from math import atan2, asin, degrees, sqrt, radians
-from store.ahrs import accelbias, magbias, save
+import micropython
+from array import array
+from struct import pack, unpack, unpack_from
+from math import atan2, degrees, radians
+from store.ahrs import select, accelbias, magbias, magcal, gyrotemp, save
+from fusion.madgwick import Madgwick
+from fusion.magcal import EllipsoidFit
+from fusion.gyrobias import GyroBias
+from fusion.gyrotemp import GyroTemperature
+from navigation.declination import Declination
+from qmath.quaternion import euler
+from system.timing import LoopTiming
+
+@micropython.viper
+def _int16( buf: ptr8, raw: ptr16, n: int, bigendian: int ):
+    """ decodes n 16 bit two's complement values from buf into raw, an array('h') """
+    for i in range(n):
+        if bigendian:
+            v = (buf[2 * i] << 8) | buf[2 * i + 1]
+        else:
+            v = (buf[2 * i + 1] << 8) | buf[2 * i]
+        if v > 32767:
+            v -= 65536
+        raw[i] = v
 
 class AHRS(object):
     '''
     Class provides 9-DOF sensor fusion for the MPU6050 allowing yaw, pitch and roll and quaternion to be extracted. 
-    This uses the Madgwick algorithm.
+    The fusion engine is chosen at construction, Madgwick by default or Mahony from fusion.mahony
+    calibration: the set in the store that holds this IMU's calibration
+    address: 0x69 with AD0 high, 0x68 for a second IMU with AD0 low
+    magnetometer: False leaves the I2C bypass closed, only one AK8963 can sit at 0x0C on the bus
     '''
 
-    def __init__( self, i2c ):
+    def __init__( self, i2c, engine=None, calibration='imu0', address=0x69, magnetometer=True ):
+
+        self.address = address
+        self.magnetometer = magnetometer
 
         self.accelSSF = 16384
         self.gyroSSF = 131
+        self.gyroRad = radians(1) / self.gyroSSF   # radians per second per LSB
         self.declination = 0   # Optional offset for true north. A +ve value adds to heading
+        self.declinationTable = Declination()   # updates the declination from the position, see locate
         
-        aelf.accelbias = accelbias()
+        self.calibration = calibration
+        select(calibration)
+        self.accelbias = accelbias()
         self.magbias = magbias()
+        self.magcal = magcal()      # (offset x,y,z, soft iron matrix row by row) from calibrateMag, or None
+
+        # the fused magnetometer transform applied to the raw HX, HY, HZ, see setMagCalibration
+        self.magT = array('f', [0.0] * 9)
+        self.magO = array('f', [0.0] * 3)
         
         #self.magbias =  (45.9844, -21.3047, 43.5039, 57.375, 45.3516, 43.5039, 0.84956, 1.07479, 1.12044)
 
-        GyroMeasError = radians(40)         # Original code indicates this leads to a 2 sec response time
-        self.beta = sqrt(3.0 / 4.0) * GyroMeasError  # compute beta (see README)
+        self.engine = engine or Madgwick()  # any object with update(q, v, dt) and updateIMU(q, v, dt)
+        self.gyroBias = GyroBias()          # online gyro bias estimate applied to every sample, None disables it
+        self.gyroBias.table = GyroTemperature()  # the bias per die temperature, learned while still
+        if gyrotemp():
+            self.gyroBias.table.restore(gyrotemp())
+        self.recorder = None                # optional store.recorder.Recorder, fed from fastStep and readFifo
+        self.telemetry = None               # optional networking.telemetry.Telemetry, fed from the fusion tasks
+        self.timing = LoopTiming()          # loop period, I2C and fusion time histograms of fastStep and readFifo, None disables it
         self.startTime = None
 
-        self.q = [1.0, 0.0, 0.0, 0.0]       # vector to hold quaternion
+        self.q = array('f', [1.0, 0.0, 0.0, 0.0])   # vector to hold quaternion, updated in place
+
+        # preallocated sample for the allocation free fastStep
+        # ax, ay, az in g, gx, gy, gz in radians per second, mx, my, mz calibrated
+        self.sample = array('f', [0.0] * 9)
+        self.raw = array('h', [0] * 7)
 
-        self.pitch = 0
-        self.yaw = 0
-        self.roll = 0
+        # yaw, pitch and roll are computed lazily from the quaternion, see updateEuler
+        self.stale = True
+        self.ypr = array('f', [0.0] * 3)
 
         self.accel = (0,0,0)
         self.gyro = (0,0,0)
         self.mag = (0,0,0)
+
+        # preallocated buffer for the burst read of ACCEL_XOUT_H (0x3B) .. GYRO_ZOUT_L (0x48)
+        self.motion = bytearray(14)
+
+        # die temperature in degrees C, converted at most once per second, see updateTemperature
+        self.temperature = None
+        self.tempTime = None
+        self.tempdata = bytearray(2)
+
+        # preallocated buffers for the AK8963 status ST1 (0x02) and HXL (0x03) .. ST2 (0x09)
+        self.st1 = bytearray(1)
+        self.magdata = bytearray(7)
+
+        # FIFO batch sampling, see initFifo
+        self.fifodt = None
+        self.fifocount = bytearray(2)
+        self.fifobuf = bytearray(504)   # 42 samples of accel + gyro, the 512 byte FIFO rounded down
+        self.fifoview = memoryview(self.fifobuf)
+        self.fifoOverflows = 0
+        self.fifoTicks = None           # ticks_us given to the last FIFO sample recorded
         
         self.i2c = i2c 
 
         self.initMag()
+        if self.magcal:
+            self.setMagCalibration(self.magcal[0:3], (self.magcal[3:6], self.magcal[6:9], self.magcal[9:12]))
+        else:
+            self.setMagCalibration(*self.magbiasCalibration(self.magbias))
         self.initAccel(fullScaleRange=0)
         self.gyrofullScaleRange(fullScaleRange = 0)
         self.gyroLowPassFilter(bandwidth = 6)
@@ -47,18 +118,23 @@ class AHRS(object):
     def initMag( self ):
         # Directly access the magnetomoeter via I2C BYPASS mode
         try:
-            self.i2c.writeto_mem(0x69, 0x6B, b'\x80') #PWR_MGMT_1 = H_RESET # Rest the MPU6050
-            self.i2c.writeto_mem(0x69, 0x6A, b'\x00') #USER_CTRL_AD = I2C_MST = 0x00 disable i2c master
-            self.i2c.writeto_mem(0x69, 0x37, b'\x02') #INT_PIN_CFG = BYPASS[1]
+            self.i2c.writeto_mem(self.address, 0x6B, b'\x80') #PWR_MGMT_1 = H_RESET # Rest the MPU6050
+            self.i2c.writeto_mem(self.address, 0x6A, b'\x00') #USER_CTRL_AD = I2C_MST = 0x00 disable i2c master
+            if self.magnetometer:
+                self.i2c.writeto_mem(self.address, 0x37, b'\x02') #INT_PIN_CFG = BYPASS[1]
         except OSError as e:
             print('please check the MPU9250 I2C wiring ')
 
+        if not self.magnetometer:
+            self.asax = self.asay = self.asaz = 1.0
+            return
+
         # Read the Factory set Magntometer Sesetivity Adjustments
         self.i2c.writeto_mem(0x0C, 0x0A, b'\x1F') #CNTL1 Fuse ROM mode
         utime.sleep_ms(100) # Settle Time
 
         # Read factory calibrated sensitivity constants
-        asax, asay, asaz = unpack('<bbb',self.i2c.readfrom_mem(0x0C, 0x10, 3)) 
+        asax, asay, asaz = unpack('<BBB',self.i2c.readfrom_mem(0x0C, 0x10, 3)) 
 
         # Calculate the Magnetometer Sesetivity Adjustments
         self.asax = (((asax-128)*0.5)/128)+1
@@ -75,20 +151,20 @@ class AHRS(object):
         returns fullScaleRange
         ''' 
         if fullScaleRange != None and fullScaleRange in [0,1,2,3]:
-            self.i2c.writeto_mem(0x69, 0x1C, pack('b',
-            (self.i2c.readfrom_mem(0x69, 0x1C, 1)[0] & ~24) | fullScaleRange << 3
+            self.i2c.writeto_mem(self.address, 0x1C, pack('b',
+            (self.i2c.readfrom_mem(self.address, 0x1C, 1)[0] & ~24) | fullScaleRange << 3
             ))
 
             # pick the accelerometer Sensitivity Scale Factor    
-            self.accelSSF = 16834 #[16384,8192,4096,2048][fullScaleRange] 
+            self.accelSSF = [16384,8192,4096,2048][fullScaleRange]
     
-        return (self.i2c.readfrom_mem(0x69, 0x1C, 1)[0] & 24) >> 3 
+        return (self.i2c.readfrom_mem(self.address, 0x1C, 1)[0] & 24) >> 3 
 
     def readAccel( self ):
         """
         return tuple of accelerations (x,y,z)
         """
-        x,y,z = unpack('>hhh',self.i2c.readfrom_mem(0x69, 0x3B, 6)) 
+        x,y,z = unpack('>hhh',self.i2c.readfrom_mem(self.address, 0x3B, 6)) 
 
         x = x / self.accelSSF
         y = y / self.accelSSF
@@ -119,27 +195,140 @@ class AHRS(object):
         """
         return tuple of degrees per second (x,y,z)
         """
-        x,y,z = unpack('>hhh',self.i2c.readfrom_mem(0x69, 0x43, 6)) 
+        x,y,z = unpack('>hhh',self.i2c.readfrom_mem(self.address, 0x43, 6)) 
         x = x / self.gyroSSF
         y = y / self.gyroSSF
         z = z / self.gyroSSF
 
         return x,y,z 
 
+    def readMotion( self ):
+        """
+        burst reads accel, temperature and gyro registers 0x3B..0x48 in one I2C transaction
+        so the accel and gyro samples come from the same instant
+        updates and returns self.accel (x,y,z) in g and self.gyro (x,y,z) in degrees per second
+        """
+        self.i2c.readfrom_mem_into(self.address, 0x3B, self.motion)
+        ax, ay, az, t, gx, gy, gz = unpack_from('>hhhhhhh', self.motion)
+
+        a = self.accelSSF
+        g = self.gyroSSF
+        self.accel = ax / a, ay / a, az / a
+        self.gyro = gx / g, gy / g, gz / g
+
+        return self.accel, self.gyro
+
+    def initFifo( self, rate=200 ):
+        """
+        Sets up the MPU9250 FIFO to capture accel and gyro samples at a fixed output data rate
+        rate: Hz, 4..500. The DLPF is enabled so the internal sample rate is 1kHz
+        returns the hardware sample period in seconds
+        """
+        div = max(0, min(255, 1000 // rate - 1))
+        self.i2c.writeto_mem(self.address, 0x19, pack('B', div)) # SMPLRT_DIV
+
+        # CONFIG FIFO_MODE[6] = 1, stop writing when full. The 512 bytes are not a whole number of
+        # samples, a full FIFO ends in part of a sample and readFifo resets it
+        self.i2c.writeto_mem(self.address, 0x1A, pack('B',
+            self.i2c.readfrom_mem(self.address, 0x1A, 1)[0] | 0x40
+        ))
+
+        self.i2c.writeto_mem(self.address, 0x23, b'\x00') # FIFO_EN = none
+        self.i2c.writeto_mem(self.address, 0x6A, b'\x04') # USER_CTRL = FIFO_RST, I2C_MST stays disabled for bypass
+        self.i2c.writeto_mem(self.address, 0x6A, b'\x40') # USER_CTRL = FIFO_EN
+        self.i2c.writeto_mem(self.address, 0x23, b'\x78') # FIFO_EN = GYRO_XOUT | GYRO_YOUT | GYRO_ZOUT | ACCEL
+
+        self.fifodt = (div + 1) / 1000
+        self.fifoTicks = None
+        return self.fifodt
+
+    def readFifo( self ):
+        """
+        Drains the FIFO in one bulk read and fuses every sample with the hardware sample period as dt.
+        The magnetometer correction is applied to the last sample when the AK8963 has new data.
+        After an overflow the FIFO ends in part of a sample and everything after it would be
+        misaligned, so the batch is dropped and the FIFO reset.
+        returns the number of samples fused
+        """
+        self.i2c.readfrom_mem_into(self.address, 0x72, self.fifocount) # FIFO_COUNTH, FIFO_COUNTL
+        count = unpack_from('>H', self.fifocount)[0] & 0x1FFF
+
+        if count % 12 or count >= 512:
+            self.fifoOverflows += 1
+            self.i2c.writeto_mem(self.address, 0x6A, b'\x04') # USER_CTRL = FIFO_RST
+            self.i2c.writeto_mem(self.address, 0x6A, b'\x40') # USER_CTRL = FIFO_EN
+            self.fifoTicks = None
+            return 0
+
+        samples = count // 12
+        if not samples:
+            return 0
+
+        # a loop is a batch that is fused, the count read is not timed
+        timing = self.timing
+        if timing is not None:
+            timing.begin()
+        size = samples * 12
+        self.i2c.readfrom_mem_into(self.address, 0x74, self.fifoview[:size]) # FIFO_R_W
+        now = utime.ticks_us()
+
+        mag = self.readMag()
+        if mag is not None:
+            self.mag = mag
+        self.updateTemperature(burst=False) # the FIFO holds no temperature
+        if timing is not None:
+            timing.split()
+
+        a = self.accelSSF
+        g = self.gyroSSF
+        dt = self.fifodt
+        last = size - 12
+        recorder = self.recorder
+        if recorder is not None:
+            # the samples are a sample period apart, the batch follows on from the last one and
+            # is pulled slowly towards the read time, or starts from it after a gap or an overflow
+            period = int(dt * 1000000)
+            newmag = mag is not None
+            if self.fifoTicks is None:
+                late = 3 * period
+            else:
+                expected = utime.ticks_add(self.fifoTicks, period * samples)
+                late = utime.ticks_diff(now, expected)
+            if late > 2 * period or late < -2 * period:
+                self.fifoTicks = now
+            else:
+                self.fifoTicks = utime.ticks_add(expected, late // 8)
+        for offset in range(0, size, 12):
+            if recorder is not None:
+                recorder.appendFifo(self.fifobuf, offset, self.tempdata, self.magdata, newmag and offset == last,
+                    utime.ticks_add(self.fifoTicks, -period * ((last - offset) // 12)))
+            ax, ay, az, gx, gy, gz = unpack_from('>hhhhhh', self.fifobuf, offset)
+            self.accel = ax / a, ay / a, az / a
+            self.gyro = gx / g, gy / g, gz / g
+            if offset == last and mag is not None:
+                self.fusion( self.accel, self.gyro, mag, dt )
+            else:
+                self.fusionIMU( self.accel, self.gyro, dt )
+        if timing is not None:
+            timing.end()
+
+        return samples
+
     def gyrofullScaleRange(self, fullScaleRange=None ):
         """    
         Sets and reads the Gyro full scal operting range
         fullScaleRange: 0,1,2,3 => +-250, +-500, +-1000, +-2000 degrees/second  
         """
         if fullScaleRange != None and fullScaleRange in [0,1,2,3]:
-            self.i2c.writeto_mem(0x69, 0x1B, pack('b',
-            (self.i2c.readfrom_mem(0x69, 0x1B, 1)[0] & ~24) | fullScaleRange << 3
+            self.i2c.writeto_mem(self.address, 0x1B, pack('b',
+            (self.i2c.readfrom_mem(self.address, 0x1B, 1)[0] & ~24) | fullScaleRange << 3
             ))
 
             # pick the gyro Sensitivity Scale Factor    
-            self.gyroSSF = 131 #[131,65.5,32.8,16.4][fullScaleRange] 
+            self.gyroSSF = [131,65.5,32.8,16.4][fullScaleRange]
+            self.gyroRad = radians(1) / self.gyroSSF
 
-        return (self.i2c.readfrom_mem(0x69, 0x1B, 1)[0] & 24) >> 3 
+        return (self.i2c.readfrom_mem(self.address, 0x1B, 1)[0] & 24) >> 3 
 
     def gyroLowPassFilter(self, bandwidth=None ):
         """    
@@ -147,105 +336,174 @@ class AHRS(object):
         bandwidth: 0,1,2,3,4,5,6,7 => 250Hz, 184Hz, 92Hz, 41Hz, 20Hz, 10Hz, 5Hz, 3600Hz
         """
         if bandwidth and bandwidth in [0,1,2,3,4,5,6,7]:
-            self.i2c.writeto_mem(0x69, 0x1A, pack('b',
-            (self.i2c.readfrom_mem(0x69, 0x1A, 1)[0] & ~7 ) | bandwidth
+            self.i2c.writeto_mem(self.address, 0x1A, pack('b',
+            (self.i2c.readfrom_mem(self.address, 0x1A, 1)[0] & ~7 ) | bandwidth
             ))
 
-        return self.i2c.readfrom_mem(0x69, 0x1A, 1)[0] & 7   
-
-
-    def readMag( self, bias=(0,0,0,1,1,1,1,1,1) ):
-        
-        DRDY = self.i2c.readfrom_mem(0x0C, 0x02, 1)[0] & 0x01
- 
-        if DRDY != 0x01 : # Data is ready
-            raise Exception()
+        return self.i2c.readfrom_mem(self.address, 0x1A, 1)[0] & 7   
 
-        # Correct the orentation of the magnetometer to align with the accelermeter and gyro
-        y,x,z = unpack('<hhh',self.i2c.readfrom_mem(0x0C, 0x03, 6))  
-        z = -1 * z
 
-        HOFL = self.i2c.readfrom_mem(0x0C, 0x09, 1)[0] & 0x08
+    def magReady( self ):
+        """
+        return True when the AK8963 has a new measurement (ST1 DRDY)
+        """
+        if not self.magnetometer:
+            return False
+        self.i2c.readfrom_mem_into(0x0C, 0x02, self.st1)
+        return self.st1[0] & 0x01 == 0x01
 
-        # apply the Factory Magentometer Sensetivity adjustment
-        x,y,z = x * self.asax, y * self.asay , z * self.asaz
+    def readMagRaw( self ):
+        """
+        return tuple of the uncalibrated magnetic field (x,y,z) in the accel and gyro axes,
+        factory sensitivity adjusted, or None when there is no new measurement
+        """
+        if not self.magReady():
+            return None
 
-        # calibrate
-        x,y,z = x - bias[0], y - bias[1], z - bias[2]
+        # HXL..HZH and ST2 in one read, reading ST2 releases the data registers for the next measurement
+        self.i2c.readfrom_mem_into(0x0C, 0x03, self.magdata)
 
-        # normalize
-        x,y,z = x / bias[3], y / bias[4], z / bias[5]
+        # Correct the orentation of the magnetometer to align with the accelermeter and gyro
+        y,x,z = unpack_from('<hhh', self.magdata)
+        z = -1 * z
 
-        # scale
-        x,y,z = x * bias[6], y * bias[7], z * bias[8]
+        # apply the Factory Magentometer Sensetivity adjustment, ASAX belongs to HX
+        return x * self.asay, y * self.asax , z * self.asaz
 
-        return x,y,z
+    def readMag( self ):
+        """
+        return tuple of the calibrated magnetic field (x,y,z)
+        or None when there is no new measurement since the last read
+        """
+        if not self.magReady():
+            return None
 
+        # HXL..HZH and ST2 in one read, reading ST2 releases the data registers for the next measurement
+        self.i2c.readfrom_mem_into(0x0C, 0x03, self.magdata)
+        hx, hy, hz = unpack_from('<hhh', self.magdata)
 
+        # orientation, sensitivity adjustment and calibration in one transform
+        T = self.magT
+        O = self.magO
+        return (T[0] * hx + T[1] * hy + T[2] * hz - O[0],
+                T[3] * hx + T[4] * hy + T[5] * hz - O[1],
+                T[6] * hx + T[7] * hy + T[8] * hz - O[2])
 
+    def setMagCalibration( self, offset, matrix ):
+        """
+        fuses the axis orientation, factory sensitivity adjustment, hard iron offset
+        and soft iron matrix into one transform of the raw readings
+            calibrated = matrix * (adjusted - offset) = T * raw - O
+        adjusted is the output of readMagRaw: x = HY * asay, y = HX * asax, z = -HZ * asaz
+        """
+        T = self.magT
+        O = self.magO
+        for i in range(3):
+            w = matrix[i]
+            T[3 * i + 0] = w[1] * self.asax
+            T[3 * i + 1] = w[0] * self.asay
+            T[3 * i + 2] = -w[2] * self.asaz
+            O[i] = w[0] * offset[0] + w[1] * offset[1] + w[2] * offset[2]
+
+    def magbiasCalibration( self, bias ):
+        """
+        converts a magbias tuple (offset x,y,z, normalisation x,y,z, scale x,y,z)
+        to an offset and a diagonal soft iron matrix
+        """
+        return bias[0:3], ((bias[6] / bias[3], 0, 0), (0, bias[7] / bias[4], 0), (0, 0, bias[8] / bias[5]))
 
+    def readSample( self ):
+        """
+        allocation free burst read of accel and gyro into self.sample[0:6]
+        accel in g, gyro in radians per second
+        """
+        self.i2c.readfrom_mem_into(self.address, 0x3B, self.motion)
+        _int16(self.motion, self.raw, 7, 1)
+
+        raw = self.raw
+        sample = self.sample
+        a = self.accelSSF
+        g = self.gyroRad
+        sample[0] = raw[0] / a
+        sample[1] = raw[1] / a
+        sample[2] = raw[2] / a
+        sample[3] = raw[4] * g
+        sample[4] = raw[5] * g
+        sample[5] = raw[6] * g
+
+    def readMagSample( self ):
+        """
+        allocation free read of the calibrated magnetometer into self.sample[6:9]
+        return False when there is no new measurement
+        """
+        if not self.magReady():
+            return False
+
+        self.i2c.readfrom_mem_into(0x0C, 0x03, self.magdata)
+        _int16(self.magdata, self.raw, 3, 0)
+
+        # same fused transform as readMag
+        raw = self.raw
+        sample = self.sample
+        T = self.magT
+        O = self.magO
+        sample[6] = T[0] * raw[0] + T[1] * raw[1] + T[2] * raw[2] - O[0]
+        sample[7] = T[3] * raw[0] + T[4] * raw[1] + T[5] * raw[2] - O[1]
+        sample[8] = T[6] * raw[0] + T[7] * raw[1] + T[8] * raw[2] - O[2]
+        return True
 
     def calibrateMag( self, samples=800, delay=10 ):
         '''
-        Creates a tuple of magbias
+        Fits an ellipsoid to the magnetometer readings and saves the hard iron offset
+        and soft iron matrix to the store
         During the calibration rotate the gyro in all directions
         '''
         print("calibrate magnetmeter, by waving it around in a figure of 8")
-        minx = 0
-        maxx = 0
-        miny = 0
-        maxy = 0
-        minz = 0
-        maxz = 0
+        fit = EllipsoidFit()
 
         while samples :
-
             samples = samples - 1
-            try:
-                x,y,z = self.readMag()  
-                minx = min(x,minx)
-                maxx = max(x,maxx)
-                miny = min(y,miny)
-                maxy = max(y,maxy)
-                minz = min(z,minz)
-                maxz = max(z,maxz)
-            except Exception:
-                pass
-        
-            print(x,y,z)
+            mag = self.readMagRaw()
+            if mag is not None:
+                fit.add(*mag)
             utime.sleep_ms(delay)
 
-        cx = (maxx + minx) / 2
-        cy = (maxy + miny) / 2  
-        cz = (maxz + minz) / 2  
-
-        nx = abs(maxx - cx)
-        ny = abs(maxy - cy)
-        nz = abs(maxz - cz)
-
-        # Soft iron correction
-        avg_delta_x = (maxx - minx) / 2
-        avg_delta_y = (maxy - miny) / 2
-        avg_delta_z = (maxz - minz) / 2
+        offset, matrix = fit.solve()
+        print("offset", offset)
+        print("soft iron", matrix)
 
-        avg_delta = (avg_delta_x + avg_delta_y + avg_delta_z) / 3
-        
-        sx = avg_delta / avg_delta_x
-        sy = avg_delta / avg_delta_y
-        sz = avg_delta / avg_delta_z
-
-        print("offset",cx,cy,cz)
-        print("normalisation",nx,ny,nz)
-        print("scale",sx,sy,sz)
-
-
-        self.magbias = (cx, cy, cz ,nx, ny, nz, sx, sy, sz)
-        magbias(self.magbias)
+        self.magcal = tuple(offset) + matrix[0] + matrix[1] + matrix[2]
+        self.setMagCalibration(offset, matrix)
+        select(self.calibration)
+        magcal(self.magcal)
         save()
 
-        print("magbias saved")
+        print("magcal saved")
 
-        return cx, cy, cz ,nx, ny, nz, sx, sy, sz
+        return offset, matrix
+
+    def updateTemperature( self, burst=True ):
+        """
+        converts the die temperature and hands it to the gyro bias, at most once per second
+        burst: take TEMP_OUT from the last burst read, otherwise read the register, for the FIFO
+        """
+        now = utime.ticks_ms()
+        if self.tempTime is not None and utime.ticks_diff(now, self.tempTime) < 1000:
+            return
+        self.tempTime = now
+
+        if burst:
+            data = self.motion
+            raw = (data[6] << 8) | data[7]
+        else:
+            self.i2c.readfrom_mem_into(self.address, 0x41, self.tempdata) # TEMP_OUT_H, TEMP_OUT_L
+            raw = (self.tempdata[0] << 8) | self.tempdata[1]
+        if raw > 32767:
+            raw -= 65536
+        self.temperature = raw / 333.87 + 21
+
+        if self.gyroBias is not None:
+            self.gyroBias.temperature(self.temperature)
 
     def deltat( self):
         '''
@@ -262,140 +520,182 @@ class AHRS(object):
         self.startTime = currentTime
         return dt
 
-    def fusion(self, accel, gyro, mag ): # 3-tuples (x, y, z) for accel, gyro and mag data
-        mx, my, mz = mag # Units irrelevant (normalised)
-        ax, ay, az = accel # Units irrelevant (normalised)
-        gx, gy, gz = (radians(x) for x in gyro)  # Units deg/s
-        q1, q2, q3, q4 = (self.q[x] for x in range(4))   # short name local variable for readability
-        # Auxiliary variables to avoid repeated arithmetic
-        _2q1 = 2 * q1
-        _2q2 = 2 * q2
-        _2q3 = 2 * q3
-        _2q4 = 2 * q4
-        _2q1q3 = 2 * q1 * q3
-        _2q3q4 = 2 * q3 * q4
-        q1q1 = q1 * q1
-        q1q2 = q1 * q2
-        q1q3 = q1 * q3
-        q1q4 = q1 * q4
-        q2q2 = q2 * q2
-        q2q3 = q2 * q3
-        q2q4 = q2 * q4
-        q3q3 = q3 * q3
-        q3q4 = q3 * q4
-        q4q4 = q4 * q4
-
-        # Normalise accelerometer measurement
-        norm = sqrt(ax * ax + ay * ay + az * az)
-        if (norm == 0):
-            return # handle NaN
-        norm = 1 / norm                     # use reciprocal for division
-        ax *= norm
-        ay *= norm
-        az *= norm
-
-        # Normalise magnetometer measurement
-        norm = sqrt(mx * mx + my * my + mz * mz)
-        if (norm == 0):
-            return                          # handle NaN
-        norm = 1 / norm                     # use reciprocal for division
-        mx *= norm
-        my *= norm
-        mz *= norm
-
-        # Reference direction of Earth's magnetic field
-        _2q1mx = 2 * q1 * mx
-        _2q1my = 2 * q1 * my
-        _2q1mz = 2 * q1 * mz
-        _2q2mx = 2 * q2 * mx
-        hx = mx * q1q1 - _2q1my * q4 + _2q1mz * q3 + mx * q2q2 + _2q2 * my * q3 + _2q2 * mz * q4 - mx * q3q3 - mx * q4q4
-        hy = _2q1mx * q4 + my * q1q1 - _2q1mz * q2 + _2q2mx * q3 - my * q2q2 + my * q3q3 + _2q3 * mz * q4 - my * q4q4
-        _2bx = sqrt(hx * hx + hy * hy)
-        _2bz = -_2q1mx * q3 + _2q1my * q2 + mz * q1q1 + _2q2mx * q4 - mz * q2q2 + _2q3 * my * q4 - mz * q3q3 + mz * q4q4
-        _4bx = 2 * _2bx
-        _4bz = 2 * _2bz
-
-        # Gradient descent algorithm corrective step
-        s1 = (-_2q3 * (2 * q2q4 - _2q1q3 - ax) + _2q2 * (2 * q1q2 + _2q3q4 - ay) - _2bz * q3 * (_2bx * (0.5 - q3q3 - q4q4)
-             + _2bz * (q2q4 - q1q3) - mx) + (-_2bx * q4 + _2bz * q2) * (_2bx * (q2q3 - q1q4) + _2bz * (q1q2 + q3q4) - my)
-             + _2bx * q3 * (_2bx * (q1q3 + q2q4) + _2bz * (0.5 - q2q2 - q3q3) - mz))
-
-        s2 = (_2q4 * (2 * q2q4 - _2q1q3 - ax) + _2q1 * (2 * q1q2 + _2q3q4 - ay) - 4 * q2 * (1 - 2 * q2q2 - 2 * q3q3 - az)
-             + _2bz * q4 * (_2bx * (0.5 - q3q3 - q4q4) + _2bz * (q2q4 - q1q3) - mx) + (_2bx * q3 + _2bz * q1) * (_2bx * (q2q3 - q1q4)
-             + _2bz * (q1q2 + q3q4) - my) + (_2bx * q4 - _4bz * q2) * (_2bx * (q1q3 + q2q4) + _2bz * (0.5 - q2q2 - q3q3) - mz))
-
-        s3 = (-_2q1 * (2 * q2q4 - _2q1q3 - ax) + _2q4 * (2 * q1q2 + _2q3q4 - ay) - 4 * q3 * (1 - 2 * q2q2 - 2 * q3q3 - az)
-             + (-_4bx * q3 - _2bz * q1) * (_2bx * (0.5 - q3q3 - q4q4) + _2bz * (q2q4 - q1q3) - mx)
-             + (_2bx * q2 + _2bz * q4) * (_2bx * (q2q3 - q1q4) + _2bz * (q1q2 + q3q4) - my)
-             + (_2bx * q1 - _4bz * q3) * (_2bx * (q1q3 + q2q4) + _2bz * (0.5 - q2q2 - q3q3) - mz))
-
-        s4 = (_2q2 * (2 * q2q4 - _2q1q3 - ax) + _2q3 * (2 * q1q2 + _2q3q4 - ay) + (-_4bx * q4 + _2bz * q2) * (_2bx * (0.5 - q3q3 - q4q4)
-              + _2bz * (q2q4 - q1q3) - mx) + (-_2bx * q1 + _2bz * q3) * (_2bx * (q2q3 - q1q4) + _2bz * (q1q2 + q3q4) - my)
-              + _2bx * q2 * (_2bx * (q1q3 + q2q4) + _2bz * (0.5 - q2q2 - q3q3) - mz))
-
-        norm = 1 / sqrt(s1 * s1 + s2 * s2 + s3 * s3 + s4 * s4)    # normalise step magnitude
-        s1 *= norm
-        s2 *= norm
-        s3 *= norm
-        s4 *= norm
-
-        # Compute rate of change of quaternion
-        qDot1 = 0.5 * (-q2 * gx - q3 * gy - q4 * gz) - self.beta * s1
-        qDot2 = 0.5 * ( q1 * gx + q3 * gz - q4 * gy) - self.beta * s2
-        qDot3 = 0.5 * ( q1 * gy - q2 * gz + q4 * gx) - self.beta * s3
-        qDot4 = 0.5 * ( q1 * gz + q2 * gy - q3 * gx) - self.beta * s4
-
-
-        dt = self.deltat()
-        # Integrate to yield quaternion
-        q1 += qDot1 * dt
-        q2 += qDot2 * dt
-        q3 += qDot3 * dt
-        q4 += qDot4 * dt
-
-        # normalise quaternion
-        norm = 1 / sqrt(q1 * q1 + q2 * q2 + q3 * q3 + q4 * q4)    
-        self.q = q1 * norm, q2 * norm, q3 * norm, q4 * norm
-
-        self.yaw = self.declination + degrees(atan2(2.0 * (self.q[1] * self.q[2] + self.q[0] * self.q[3]),
-            self.q[0] * self.q[0] + self.q[1] * self.q[1] - self.q[2] * self.q[2] - self.q[3] * self.q[3]))
-
-        self.pitch = degrees(-asin(2.0 * (self.q[1] * self.q[3] - self.q[0] * self.q[2])))
-
-        self.roll = degrees(atan2(2.0 * (self.q[0] * self.q[1] + self.q[2] * self.q[3]),
-            self.q[0] * self.q[0] - self.q[1] * self.q[1] - self.q[2] * self.q[2] + self.q[3] * self.q[3]))
+    def fusion(self, accel, gyro, mag, dt=None ): # 3-tuples (x, y, z) for accel, gyro and mag data, dt in seconds or None to measure it
+        """
+        fusion engine update with the magnetometer correction
+        accel in g, gyro in degrees per second, mag calibrated (units irrelevant, normalised)
+        """
+        if dt is None:
+            dt = self.deltat()
+        self.fill(accel, gyro, mag)
+        self.engine.update(self.q, self.sample, dt)
+        self.stale = True
+
+    def fusionIMU(self, accel, gyro, dt=None ): # 3-tuples (x, y, z) for accel and gyro data, dt in seconds or None to measure it
+        """
+        fusion engine update without the magnetometer correction,
+        used between magnetometer measurements
+        """
+        if dt is None:
+            dt = self.deltat()
+        self.fill(accel, gyro)
+        self.engine.updateIMU(self.q, self.sample, dt)
+        self.stale = True
+
+    def fill( self, accel, gyro, mag=None ):
+        """ copies the sample tuples into self.sample, the gyro converted to radians per second """
+        sample = self.sample
+        sample[0] = accel[0]
+        sample[1] = accel[1]
+        sample[2] = accel[2]
+        sample[3] = radians(gyro[0])
+        sample[4] = radians(gyro[1])
+        sample[5] = radians(gyro[2])
+        if mag is not None:
+            sample[6] = mag[0]
+            sample[7] = mag[1]
+            sample[8] = mag[2]
+        if self.gyroBias is not None:
+            self.gyroBias.update(sample)
+
+    def updateEuler( self ):
+        """
+        converts the quaternion to yaw, pitch and roll in degrees
+        only when the quaternion changed since the last conversion
+        """
+        if not self.stale:
+            return
+        self.stale = False
+
+        euler(self.ypr, self.q)
 
+    def locate( self, lat, lon ):
+        """
+        sets the declination for the position in degrees, from the GPS fix
+        the fixed declination stays when there is no declination table
+        """
+        declination = self.declinationTable.lookup(lat, lon)
+        if declination is not None:
+            self.declination = declination
+
+    @property
+    def yaw( self ):
+        """ heading in degrees including the declination """
+        self.updateEuler()
+        return self.declination + self.ypr[0]
+
+    @property
+    def pitch( self ):
+        """ pitch in degrees """
+        self.updateEuler()
+        return self.ypr[1]
+
+    @property
+    def roll( self ):
+        """ roll in degrees """
+        self.updateEuler()
+        return self.ypr[2]
 
     def dofusion( self ):
         while True:
             try:
-                accel = self.readAccel()
-                gyro = self.readGyro()
-                mag = self.readMag(self.magbias)
-                self.fusion( accel, gyro, mag )
-                print("w{}wa{}ab{}bc{}c".format(self.q[0],self.q[1],self.q[2],self.q[3]))
+                self.step()
+                if self.telemetry is not None:
+                    self.telemetry.update(self.q, self.declination)
             except Exception:
                 pass
+
+    def step( self ):
+        """
+        one multi-rate fusion step
+        accel and gyro are fused on every step, the magnetometer correction
+        is applied only when the AK8963 has a new measurement (100Hz)
+        """
+        mag = self.readMag()
+        self.readMotion()
+        self.updateTemperature()
+        if mag is None:
+            self.fusionIMU( self.accel, self.gyro )
+        else:
+            self.mag = mag
+            self.fusion( self.accel, self.gyro, mag )
+            
+    def fastStep( self, dt=None ):
+        """
+        allocation free multi-rate fusion step on the preallocated sample and quaternion arrays
+        yaw, pitch and roll are converted only when they are read
+        """
+        timing = self.timing
+        if timing is not None:
+            timing.begin()
+        if dt is None:
+            dt = self.deltat()
+        self.readSample()
+        self.updateTemperature()
+        newmag = self.readMagSample()
+        if timing is not None:
+            timing.split()
+        if self.gyroBias is not None:
+            self.gyroBias.update(self.sample)
+        if self.recorder is not None:
+            self.recorder.append(self.motion, self.magdata, newmag)
+        if newmag:
+            self.engine.update(self.q, self.sample, dt)
+        else:
+            self.engine.updateIMU(self.q, self.sample, dt)
+        self.stale = True
+        if timing is not None:
+            timing.end()
             
     # async tasks
 
     def heading( self ):
         while True:
-            try:
-                x,y,z = self.readMag(self.magbias)
+            mag = self.readMag()
+            if mag is not None:
+                x,y,z = mag
                 print( degrees(atan2(y, x)) )
-            except Exception:
-                pass
           
+    def fusionStep( self ):
+        """ one fastStep and its telemetry, the fixed rate task for system.scheduler """
+        self.fastStep()
+        if self.telemetry is not None:
+            self.telemetry.update(self.q, self.declination)
+
     async def fusionTask( self ):
+        """ fuses as fast as the other tasks allow, system.scheduler runs fusionStep at a fixed rate instead """
         while True:
             try:
-                self.mag = self.readMag(self.magbias)
-                self.accel = self.readAccel()
-                self.gyro = self.readGyro()
-                self.fusion( self.accel, self.gyro, self.mag )
-                print("w{}wa{}ab{}bc{}c".format(self.q[0],self.q[1],self.q[2],self.q[3]))
+                self.fusionStep()
             except Exception:
                 pass
             await uasyncio.sleep_ms(0)
 
+    async def storeTask( self, period=600 ):
+        """
+        saves what was learned online to the store every period seconds when it changed,
+        the gyro temperature table
+        """
+        while True:
+            await uasyncio.sleep(period)
+            table = self.gyroBias.table if self.gyroBias is not None else None
+            if table is not None and table.dirty:
+                select(self.calibration)
+                gyrotemp(table.dump())
+                save()
+                table.dirty = False
+
+    async def fifoTask( self, rate=200, period=20 ):
+        """
+        fuses the FIFO samples every period ms. The samples carry the hardware
+        sample timing, so a late wake up does not disturb the integration as long
+        as the FIFO does not fill up (42 samples, 210ms at 200Hz)
+        """
+        self.initFifo(rate)
+        while True:
+            try:
+                if self.readFifo() and self.telemetry is not None:
+                    self.telemetry.update(self.q, self.declination)
+            except Exception:
+                pass
+            await uasyncio.sleep_ms(period)
@@ -0,0 +1,252 @@
+"""
+Manages the shared I2C bus
+
+Bus owns the I2C instance and answers the machine.I2C calls the drivers already
+make, so a driver takes a Bus wherever it took the I2C. Every transaction is
+counted per device address with its time on the wire, which gives the share of
+the bus each device uses and the headroom left.
+
+Devices that only need polling at a fixed rate schedule their reads instead of
+running their own loops, and task() issues them. Scheduled reads of the same
+device and rate whose register ranges lie close together are coalesced into one
+burst transfer, when the bytes in between cost less wire time than the extra
+transaction would.
+
+    from drivers.bus import Bus
+    bus = Bus()
+    ahrs = AHRS(i2c=bus)
+    bus.register(0x75, 'IP5306')
+    level = bus.schedule(0x75, 0x78, 1, rate=1)
+    asyncio.create_task(bus.task())
+    ...
+    level.data[0], bus.utilisation(0x69)
+"""
+import utime
+import uasyncio
+
+# clocks per transaction on the wire: start, address and register byte with
+# their ACKs and stop, plus a repeated start and address for reads, 9 per data byte
+OVERHEAD = 2 + 9 * 2
+RESTART = 10
+BYTE = 9
+SPIN = 50   # microseconds, shorter waits block in utime.sleep_us as in system/scheduler.py
+
+
+class Device(object):
+    """ the transaction counters of one address """
+
+    def __init__( self, address, name ):
+        self.address = address
+        self.name = name
+        self.transactions = 0
+        self.bytes = 0
+        self.bits = 0
+        self.errors = 0
+        self.failures = 0       # exceptions raised by the callbacks of its reads
+        self.error = None       # the last of them
+
+
+class Read(object):
+    """ a scheduled read, data is a memoryview of its registers in the last transfer """
+
+    def __init__( self, transfer, offset, size, callback ):
+        self.transfer = transfer
+        self.offset = offset
+        self.size = size
+        self.callback = callback
+        self.data = None
+
+    def view( self ):
+        self.data = memoryview(self.transfer.buf)[self.offset:self.offset + self.size]
+
+
+class Transfer(object):
+    """ one burst read serving one or more scheduled reads """
+
+    def __init__( self, address, register, size, period ):
+        self.address = address
+        self.register = register
+        self.buf = bytearray(size)
+        self.period = period    # microseconds
+        self.due = utime.ticks_us()
+        self.reads = []
+
+    def merge( self, register, size ):
+        """ widens the burst to cover register .. register + size, keeping the data offsets right """
+        start = min(self.register, register)
+        end = max(self.register + len(self.buf), register + size)
+        if start != self.register or end - start != len(self.buf):
+            shift = self.register - start
+            for read in self.reads:
+                read.offset += shift
+            self.register = start
+            self.buf = bytearray(end - start)
+            for read in self.reads:
+                read.view()
+        return register - start
+
+
+class Bus(object):
+
+    def __init__( self, i2c=None, freq=400000 ):
+        """
+        i2c: the bus to manage, by default the singleton from drivers.i2c
+        freq: the bus clock, for the wire time
+        """
+        if i2c is None:
+            from drivers.i2c import i2c
+        self.i2c = i2c
+        self.freq = freq
+        self.devices = {}
+        self.transfers = []
+        self.wake = uasyncio.Event() # set by schedule() to cut the sleep of task() short
+        self.reset()
+
+    def register( self, address, name ):
+        """ names a device in the counters, unregistered addresses are counted by number """
+        device = self.device(address)
+        device.name = name
+        return device
+
+    def device( self, address ):
+        device = self.devices.get(address)
+        if device is None:
+            device = self.devices[address] = Device(address, hex(address))
+        return device
+
+    def reset( self ):
+        """ clears the counters and starts a new utilisation period """
+        for device in self.devices.values():
+            device.transactions = device.bytes = device.bits = device.errors = device.failures = 0
+        self.start = utime.ticks_ms()
+
+    def count( self, address, n, read ):
+        device = self.device(address)
+        device.transactions += 1
+        device.bytes += n
+        device.bits += OVERHEAD + BYTE * n + (RESTART if read else 0)
+
+    def utilisation( self, address=None ):
+        """ share of the bus time since reset used by one device or by all of them """
+        elapsed = utime.ticks_diff(utime.ticks_ms(), self.start) / 1000
+        if elapsed <= 0:
+            return 0.0
+        if address is None:
+            bits = sum(device.bits for device in self.devices.values())
+        else:
+            bits = self.device(address).bits
+        return bits / self.freq / elapsed
+
+    def report( self ):
+        for device in self.devices.values():
+            print("{:8s} {:6d} transactions {:8d} bytes {:5.1f}% of the bus {} errors {} callback failures".format(
+                device.name, device.transactions, device.bytes, 100 * self.utilisation(device.address),
+                device.errors, device.failures))
+            if device.error is not None:
+                print("         last failure: {!r}".format(device.error))
+        print("headroom {:5.1f}%".format(100 * (1 - self.utilisation())))
+
+    # the machine.I2C calls of the drivers, counted
+
+    def scan( self ):
+        return self.i2c.scan()
+
+    def readfrom_mem_into( self, addr, memaddr, buf ):
+        try:
+            self.i2c.readfrom_mem_into(addr, memaddr, buf)
+        except OSError:
+            self.device(addr).errors += 1
+            raise
+        self.count(addr, len(buf), True)
+
+    def readfrom_mem( self, addr, memaddr, nbytes ):
+        try:
+            data = self.i2c.readfrom_mem(addr, memaddr, nbytes)
+        except OSError:
+            self.device(addr).errors += 1
+            raise
+        self.count(addr, nbytes, True)
+        return data
+
+    def writeto_mem( self, addr, memaddr, buf ):
+        try:
+            self.i2c.writeto_mem(addr, memaddr, buf)
+        except OSError:
+            self.device(addr).errors += 1
+            raise
+        self.count(addr, len(buf), False)
+
+    # scheduled reads
+
+    def schedule( self, address, register, size, rate, callback=None ):
+        """
+        reads size registers from register every 1 / rate seconds in task()
+        callback: called with the Read after every transfer, an exception it raises
+            is counted in the failures of the device and does not stop the polling
+        returns the Read, its data holds the registers of the last transfer
+        """
+        period = int(1000000 / rate)
+        for transfer in self.transfers:
+            if transfer.address != address or transfer.period != period:
+                continue
+            # the bytes between the ranges against the transaction they save
+            gap = max(register - (transfer.register + len(transfer.buf)), transfer.register - (register + size), 0)
+            if gap * BYTE < OVERHEAD + RESTART:
+                read = Read(transfer, 0, size, callback)
+                read.offset = transfer.merge(register, size)
+                transfer.reads.append(read)
+                read.view()
+                return read
+
+        transfer = Transfer(address, register, size, period)
+        read = Read(transfer, 0, size, callback)
+        transfer.reads.append(read)
+        read.view()
+        self.transfers.append(transfer)
+        # the new transfer is due now, earlier than task() may be sleeping
+        self.wake.set()
+        return read
+
+    def poll( self ):
+        """ issues the transfers that are due, returns microseconds until the next one """
+        now = utime.ticks_us()
+        wait = 1000000
+        for transfer in self.transfers:
+            late = utime.ticks_diff(now, transfer.due)
+            if late >= 0:
+                try:
+                    self.readfrom_mem_into(transfer.address, transfer.register, transfer.buf)
+                except OSError:
+                    pass
+                else:
+                    for read in transfer.reads:
+                        if read.callback is not None:
+                            try:
+                                read.callback(read)
+                            except Exception as e:
+                                device = self.device(transfer.address)
+                                device.failures += 1
+                                device.error = e
+                # keep the rate, skip the periods that were missed
+                transfer.due = utime.ticks_add(transfer.due, transfer.period * (1 + late // transfer.period))
+                late = utime.ticks_diff(now, transfer.due)
+            wait = min(wait, -late)
+        return wait
+
+    async def task( self ):
+        """
+        issues the scheduled reads, sleeps until the next one is due or schedule()
+        adds one, waits are rounded up to the millisecond as by system.scheduler
+        """
+        while True:
+            wait = self.poll()
+            if wait > SPIN:
+                try:
+                    await uasyncio.wait_for_ms(self.wake.wait(), (wait + 999) // 1000)
+                except uasyncio.TimeoutError:
+                    pass
+                self.wake.clear()
+            else:
+                if wait > 0:
+                    utime.sleep_us(wait)
+                await uasyncio.sleep_ms(0)
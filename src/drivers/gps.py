@@ -0,0 +1,393 @@
+"""
+Streaming NMEA 0183 GPS driver
+
+poll() reads what the UART has received into a preallocated ring buffer with
+readinto and runs it through a viper state machine. The state machine resyncs
+on every '$', copies the sentence body into a line buffer, XORs the checksum
+byte by byte, records the comma positions and stops at the end of a sentence
+whose checksum matches. GGA, RMC and VTG from any talker are then parsed field
+by field from the comma positions, in place, into the fixed slots of Fix.
+Nothing is split, sliced or decoded, the only allocation is the memoryview of
+the free part of the ring on each read.
+
+Latitude and longitude are kept as int32 in 1e-7 degrees, float32 would round
+them to about a metre. Polling at 10Hz keeps up with 10Hz GGA, RMC and VTG at
+38400 baud, three sentences per poll. drivers.ubx.UBX reads the same Fix from
+u-blox NAV-PVT frames at up to 20Hz, with velocity and accuracy.
+
+    from drivers.gps import GPS
+    gps = GPS()
+    scheduler.add(gps.poll, 10, 'gps')
+    ...
+    if gps.fix.valid:
+        ahrs.locate(gps.fix.lat, gps.fix.lon)
+"""
+import utime
+import micropython
+from array import array
+from micropython import const
+
+RING = const(1024)      # ring buffer, a bit over 0.25s of 38400 baud
+LINE = const(96)        # sentence body, NMEA allows 82 characters including $ and CRLF
+FIELDS = const(24)      # comma positions kept per sentence
+
+# the scanner state, an array('i') shared with _scan
+_TAIL = const(0)        # ring read index
+_HEAD = const(1)        # ring write index
+_LENGTH = const(2)      # bytes in the line buffer
+_XOR = const(3)         # running checksum of the body
+_PHASE = const(4)       # 0 hunting for '$', 1 body, 2 and 3 the checksum digits
+_EXPECT = const(5)      # the checksum sent
+_COUNT = const(6)       # fields in the line, the commas plus the terminating '*'
+_ERRORS = const(7)      # sentences dropped on a bad checksum, a bad digit or overlength
+_COMMAS = const(8)      # the comma positions in the line, then the '*'
+
+# sentence types, the three characters after the talker id
+_GGA = const(0x474741)
+_RMC = const(0x524D43)
+_VTG = const(0x565447)
+
+
+@micropython.viper
+def _scan( ring: ptr8, line: ptr8, state: ptr32, size: int ) -> int:
+    """
+    consumes ring bytes from TAIL up to HEAD, returns 1 as soon as the line
+    holds a sentence with a good checksum, 0 when the ring is drained
+    """
+    tail = state[_TAIL]
+    head = state[_HEAD]
+    while tail != head:
+        c = ring[tail]
+        tail += 1
+        if tail == size:
+            tail = 0
+
+        if c == 36: # '$' starts a sentence wherever it appears
+            state[_LENGTH] = 0
+            state[_XOR] = 0
+            state[_COUNT] = 0
+            state[_PHASE] = 1
+            continue
+
+        phase = state[_PHASE]
+        if phase == 1:
+            n = state[_LENGTH]
+            if c == 42: # '*' ends the body
+                state[_COMMAS + state[_COUNT]] = n
+                state[_COUNT] = state[_COUNT] + 1
+                state[_PHASE] = 2
+            elif c < 32 or n == LINE or state[_COUNT] == FIELDS - 1:
+                # a line end without checksum, or too long
+                state[_ERRORS] = state[_ERRORS] + 1
+                state[_PHASE] = 0
+            else:
+                if c == 44: # ','
+                    state[_COMMAS + state[_COUNT]] = n
+                    state[_COUNT] = state[_COUNT] + 1
+                line[n] = c
+                state[_LENGTH] = n + 1
+                state[_XOR] = state[_XOR] ^ c
+
+        elif phase >= 2:
+            if 48 <= c <= 57:
+                v = c - 48
+            elif 65 <= c <= 70:
+                v = c - 55
+            elif 97 <= c <= 102:
+                v = c - 87
+            else:
+                v = -1
+            if v < 0:
+                state[_ERRORS] = state[_ERRORS] + 1
+                state[_PHASE] = 0
+            elif phase == 2:
+                state[_EXPECT] = v << 4
+                state[_PHASE] = 3
+            else:
+                state[_PHASE] = 0
+                if state[_EXPECT] | v == state[_XOR]:
+                    state[_TAIL] = tail
+                    return 1
+                state[_ERRORS] = state[_ERRORS] + 1
+    state[_TAIL] = tail
+    return 0
+
+
+@micropython.viper
+def _fixed( line: ptr8, start: int, end: int, decimals: int ) -> int:
+    """ the decimal number in line[start:end] times 10 ** decimals, truncated, 0 when empty """
+    value = 0
+    sign = 1
+    places = -1     # digits after the point, -1 before it
+    i = start
+    while i < end:
+        c = line[i]
+        i += 1
+        if c == 45: # '-'
+            sign = -1
+        elif c == 46: # '.'
+            places = 0
+        elif places < decimals:
+            value = value * 10 + c - 48
+            if places >= 0:
+                places += 1
+    if places < 0:
+        places = 0
+    while places < decimals:
+        value *= 10
+        places += 1
+    return sign * value
+
+
+@micropython.viper
+def _coordinate( line: ptr8, bounds: int, out: ptr32, index: int ):
+    """
+    writes the ddmm.mmmmm or dddmm.mmmmm field in 1e-7 degrees to out[index]
+    bounds: start | end << 8 | 1 << 16 for the southern or western hemisphere
+    """
+    start = bounds & 0xFF
+    end = (bounds >> 8) & 0xFF
+    dot = start
+    while dot < end and line[dot] != 46:
+        dot += 1
+    degrees = 0
+    i = start
+    while i < dot - 2:
+        degrees = degrees * 10 + line[i] - 48
+        i += 1
+    minutes = 0     # 1e-5 minutes
+    places = -1
+    while i < end and places < 5:
+        c = line[i]
+        i += 1
+        if c == 46:
+            places = 0
+        else:
+            minutes = minutes * 10 + c - 48
+            if places >= 0:
+                places += 1
+    if places < 0:
+        places = 0
+    while places < 5:
+        minutes *= 10
+        places += 1
+    value = degrees * 10000000 + minutes * 100 // 60
+    if bounds >> 16:
+        value = -value
+    out[index] = value
+
+
+class Fix(object):
+    """
+    the latest GPS solution in fixed slots
+    position: array('i') latitude, longitude in 1e-7 degrees, north and east positive
+    data: array('i') of the integer fields, see the properties
+    """
+
+    TIME = const(0)         # UTC milliseconds of the day
+    DATE = const(1)         # ddmmyy
+    ALTITUDE = const(2)     # millimetres above mean sea level
+    QUALITY = const(3)      # GGA fix quality, 0 no fix, 1 GPS, 2 DGPS, 4 RTK fixed, 5 RTK float
+    SATELLITES = const(4)   # in use
+    HDOP = const(5)         # hundredths
+    SPEED = const(6)        # millimetres per second over ground
+    COURSE = const(7)       # hundredths of a degree over ground, true
+    VALID = const(8)        # RMC status A or GGA quality above 0, the last of them decides
+    TICKS = const(9)        # utime.ticks_ms of the last update
+    ACCURACY = const(10)    # millimetres horizontal accuracy estimate, UBX only
+    NORTH = const(11)       # millimetres per second north, UBX only
+    EAST = const(12)        # millimetres per second east, UBX only
+    DOWN = const(13)        # millimetres per second down, UBX only
+
+    def __init__( self ):
+        self.position = array('i', [0, 0])
+        self.data = array('i', [0] * 14)
+
+    @property
+    def lat( self ):
+        """ latitude in degrees """
+        return self.position[0] / 10000000
+
+    @property
+    def lon( self ):
+        """ longitude in degrees """
+        return self.position[1] / 10000000
+
+    @property
+    def altitude( self ):
+        """ metres above mean sea level """
+        return self.data[Fix.ALTITUDE] / 1000
+
+    @property
+    def speed( self ):
+        """ metres per second over ground """
+        return self.data[Fix.SPEED] / 1000
+
+    @property
+    def course( self ):
+        """ degrees over ground, true """
+        return self.data[Fix.COURSE] / 100
+
+    @property
+    def accuracy( self ):
+        """ metres, the receiver's horizontal accuracy estimate, 0 from NMEA """
+        return self.data[Fix.ACCURACY] / 1000
+
+    @property
+    def north( self ):
+        """ metres per second, 0 from NMEA """
+        return self.data[Fix.NORTH] / 1000
+
+    @property
+    def east( self ):
+        """ metres per second, 0 from NMEA """
+        return self.data[Fix.EAST] / 1000
+
+    @property
+    def hdop( self ):
+        return self.data[Fix.HDOP] / 100
+
+    @property
+    def satellites( self ):
+        return self.data[Fix.SATELLITES]
+
+    @property
+    def quality( self ):
+        return self.data[Fix.QUALITY]
+
+    @property
+    def valid( self ):
+        """ True when the receiver reports a valid position """
+        return self.data[Fix.VALID] == 1
+
+    def age( self ):
+        """ milliseconds since the last update """
+        return utime.ticks_diff(utime.ticks_ms(), self.data[Fix.TICKS])
+
+
+class GPS(object):
+
+    def __init__( self, uart=None, rx=16, tx=17, baudrate=38400 ):
+        """
+        uart: a machine.UART, by default UART 2 on rx and tx with a receive buffer for a 10Hz burst
+        """
+        if uart is None:
+            from machine import UART
+            uart = UART(2, baudrate=baudrate, rx=rx, tx=tx, rxbuf=RING, timeout=0)
+        self.uart = uart
+        self.ring = bytearray(RING)
+        self.view = memoryview(self.ring)
+        self.line = bytearray(LINE)
+        self.state = array('i', [0] * (_COMMAS + FIELDS))
+        self.fix = Fix()
+        self.sentences = 0  # GGA, RMC and VTG sentences parsed
+
+    @property
+    def errors( self ):
+        """ sentences dropped for a bad checksum or format """
+        return self.state[_ERRORS]
+
+    def poll( self ):
+        """
+        reads and parses everything received since the last poll
+        returns the number of GGA, RMC and VTG sentences parsed
+        """
+        state = self.state
+        parsed = 0
+        while True:
+            # the free part of the ring runs from head up to one byte short of
+            # the tail, or to the end of the ring when the tail is behind head
+            head = state[_HEAD]
+            tail = state[_TAIL]
+            if tail > head:
+                end = tail - 1
+            else:
+                end = RING if tail else RING - 1
+            room = end - head
+            n = 0
+            if room:
+                n = self.uart.readinto(self.view[head:end]) or 0
+                head += n
+                state[_HEAD] = 0 if head == RING else head
+            while self.scan():
+                parsed += self.parse()
+            if n < room or not n:
+                return parsed
+
+    def scan( self ):
+        """ 1 when the next sentence with a good checksum is in the line buffer """
+        return _scan(self.ring, self.line, self.state, RING)
+
+    def parse( self ):
+        """ parses the sentence in the line buffer, returns 1 for GGA, RMC and VTG """
+        line = self.line
+        commas = self.state
+        if commas[_COUNT] < 2 or commas[_COMMAS] != 5:
+            return 0
+        kind = (line[2] << 16) | (line[3] << 8) | line[4]
+        data = self.fix.data
+        if kind == _GGA:
+            self.time(1)
+            self.coordinate(0, 2)
+            self.coordinate(1, 4)
+            data[Fix.QUALITY] = self.number(6, 0)
+            # receivers set to GGA only have no RMC status
+            data[Fix.VALID] = 1 if data[Fix.QUALITY] else 0
+            data[Fix.SATELLITES] = self.number(7, 0)
+            data[Fix.HDOP] = self.number(8, 2)
+            data[Fix.ALTITUDE] = self.number(9, 3)
+        elif kind == _RMC:
+            self.time(1)
+            data[Fix.VALID] = 1 if self.char(2) == 65 else 0 # 'A'
+            self.coordinate(0, 3)
+            self.coordinate(1, 5)
+            data[Fix.SPEED] = self.number(7, 3) * 1852 // 3600 # knots
+            if self.char(8): # no course while stationary
+                data[Fix.COURSE] = self.number(8, 2)
+            data[Fix.DATE] = self.number(9, 0)
+        elif kind == _VTG:
+            if self.char(1):
+                data[Fix.COURSE] = self.number(1, 2)
+            data[Fix.SPEED] = self.number(5, 3) * 1852 // 3600
+        else:
+            return 0
+        data[Fix.TICKS] = utime.ticks_ms()
+        self.sentences += 1
+        return 1
+
+    # fields of the sentence in the line buffer, numbered from 1 after the sentence id
+
+    def bounds( self, k ):
+        """ start of field k, its end is self.state[_COMMAS + k] """
+        return self.state[_COMMAS + k - 1] + 1
+
+    def char( self, k ):
+        """ the first character of field k, 0 when empty or missing """
+        if k >= self.state[_COUNT]:
+            return 0
+        start = self.bounds(k)
+        return self.line[start] if start < self.state[_COMMAS + k] else 0
+
+    def number( self, k, decimals ):
+        """ field k times 10 ** decimals, 0 when empty or missing """
+        if k >= self.state[_COUNT]:
+            return 0
+        return _fixed(self.line, self.bounds(k), self.state[_COMMAS + k], decimals)
+
+    def time( self, k ):
+        """ hhmmss.sss in field k into the fix, UTC milliseconds of the day """
+        if self.char(k):
+            start = self.bounds(k)
+            line = self.line
+            ms = _fixed(line, start + 4, self.state[_COMMAS + k], 3)
+            ms += ((line[start] - 48) * 10 + line[start + 1] - 48) * 3600000
+            ms += ((line[start + 2] - 48) * 10 + line[start + 3] - 48) * 60000
+            self.fix.data[Fix.TIME] = ms
+
+    def coordinate( self, index, k ):
+        """ the coordinate in field k and its hemisphere in field k + 1 into fix.position[index] """
+        if self.char(k) and k + 1 < self.state[_COUNT]:
+            hemisphere = self.char(k + 1)
+            south = 1 if hemisphere == 83 or hemisphere == 87 else 0 # 'S', 'W'
+            _coordinate(self.line, self.bounds(k) | (self.state[_COMMAS + k] << 8) | (south << 16),
+                self.fix.position, index)
@@ -29,13 +29,13 @@ asaz = (((asaz-128)*0.5)/128)+1
 # Set Register CNTL1 to 16-bit output, Continuous measurement mode 100Hz
 i2c.writeto_mem(0x0C, 0x0A, b'\x16') 
 
-# TODO is not accurate :-o
 def temp():
     """
     return the temperature in degrees celcius
+    TEMP_OUT is signed, degrees C = TEMP_OUT / 333.87 + 21
     """
-    t = unpack('>H',i2c.readfrom_mem(0x68, 0x41, 2))[0]
-    t = ((t-21) / 333.87) + 21
+    t = unpack('>h',i2c.readfrom_mem(0x68, 0x41, 2))[0]
+    t = t / 333.87 + 21
     return t
 
 
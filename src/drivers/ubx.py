@@ -0,0 +1,317 @@
+"""
+u-blox UBX binary GPS driver, NAV-PVT at up to 20Hz
+
+A NAV-PVT frame carries the whole solution, position, velocity, time and
+accuracy, in 100 bytes where GGA, RMC and VTG take about 230 characters of
+decimal text. UBX reads the UART into the ring buffer of drivers.gps.GPS and
+runs it through a viper state machine that syncs on 0xB5 0x62, follows the
+length and accumulates the 8 bit Fletcher checksum over class, id, length and
+payload. A frame with a good checksum is decoded in place: the NAV-PVT fields
+are read at their fixed offsets straight out of the ring, little endian,
+wrapping at its end, into the same Fix the NMEA driver fills. Nothing is
+copied or unpacked, the only allocation is the memoryview of each read.
+
+The ring keeps a frame that has not fully arrived, the read never overwrites
+it, so frames may straddle polls. A frame with a bad checksum or an impossible
+length is counted and the scan resumes one byte after its sync.
+
+configure() sets the measurement rate and switches the port to UBX output with
+NAV-PVT on every epoch, NMEA off. These are the CFG-PRT, CFG-MSG and CFG-RATE
+messages of the M8 series, the M9 and M10 still accept them. The receiver
+forgets them at power off, so configure() runs at every start.
+
+    from drivers.ubx import UBX
+    gps = UBX()
+    gps.configure(rate=20)
+    scheduler.add(gps.poll, 20, 'gps')
+    ...
+    if gps.fix.valid:
+        gps.fix.lat, gps.fix.lon, gps.fix.north, gps.fix.east
+"""
+import utime
+import micropython
+from array import array
+from micropython import const
+from drivers.gps import GPS, Fix, RING
+
+_MASK = const(1023)     # RING - 1, the ring size is a power of two
+FRAME = const(512)      # longest payload accepted, so a frame always fits the ring
+
+# the scanner state, an array('i') shared with _scan. TAIL and HEAD as in drivers.gps
+_TAIL = const(0)        # start of the frame being scanned, the ring is free up to here
+_HEAD = const(1)        # ring write index
+_SCAN = const(2)        # ring read index
+_PHASE = const(3)       # 0 and 1 the sync bytes, 2 class, 3 id, 4 and 5 length, 6 payload, 7 and 8 checksum
+_CLASS = const(4)
+_ID = const(5)
+_LENGTH = const(6)      # payload bytes
+_COUNT = const(7)       # payload bytes scanned
+_CKA = const(8)         # the running Fletcher checksum
+_CKB = const(9)
+_PAYLOAD = const(10)    # ring index of the first payload byte
+_ERRORS = const(11)     # frames dropped on a bad checksum or length
+
+# message class << 8 | id
+NAV_PVT = const(0x0107)
+ACK_ACK = const(0x0501)
+ACK_NAK = const(0x0500)
+CFG_PRT = const(0x0600)
+CFG_MSG = const(0x0601)
+CFG_RATE = const(0x0608)
+
+_PVT = const(92)        # NAV-PVT payload length
+
+# the Fix.data slots written by _pvt
+_TIME = const(0)
+_DATE = const(1)
+_ALTITUDE = const(2)
+_QUALITY = const(3)
+_SATELLITES = const(4)
+_HDOP = const(5)
+_SPEED = const(6)
+_COURSE = const(7)
+_VALID = const(8)
+_ACCURACY = const(10)
+_NORTH = const(11)
+_EAST = const(12)
+_DOWN = const(13)
+
+
+@micropython.viper
+def _scan( ring: ptr8, state: ptr32, size: int ) -> int:
+    """
+    scans ring bytes from SCAN up to HEAD, returns 1 as soon as a frame with a
+    good checksum has been scanned, 0 when the ring is drained
+    """
+    scan = state[_SCAN]
+    head = state[_HEAD]
+    while scan != head:
+        at = scan
+        c = ring[scan]
+        scan += 1
+        if scan == size:
+            scan = 0
+
+        phase = state[_PHASE]
+        if phase == 0:
+            if c == 0xB5:
+                state[_PHASE] = 1
+            else:
+                state[_TAIL] = scan # nothing to keep
+            continue
+        if phase == 1:
+            if c == 0x62:
+                state[_PHASE] = 2
+                state[_CKA] = 0
+                state[_CKB] = 0
+            elif c == 0xB5:
+                state[_TAIL] = at
+            else:
+                state[_PHASE] = 0
+                state[_TAIL] = scan
+            continue
+
+        error = 0
+        if phase < 7:
+            a = (state[_CKA] + c) & 0xFF
+            state[_CKA] = a
+            state[_CKB] = (state[_CKB] + a) & 0xFF
+            if phase == 2:
+                state[_CLASS] = c
+                state[_PHASE] = 3
+            elif phase == 3:
+                state[_ID] = c
+                state[_PHASE] = 4
+            elif phase == 4:
+                state[_LENGTH] = c
+                state[_PHASE] = 5
+            elif phase == 5:
+                n = state[_LENGTH] | (c << 8)
+                state[_LENGTH] = n
+                state[_COUNT] = 0
+                state[_PAYLOAD] = scan
+                if n > FRAME:
+                    error = 1
+                else:
+                    state[_PHASE] = 6 if n else 7
+            else:
+                n = state[_COUNT] + 1
+                state[_COUNT] = n
+                if n == state[_LENGTH]:
+                    state[_PHASE] = 7
+        elif phase == 7:
+            if c == state[_CKA]:
+                state[_PHASE] = 8
+            else:
+                error = 1
+        else:
+            state[_PHASE] = 0
+            if c == state[_CKB]:
+                state[_TAIL] = scan
+                state[_SCAN] = scan
+                return 1
+            error = 1
+
+        if error:
+            # resume one byte after the sync of the bad frame
+            state[_ERRORS] = state[_ERRORS] + 1
+            state[_PHASE] = 0
+            scan = state[_TAIL] + 1
+            if scan == size:
+                scan = 0
+            state[_TAIL] = scan
+    state[_SCAN] = scan
+    return 0
+
+
+@micropython.viper
+def _pvt( ring: ptr8, payload: int, position: ptr32, data: ptr32 ):
+    """ decodes the NAV-PVT payload at ring index payload into the Fix arrays """
+    p = payload
+    # the I4 fields from lon at 24 to headMot at 64, little endian, sign extended from the top byte
+    o = 24
+    while o <= 64:
+        top = ring[(p + o + 3) & _MASK]
+        if top > 127:
+            top -= 256
+        v = ring[(p + o) & _MASK] | (ring[(p + o + 1) & _MASK] << 8) | (ring[(p + o + 2) & _MASK] << 16) | (top << 24)
+        if o == 24:
+            position[1] = v
+        elif o == 28:
+            position[0] = v
+        elif o == 36:
+            data[_ALTITUDE] = v     # hMSL
+        elif o == 40:
+            data[_ACCURACY] = v     # hAcc
+        elif o == 48:
+            data[_NORTH] = v
+        elif o == 52:
+            data[_EAST] = v
+        elif o == 56:
+            data[_DOWN] = v
+        elif o == 60:
+            data[_SPEED] = v        # gSpeed
+        elif o == 64:
+            v = v // 1000           # headMot, 1e-5 degrees
+            data[_COURSE] = v + 36000 if v < 0 else v
+        o += 4
+
+    # nano, -1e9 to 1e9 around the second
+    nano = ring[(p + 16) & _MASK] | (ring[(p + 17) & _MASK] << 8) | (ring[(p + 18) & _MASK] << 16)
+    top = ring[(p + 19) & _MASK]
+    if top > 127:
+        top -= 256
+    nano |= top << 24
+    ms = ((ring[(p + 8) & _MASK] * 60 + ring[(p + 9) & _MASK]) * 60 + ring[(p + 10) & _MASK]) * 1000
+    if nano >= 0:
+        ms += nano // 1000000
+    else:
+        ms -= (999999 - nano) // 1000000
+    data[_TIME] = ms
+    year = ring[(p + 4) & _MASK] | (ring[(p + 5) & _MASK] << 8)
+    data[_DATE] = (ring[(p + 7) & _MASK] * 100 + ring[(p + 6) & _MASK]) * 100 + year % 100
+
+    kind = ring[(p + 20) & _MASK]   # fixType, 2 2D, 3 3D, 4 GNSS and dead reckoning
+    flags = ring[(p + 21) & _MASK]  # gnssFixOK, diffSoln, carrSoln in the top two bits
+    valid = 1 if (flags & 1) and 2 <= kind <= 4 else 0
+    data[_VALID] = valid
+    carrier = flags >> 6
+    if not valid:
+        data[_QUALITY] = 0
+    elif carrier == 2:
+        data[_QUALITY] = 4
+    elif carrier == 1:
+        data[_QUALITY] = 5
+    elif flags & 2:
+        data[_QUALITY] = 2
+    else:
+        data[_QUALITY] = 1
+    data[_SATELLITES] = ring[(p + 23) & _MASK]
+    # NAV-PVT has the position DOP only, it stands in for the HDOP
+    data[_HDOP] = ring[(p + 76) & _MASK] | (ring[(p + 77) & _MASK] << 8)
+
+
+def message( kind, payload=b'' ):
+    """ the UBX frame of kind (class << 8 | id) around payload, for the configuration """
+    frame = bytearray(8 + len(payload))
+    frame[0] = 0xB5
+    frame[1] = 0x62
+    frame[2] = kind >> 8
+    frame[3] = kind & 0xFF
+    frame[4] = len(payload) & 0xFF
+    frame[5] = len(payload) >> 8
+    frame[6:6 + len(payload)] = payload
+    a = b = 0
+    for c in frame[2:-2]:
+        a = (a + c) & 0xFF
+        b = (b + a) & 0xFF
+    frame[-2] = a
+    frame[-1] = b
+    return frame
+
+
+class UBX(GPS):
+
+    def __init__( self, uart=None, rx=16, tx=17, baudrate=38400 ):
+        """
+        uart: a machine.UART, by default UART 2 on rx and tx as for GPS
+        """
+        GPS.__init__(self, uart, rx, tx, baudrate)
+        self.baudrate = baudrate
+        self.line = None
+        self.state = array('i', [0] * 12)
+        self.frames = 0     # NAV-PVT frames decoded
+        self.acks = 0       # configuration messages acknowledged
+        self.naks = 0       # and rejected
+
+    @property
+    def errors( self ):
+        """ frames dropped for a bad checksum or length """
+        return self.state[_ERRORS]
+
+    # poll() is GPS.poll, returning the number of NAV-PVT frames decoded
+
+    def scan( self ):
+        """ 1 when the next frame with a good checksum has been scanned """
+        return _scan(self.ring, self.state, RING)
+
+    def parse( self ):
+        """ decodes the frame just scanned, returns 1 for NAV-PVT """
+        state = self.state
+        kind = (state[_CLASS] << 8) | state[_ID]
+        if kind == NAV_PVT and state[_LENGTH] == _PVT:
+            fix = self.fix
+            _pvt(self.ring, state[_PAYLOAD], fix.position, fix.data)
+            fix.data[Fix.TICKS] = utime.ticks_ms()
+            self.frames += 1
+            return 1
+        if kind == ACK_ACK:
+            self.acks += 1
+        elif kind == ACK_NAK:
+            self.naks += 1
+        return 0
+
+    def configure( self, rate=10, baudrate=None, port=1 ):
+        """
+        sets the navigation rate in Hz and UBX only output with NAV-PVT every epoch on port,
+        the receiver UART 1 by default. baudrate switches the receiver and the UART to a new rate,
+        20Hz NAV-PVT needs 20kbit/s. The acknowledgements arrive with the next polls.
+        """
+        if not 1 <= rate <= 25:
+            raise ValueError("rate from 1 to 25Hz")
+        write = self.uart.write
+        # NAV-PVT on every navigation epoch of the port configured
+        write(message(CFG_MSG, bytes((NAV_PVT >> 8, NAV_PVT & 0xFF, 1))))
+        # measurement period in ms, one navigation solution per measurement, aligned to GPS time
+        period = 1000 // rate
+        write(message(CFG_RATE, bytes((period & 0xFF, period >> 8, 1, 0, 1, 0))))
+        # 8N1, UBX and NMEA in, UBX out only
+        speed = baudrate or self.baudrate
+        write(message(CFG_PRT, bytes((port, 0, 0, 0, 0xD0, 0x08, 0, 0,
+            speed & 0xFF, (speed >> 8) & 0xFF, (speed >> 16) & 0xFF, speed >> 24,
+            0x03, 0, 0x01, 0, 0, 0, 0, 0))))
+        if speed != self.baudrate:
+            # let CFG-PRT leave the transmitter before the UART follows the receiver
+            utime.sleep_ms(28 * 10000 // self.baudrate + 2)
+            self.uart.init(baudrate=speed)
+            self.baudrate = speed
@@ -0,0 +1,161 @@
+"""
+Online gyro bias estimation with stillness detection
+
+The boat is still when, over a sliding window, the accel magnitude and the raw
+gyro readings barely vary. The spread does not depend on the bias, so a gyro
+with any zero rate offset is found still. The mean of the first still window
+seeds the bias. After that the bias corrected rate must also have stayed below
+gyroRate for the whole window, which keeps a slow steady turn on flat water
+from being learned as bias, and an exponential filter pulls the estimate
+towards the readings. A boat found still for patience samples with the rate
+away from the bias seeds it anew. Every sample is corrected in place, so there is no
+blocking calibration at start up.
+With a fusion.gyrotemp.GyroTemperature table and the die temperature the bias
+is learned and applied per temperature, so it follows the enclosure warming up.
+"""
+import micropython
+from array import array
+from math import sqrt, radians
+
+
+class GyroBias(object):
+    """
+    window: samples in the sliding window, 100 is 1 sec at 100Hz
+    accelDeviation: the largest standard deviation of the accel magnitude counted as still, in g
+    gyroDeviation: the largest standard deviation of the gyro rate counted as still, in radians per second
+    gyroRate: the largest bias corrected gyro rate counted as still once the bias is known, in radians per second
+    alpha: exponential filter weight of each still sample
+    patience: still samples with the rate away from the bias before it is seeded anew
+    """
+
+    def __init__( self, window=100, accelDeviation=0.02, gyroDeviation=radians(0.5), gyroRate=radians(2),
+                  alpha=0.01, patience=3000 ):
+        self.window = window
+        self.accelVariance = accelDeviation * accelDeviation
+        self.gyroVariance = gyroDeviation * gyroDeviation
+        self.gyroRate2 = gyroRate * gyroRate
+        self.alpha = alpha
+        self.patience = patience
+        self.norms = array('f', [0.0] * window)   # accel magnitude - 1g, ring buffer
+        self.rates = array('f', [0.0] * (3 * window))  # raw gyro x, y, z, ring buffer
+        self.index = 0
+        self.filled = 0
+        self.sum = 0.0
+        self.sumsq = 0.0
+        self.rateSum = array('f', [0.0, 0.0, 0.0])
+        self.rateSumsq = 0.0
+        self.quiet = 0                              # consecutive samples with a small bias corrected rate
+        self.away = 0                               # still samples while the rate was away from the bias
+        self.seeded = False                         # the bias was learned from a still window
+        self.still = False
+        self.bias = array('f', [0.0, 0.0, 0.0])     # radians per second
+        self.table = None                           # optional GyroTemperature
+        self.t = None                               # die temperature in degrees C, None until known
+
+    def temperature( self, t ):
+        """ sets the die temperature in degrees C, the bias follows the table when there is one """
+        self.t = t
+        if self.table is not None:
+            self.table.locate(t)
+            self.table.lookup(self.bias)
+            if not self.seeded and max(self.table.weight) > 0:
+                self.seeded = True  # restored from the store
+
+    @micropython.native
+    def update( self, v ):
+        """
+        v: sample ax, ay, az in g, gx, gy, gz in radians per second
+        learns the bias while still and subtracts it from v[3:6] in place
+        """
+        ax = v[0]
+        ay = v[1]
+        az = v[2]
+        rx = v[3]
+        ry = v[4]
+        rz = v[5]
+
+        # sliding windows of the accel magnitude, offset by 1g to keep the float32 sums small, and of the gyro
+        n = sqrt(ax * ax + ay * ay + az * az) - 1.0
+        window = self.window
+        i = self.index
+        rates = self.rates
+        rateSum = self.rateSum
+        j = 3 * i
+        if self.filled < window:
+            self.filled += 1
+        else:
+            old = self.norms[i]
+            self.sum -= old
+            self.sumsq -= old * old
+            ox = rates[j]
+            oy = rates[j + 1]
+            oz = rates[j + 2]
+            rateSum[0] -= ox
+            rateSum[1] -= oy
+            rateSum[2] -= oz
+            self.rateSumsq -= ox * ox + oy * oy + oz * oz
+        self.norms[i] = n
+        self.sum += n
+        self.sumsq += n * n
+        rates[j] = rx
+        rates[j + 1] = ry
+        rates[j + 2] = rz
+        rateSum[0] += rx
+        rateSum[1] += ry
+        rateSum[2] += rz
+        self.rateSumsq += rx * rx + ry * ry + rz * rz
+        i += 1
+        if i == window:
+            i = 0
+        self.index = i
+
+        bias = self.bias
+        gx = rx - bias[0]
+        gy = ry - bias[1]
+        gz = rz - bias[2]
+        if gx * gx + gy * gy + gz * gz < self.gyroRate2:
+            self.quiet += 1
+        else:
+            self.quiet = 0
+
+        still = False
+        if self.filled == window:
+            mean = self.sum / window
+            mx = rateSum[0] / window
+            my = rateSum[1] / window
+            mz = rateSum[2] / window
+            still = (self.sumsq / window - mean * mean < self.accelVariance and
+                self.rateSumsq / window - mx * mx - my * my - mz * mz < self.gyroVariance)
+            if still and self.seeded:
+                if self.quiet >= window:
+                    self.away = 0
+                else:
+                    self.away += 1
+                    still = self.away >= self.patience
+                    if still:
+                        self.seeded = False
+            if still and not self.seeded:
+                # the first still window, or one that stayed away: the mean is the bias
+                self.seeded = True
+                self.away = 0
+                self.quiet = window
+                bias[0] = mx
+                bias[1] = my
+                bias[2] = mz
+                if self.table is not None and self.t is not None:
+                    self.table.relearn(mx, my, mz)
+        self.still = still
+
+        if still:
+            if self.table is not None and self.t is not None:
+                self.table.learn(rx, ry, rz)
+                self.table.lookup(bias)
+            else:
+                alpha = self.alpha
+                bias[0] += alpha * (rx - bias[0])
+                bias[1] += alpha * (ry - bias[1])
+                bias[2] += alpha * (rz - bias[2])
+
+        v[3] = rx - bias[0]
+        v[4] = ry - bias[1]
+        v[5] = rz - bias[2]
@@ -0,0 +1,97 @@
+"""
+Gyro bias as a function of the die temperature
+
+A table of the bias in temperature bins step degrees wide. GyroBias feeds it
+the gyro readings while the boat is still, each bin keeps the running mean of
+the readings taken at its temperatures, which is the bias at the bin centre
+when the temperature sweeps through the bin. After memory samples the mean turns
+into an exponential average, so the table keeps up with ageing.
+The bias is interpolated linearly between the bin centres. The temperature moves
+slowly and is set at most once per second, the cell and weights are kept between
+calls, so the lookup is two multiply adds per axis.
+Bins that were never learned take the value of the nearest learned bin when
+the temperature first reaches them, so a warming enclosure starts from the
+last known bias rather than from zero.
+"""
+from array import array
+
+
+class GyroTemperature(object):
+    """
+    low, high: temperature range of the table in degrees C, the centres of the end bins
+    step: degrees C between the bin centres
+    memory: samples in the running mean of a bin before it turns into an exponential average
+    """
+
+    def __init__( self, low=-10.0, high=70.0, step=5.0, memory=6000 ):
+        self.low = low
+        self.step = step
+        self.memory = memory
+        self.nodes = int((high - low) / step) + 1
+        self.table = array('f', [0.0] * (3 * self.nodes))  # bias x, y, z per bin centre, radians per second
+        self.weight = array('f', [0.0] * self.nodes)       # samples in the mean of each bin, 0 never learned
+        self.k = 0      # cell of the current temperature, between node k and k + 1
+        self.f = 0.0    # position in the cell, 0 at node k
+        self.dirty = False
+
+    def locate( self, t ):
+        """ moves to temperature t in degrees C """
+        u = min(max((t - self.low) / self.step, 0.0), self.nodes - 1.0)
+        k = min(int(u), self.nodes - 2)
+        self.k = k
+        self.f = u - k
+        if self.weight[k] == 0 or self.weight[k + 1] == 0:
+            self.seed(k)
+            self.seed(k + 1)
+
+    def seed( self, k ):
+        """ copies the nearest learned node into node k when it was never learned """
+        if self.weight[k] != 0:
+            return
+        for d in range(1, self.nodes):
+            for n in (k - d, k + d):
+                if 0 <= n < self.nodes and self.weight[n] != 0:
+                    table = self.table
+                    table[3 * k + 0] = table[3 * n + 0]
+                    table[3 * k + 1] = table[3 * n + 1]
+                    table[3 * k + 2] = table[3 * n + 2]
+                    return
+
+    def lookup( self, bias ):
+        """ writes the bias at the current temperature into bias[0:3] """
+        table = self.table
+        i = 3 * self.k
+        f = self.f
+        g = 1.0 - f
+        bias[0] = g * table[i + 0] + f * table[i + 3]
+        bias[1] = g * table[i + 1] + f * table[i + 4]
+        bias[2] = g * table[i + 2] + f * table[i + 5]
+
+    def learn( self, gx, gy, gz ):
+        """ adds a gyro reading taken while still to the bin of the current temperature """
+        k = self.k if self.f < 0.5 else self.k + 1
+        n = min(self.weight[k] + 1, self.memory)
+        self.weight[k] = n
+        a = 1.0 / n
+        table = self.table
+        i = 3 * k
+        table[i + 0] += a * (gx - table[i + 0])
+        table[i + 1] += a * (gy - table[i + 1])
+        table[i + 2] += a * (gz - table[i + 2])
+        self.dirty = True
+
+    def relearn( self, gx, gy, gz ):
+        """ starts the bin of the current temperature over from a reading, when the bias moved away from it """
+        self.weight[self.k if self.f < 0.5 else self.k + 1] = 0
+        self.learn(gx, gy, gz)
+
+    def dump( self ):
+        """ the table for the store """
+        return (self.low, self.step, list(self.table), list(self.weight))
+
+    def restore( self, data ):
+        """ loads a dump, ignored when the layout does not match """
+        low, step, table, weight = data
+        if low == self.low and step == self.step and len(weight) == self.nodes:
+            self.table = array('f', table)
+            self.weight = array('f', weight)
@@ -0,0 +1,243 @@
+"""
+Allocation free Madgwick update kernels
+
+The state lives in preallocated array('f') buffers owned by the caller
+    q: quaternion w, x, y, z, updated in place
+    v: sample ax, ay, az, gx, gy, gz, mx, my, mz with the gyro in radians per second
+Nothing is returned and no tuples, lists or generators are built, so the
+only heap traffic left is the boxing of intermediate floats on ports
+without an unboxed float object representation.
+"""
+import micropython
+from math import sqrt, radians
+
+
+class Madgwick(object):
+    """
+    Madgwick gradient descent fusion engine with a scheduled gain
+    beta: steady state filter gain, sqrt(3/4) times the gyro measurement error in radians per second.
+        A 10 degrees per second error keeps the attitude quiet on calm water
+    betaHigh: gain while converging after a reset and after a disturbance,
+        a 90 degrees per second error converges in well under a second
+    converge: seconds of betaHigh after a reset
+    hold: seconds over which the gain decays back to beta after a disturbance
+    boost: accel norm deviation from 1g in g that counts as a disturbance
+    reject: accel norm deviation from 1g in g beyond which the accel is not
+        a gravity reference, the sample is integrated from the gyro alone
+    A fixed gain is betaHigh = beta
+    """
+
+    def __init__( self, beta=sqrt(3.0 / 4.0) * radians(10), betaHigh=sqrt(3.0 / 4.0) * radians(90),
+                  converge=2.0, hold=1.0, boost=0.1, reject=0.3 ):
+        self.beta = beta
+        self.betaHigh = betaHigh
+        self.converge = converge
+        self.hold = hold
+        self.boost = boost
+        self.reject = reject
+        self.rejected = 0
+        self.reset()
+
+    def reset( self ):
+        self.remaining = self.converge # seconds of boosted gain left
+
+    def gain( self, v, dt ):
+        """ the gain for sample v, 0 when its accel is rejected """
+        deviation = abs(sqrt(v[0] * v[0] + v[1] * v[1] + v[2] * v[2]) - 1.0)
+        if deviation > self.boost and self.remaining < self.hold:
+            self.remaining = self.hold
+        if deviation > self.reject:
+            self.rejected += 1
+            return 0.0
+        if self.remaining <= 0:
+            return self.beta
+        self.remaining -= dt
+        return self.beta + (self.betaHigh - self.beta) * min(1.0, max(0.0, self.remaining) / self.hold)
+
+    def update( self, q, v, dt ):
+        update(q, v, self.gain(v, dt), dt)
+
+    def updateIMU( self, q, v, dt ):
+        updateIMU(q, v, self.gain(v, dt), dt)
+
+
+@micropython.native
+def update( q, v, beta, dt ):
+    """ 9-DOF update with the magnetometer correction """
+    q1 = q[0]
+    q2 = q[1]
+    q3 = q[2]
+    q4 = q[3]
+    ax = v[0]
+    ay = v[1]
+    az = v[2]
+    gx = v[3]
+    gy = v[4]
+    gz = v[5]
+    mx = v[6]
+    my = v[7]
+    mz = v[8]
+
+    # Normalise accelerometer measurement
+    norm = sqrt(ax * ax + ay * ay + az * az)
+    if norm == 0:
+        return
+    norm = 1 / norm
+    ax *= norm
+    ay *= norm
+    az *= norm
+
+    # Normalise magnetometer measurement
+    norm = sqrt(mx * mx + my * my + mz * mz)
+    if norm == 0:
+        return
+    norm = 1 / norm
+    mx *= norm
+    my *= norm
+    mz *= norm
+
+    # Auxiliary variables to avoid repeated arithmetic
+    _2q1 = 2 * q1
+    _2q2 = 2 * q2
+    _2q3 = 2 * q3
+    _2q4 = 2 * q4
+    _2q1q3 = 2 * q1 * q3
+    _2q3q4 = 2 * q3 * q4
+    q1q1 = q1 * q1
+    q1q2 = q1 * q2
+    q1q3 = q1 * q3
+    q1q4 = q1 * q4
+    q2q2 = q2 * q2
+    q2q3 = q2 * q3
+    q2q4 = q2 * q4
+    q3q3 = q3 * q3
+    q3q4 = q3 * q4
+    q4q4 = q4 * q4
+
+    # Reference direction of Earth's magnetic field
+    _2q1mx = 2 * q1 * mx
+    _2q1my = 2 * q1 * my
+    _2q1mz = 2 * q1 * mz
+    _2q2mx = 2 * q2 * mx
+    hx = mx * q1q1 - _2q1my * q4 + _2q1mz * q3 + mx * q2q2 + _2q2 * my * q3 + _2q2 * mz * q4 - mx * q3q3 - mx * q4q4
+    hy = _2q1mx * q4 + my * q1q1 - _2q1mz * q2 + _2q2mx * q3 - my * q2q2 + my * q3q3 + _2q3 * mz * q4 - my * q4q4
+    _2bx = sqrt(hx * hx + hy * hy)
+    _2bz = -_2q1mx * q3 + _2q1my * q2 + mz * q1q1 + _2q2mx * q4 - mz * q2q2 + _2q3 * my * q4 - mz * q3q3 + mz * q4q4
+    _4bx = 2 * _2bx
+    _4bz = 2 * _2bz
+
+    # Shared error terms of the objective function
+    fx = 2 * q2q4 - _2q1q3 - ax
+    fy = 2 * q1q2 + _2q3q4 - ay
+    fz = 1 - 2 * q2q2 - 2 * q3q3 - az
+    bx = _2bx * (0.5 - q3q3 - q4q4) + _2bz * (q2q4 - q1q3) - mx
+    by = _2bx * (q2q3 - q1q4) + _2bz * (q1q2 + q3q4) - my
+    bz = _2bx * (q1q3 + q2q4) + _2bz * (0.5 - q2q2 - q3q3) - mz
+
+    # Gradient descent algorithm corrective step
+    s1 = -_2q3 * fx + _2q2 * fy - _2bz * q3 * bx + (-_2bx * q4 + _2bz * q2) * by + _2bx * q3 * bz
+    s2 = _2q4 * fx + _2q1 * fy - 4 * q2 * fz + _2bz * q4 * bx + (_2bx * q3 + _2bz * q1) * by + (_2bx * q4 - _4bz * q2) * bz
+    s3 = -_2q1 * fx + _2q4 * fy - 4 * q3 * fz + (-_4bx * q3 - _2bz * q1) * bx + (_2bx * q2 + _2bz * q4) * by + (_2bx * q1 - _4bz * q3) * bz
+    s4 = _2q2 * fx + _2q3 * fy + (-_4bx * q4 + _2bz * q2) * bx + (-_2bx * q1 + _2bz * q3) * by + _2bx * q2 * bz
+
+    # normalise step magnitude, a zero step means we are already at the minimum
+    norm = sqrt(s1 * s1 + s2 * s2 + s3 * s3 + s4 * s4)
+    if norm != 0:
+        norm = beta / norm
+    s1 *= norm
+    s2 *= norm
+    s3 *= norm
+    s4 *= norm
+
+    # Compute rate of change of quaternion
+    qDot1 = 0.5 * (-q2 * gx - q3 * gy - q4 * gz) - s1
+    qDot2 = 0.5 * (q1 * gx + q3 * gz - q4 * gy) - s2
+    qDot3 = 0.5 * (q1 * gy - q2 * gz + q4 * gx) - s3
+    qDot4 = 0.5 * (q1 * gz + q2 * gy - q3 * gx) - s4
+
+    # Integrate to yield quaternion
+    q1 += qDot1 * dt
+    q2 += qDot2 * dt
+    q3 += qDot3 * dt
+    q4 += qDot4 * dt
+
+    # normalise quaternion
+    norm = 1 / sqrt(q1 * q1 + q2 * q2 + q3 * q3 + q4 * q4)
+    q[0] = q1 * norm
+    q[1] = q2 * norm
+    q[2] = q3 * norm
+    q[3] = q4 * norm
+
+
+@micropython.native
+def updateIMU( q, v, beta, dt ):
+    """ 6-DOF update without the magnetometer correction """
+    q1 = q[0]
+    q2 = q[1]
+    q3 = q[2]
+    q4 = q[3]
+    ax = v[0]
+    ay = v[1]
+    az = v[2]
+    gx = v[3]
+    gy = v[4]
+    gz = v[5]
+
+    # Normalise accelerometer measurement
+    norm = sqrt(ax * ax + ay * ay + az * az)
+    if norm == 0:
+        return
+    norm = 1 / norm
+    ax *= norm
+    ay *= norm
+    az *= norm
+
+    # Auxiliary variables to avoid repeated arithmetic
+    _2q1 = 2 * q1
+    _2q2 = 2 * q2
+    _2q3 = 2 * q3
+    _2q4 = 2 * q4
+    _4q1 = 4 * q1
+    _4q2 = 4 * q2
+    _4q3 = 4 * q3
+    _8q2 = 8 * q2
+    _8q3 = 8 * q3
+    q1q1 = q1 * q1
+    q2q2 = q2 * q2
+    q3q3 = q3 * q3
+    q4q4 = q4 * q4
+
+    # Gradient descent algorithm corrective step
+    s1 = _4q1 * q3q3 + _2q3 * ax + _4q1 * q2q2 - _2q2 * ay
+    s2 = _4q2 * q4q4 - _2q4 * ax + 4 * q1q1 * q2 - _2q1 * ay - _4q2 + _8q2 * q2q2 + _8q2 * q3q3 + _4q2 * az
+    s3 = 4 * q1q1 * q3 + _2q1 * ax + _4q3 * q4q4 - _2q4 * ay - _4q3 + _8q3 * q2q2 + _8q3 * q3q3 + _4q3 * az
+    s4 = 4 * q2q2 * q4 - _2q2 * ax + 4 * q3q3 * q4 - _2q3 * ay
+
+    # normalise step magnitude, a zero step means we are already at the minimum
+    norm = sqrt(s1 * s1 + s2 * s2 + s3 * s3 + s4 * s4)
+    if norm != 0:
+        norm = beta / norm
+    s1 *= norm
+    s2 *= norm
+    s3 *= norm
+    s4 *= norm
+
+    # Compute rate of change of quaternion
+    qDot1 = 0.5 * (-q2 * gx - q3 * gy - q4 * gz) - s1
+    qDot2 = 0.5 * (q1 * gx + q3 * gz - q4 * gy) - s2
+    qDot3 = 0.5 * (q1 * gy - q2 * gz + q4 * gx) - s3
+    qDot4 = 0.5 * (q1 * gz + q2 * gy - q3 * gx) - s4
+
+    # Integrate to yield quaternion
+    q1 += qDot1 * dt
+    q2 += qDot2 * dt
+    q3 += qDot3 * dt
+    q4 += qDot4 * dt
+
+    # normalise quaternion
+    norm = 1 / sqrt(q1 * q1 + q2 * q2 + q3 * q3 + q4 * q4)
+    q[0] = q1 * norm
+    q[1] = q2 * norm
+    q[2] = q3 * norm
+    q[3] = q4 * norm
+
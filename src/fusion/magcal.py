@@ -0,0 +1,162 @@
+"""
+Streaming least squares ellipsoid fit for the magnetometer calibration
+
+The samples are fitted to the general quadric
+    a x^2 + b y^2 + c z^2 + 2f yz + 2g xz + 2h xy + 2p x + 2q y + 2r z = 1
+Only the sums of the normal equations are kept, 45 for the symmetric 9x9
+matrix and 9 for the right hand side, so memory does not grow with the
+number of samples. solve() returns the hard iron offset and the soft iron
+matrix that maps the ellipsoid back onto a sphere
+    corrected = matrix * (raw - offset)
+"""
+import micropython
+from array import array
+from math import sqrt
+
+
+class EllipsoidFit(object):
+
+    def __init__( self ):
+        self.sums = array('f', [0.0] * 54)  # upper triangle of D'D row by row, then D'1
+        self.row = array('f', [0.0] * 9)
+        self.count = 0
+        self.scale = 0.0                    # samples are scaled to about unit size for the float32 sums
+
+    @micropython.native
+    def add( self, x, y, z ):
+        """ accumulates one sample """
+        if self.scale == 0.0:
+            norm = sqrt(x * x + y * y + z * z)
+            if norm == 0:
+                return
+            self.scale = 1 / norm
+        s = self.scale
+        x *= s
+        y *= s
+        z *= s
+
+        r = self.row
+        r[0] = x * x
+        r[1] = y * y
+        r[2] = z * z
+        r[3] = 2 * y * z
+        r[4] = 2 * x * z
+        r[5] = 2 * x * y
+        r[6] = 2 * x
+        r[7] = 2 * y
+        r[8] = 2 * z
+
+        sums = self.sums
+        k = 0
+        for i in range(9):
+            ri = r[i]
+            for j in range(i, 9):
+                sums[k] += ri * r[j]
+                k += 1
+            sums[45 + i] += ri
+        self.count += 1
+
+    def solve( self ):
+        """
+        returns offset (x,y,z) and matrix, a 3x3 tuple of rows
+        raises ValueError when the samples do not describe an ellipsoid,
+        rotate the sensor through all orientations while sampling
+        """
+        if self.count < 9:
+            raise ValueError("not enough samples")
+
+        # the augmented 9x10 normal equations from the upper triangle
+        m = [[0.0] * 10 for _ in range(9)]
+        k = 0
+        for i in range(9):
+            for j in range(i, 9):
+                m[i][j] = m[j][i] = self.sums[k]
+                k += 1
+            m[i][9] = self.sums[45 + i]
+        a, b, c, f, g, h, p, q, r = _gauss(m)
+
+        A = [[a, h, g], [h, b, f], [g, f, c]]
+        Ai = _inverse3(A)
+        v = (p, q, r)
+
+        # centre = -A^-1 v, the quadric about the centre is y' A y = 1 + v' A^-1 v
+        centre = [-(Ai[i][0] * p + Ai[i][1] * q + Ai[i][2] * r) for i in range(3)]
+        # k is negative when the origin lies outside the ellipsoid, M stays positive definite
+        k = 1 + sum(v[i] * Ai[i][j] * v[j] for i in range(3) for j in range(3))
+        if k == 0:
+            raise ValueError("not an ellipsoid")
+        M = [[A[i][j] / k for j in range(3)] for i in range(3)]
+
+        values, vectors = _jacobi(M)
+        if min(values) <= 0:
+            raise ValueError("not an ellipsoid")
+
+        # matrix square root of M, scaled so the corrected field keeps the mean radius
+        radius = (values[0] * values[1] * values[2]) ** (-1 / 6)
+        roots = [sqrt(x) * radius for x in values]
+        W = tuple(tuple(sum(vectors[i][n] * roots[n] * vectors[j][n] for n in range(3)) for j in range(3)) for i in range(3))
+
+        s = self.scale
+        offset = (centre[0] / s, centre[1] / s, centre[2] / s)
+        return offset, W
+
+
+def _gauss( m ):
+    """ solves the augmented matrix m in place by elimination with partial pivoting """
+    n = len(m)
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda row: abs(m[row][col]))
+        if m[pivot][col] == 0:
+            raise ValueError("singular, not enough distinct samples")
+        m[col], m[pivot] = m[pivot], m[col]
+        for row in range(col + 1, n):
+            factor = m[row][col] / m[col][col]
+            for j in range(col, n + 1):
+                m[row][j] -= factor * m[col][j]
+    x = [0.0] * n
+    for row in range(n - 1, -1, -1):
+        x[row] = (m[row][n] - sum(m[row][j] * x[j] for j in range(row + 1, n))) / m[row][row]
+    return x
+
+
+def _inverse3( A ):
+    (a, b, c), (d, e, f), (g, h, i) = A
+    det = a * (e * i - f * h) - b * (d * i - f * g) + c * (d * h - e * g)
+    if det == 0:
+        raise ValueError("not an ellipsoid")
+    return [[(e * i - f * h) / det, (c * h - b * i) / det, (b * f - c * e) / det],
+            [(f * g - d * i) / det, (a * i - c * g) / det, (c * d - a * f) / det],
+            [(d * h - e * g) / det, (b * g - a * h) / det, (a * e - b * d) / det]]
+
+
+def _jacobi( S, sweeps=20 ):
+    """ eigen values and vectors (columns) of the symmetric 3x3 matrix S """
+    a = [row[:] for row in S]
+    v = [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]]
+    for _ in range(sweeps):
+        off = a[0][1] * a[0][1] + a[0][2] * a[0][2] + a[1][2] * a[1][2]
+        if off < 1e-20:
+            break
+        for p, q in ((0, 1), (0, 2), (1, 2)):
+            if a[p][q] == 0:
+                continue
+            theta = (a[q][q] - a[p][p]) / (2 * a[p][q])
+            t = (1 if theta >= 0 else -1) / (abs(theta) + sqrt(theta * theta + 1))
+            c = 1 / sqrt(t * t + 1)
+            s = t * c
+            for k in range(3):
+                akp = a[k][p]
+                akq = a[k][q]
+                a[k][p] = c * akp - s * akq
+                a[k][q] = s * akp + c * akq
+            for k in range(3):
+                apk = a[p][k]
+                aqk = a[q][k]
+                a[p][k] = c * apk - s * aqk
+                a[q][k] = s * apk + c * aqk
+            for k in range(3):
+                vkp = v[k][p]
+                vkq = v[k][q]
+                v[k][p] = c * vkp - s * vkq
+                v[k][q] = s * vkp + c * vkq
+    return [a[0][0], a[1][1], a[2][2]], v
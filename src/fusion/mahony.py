@@ -0,0 +1,201 @@
+"""
+Mahony complementary filter fusion engine
+
+Cheaper per step than Madgwick: a cross product error between the measured
+and the estimated gravity and magnetic field directions drives a PI
+correction of the gyro rates. The integral term estimates the gyro bias.
+Same interface and array('f') state as fusion.madgwick.Madgwick
+    q: quaternion w, x, y, z, updated in place
+    v: sample ax, ay, az, gx, gy, gz, mx, my, mz with the gyro in radians per second
+"""
+import micropython
+from array import array
+from math import sqrt
+
+
+class Mahony(object):
+    """
+    kp: proportional gain, how fast the accel and mag pull the attitude
+    ki: integral gain, how fast the gyro bias is learned, 0 disables it
+    """
+
+    def __init__( self, kp=1.0, ki=0.1 ):
+        self.kp = kp
+        self.ki = ki
+        self.integral = array('f', [0.0, 0.0, 0.0])   # gyro bias correction, radians per second
+
+    def reset( self ):
+        self.integral[0] = 0.0
+        self.integral[1] = 0.0
+        self.integral[2] = 0.0
+
+    @micropython.native
+    def update( self, q, v, dt ):
+        """ 9-DOF update with the magnetometer correction """
+        q0 = q[0]
+        q1 = q[1]
+        q2 = q[2]
+        q3 = q[3]
+        ax = v[0]
+        ay = v[1]
+        az = v[2]
+        gx = v[3]
+        gy = v[4]
+        gz = v[5]
+        mx = v[6]
+        my = v[7]
+        mz = v[8]
+
+        # Normalise accelerometer measurement
+        norm = sqrt(ax * ax + ay * ay + az * az)
+        if norm == 0:
+            return
+        norm = 1 / norm
+        ax *= norm
+        ay *= norm
+        az *= norm
+
+        # Normalise magnetometer measurement
+        norm = sqrt(mx * mx + my * my + mz * mz)
+        if norm == 0:
+            return
+        norm = 1 / norm
+        mx *= norm
+        my *= norm
+        mz *= norm
+
+        # Auxiliary variables to avoid repeated arithmetic
+        q0q0 = q0 * q0
+        q0q1 = q0 * q1
+        q0q2 = q0 * q2
+        q0q3 = q0 * q3
+        q1q1 = q1 * q1
+        q1q2 = q1 * q2
+        q1q3 = q1 * q3
+        q2q2 = q2 * q2
+        q2q3 = q2 * q3
+        q3q3 = q3 * q3
+
+        # Reference direction of Earth's magnetic field
+        hx = 2 * (mx * (0.5 - q2q2 - q3q3) + my * (q1q2 - q0q3) + mz * (q1q3 + q0q2))
+        hy = 2 * (mx * (q1q2 + q0q3) + my * (0.5 - q1q1 - q3q3) + mz * (q2q3 - q0q1))
+        bx = sqrt(hx * hx + hy * hy)
+        bz = 2 * (mx * (q1q3 - q0q2) + my * (q2q3 + q0q1) + mz * (0.5 - q1q1 - q2q2))
+
+        # Estimated direction of gravity and magnetic field, halved
+        vx = q1q3 - q0q2
+        vy = q0q1 + q2q3
+        vz = q0q0 - 0.5 + q3q3
+        wx = bx * (0.5 - q2q2 - q3q3) + bz * (q1q3 - q0q2)
+        wy = bx * (q1q2 - q0q3) + bz * (q0q1 + q2q3)
+        wz = bx * (q0q2 + q1q3) + bz * (0.5 - q1q1 - q2q2)
+
+        # Error is the cross product between estimated and measured directions, halved
+        ex = (ay * vz - az * vy) + (my * wz - mz * wy)
+        ey = (az * vx - ax * vz) + (mz * wx - mx * wz)
+        ez = (ax * vy - ay * vx) + (mx * wy - my * wx)
+
+        # Integral feedback, learns the negated gyro bias
+        integral = self.integral
+        if self.ki > 0:
+            ki = 2 * self.ki * dt
+            integral[0] += ki * ex
+            integral[1] += ki * ey
+            integral[2] += ki * ez
+            gx += integral[0]
+            gy += integral[1]
+            gz += integral[2]
+
+        # Proportional feedback
+        kp = 2 * self.kp
+        gx += kp * ex
+        gy += kp * ey
+        gz += kp * ez
+
+        # Integrate rate of change of quaternion
+        gx *= 0.5 * dt
+        gy *= 0.5 * dt
+        gz *= 0.5 * dt
+        qa = q0
+        qb = q1
+        qc = q2
+        q0 += -qb * gx - qc * gy - q3 * gz
+        q1 += qa * gx + qc * gz - q3 * gy
+        q2 += qa * gy - qb * gz + q3 * gx
+        q3 += qa * gz + qb * gy - qc * gx
+
+        # normalise quaternion
+        norm = 1 / sqrt(q0 * q0 + q1 * q1 + q2 * q2 + q3 * q3)
+        q[0] = q0 * norm
+        q[1] = q1 * norm
+        q[2] = q2 * norm
+        q[3] = q3 * norm
+
+    @micropython.native
+    def updateIMU( self, q, v, dt ):
+        """ 6-DOF update without the magnetometer correction """
+        q0 = q[0]
+        q1 = q[1]
+        q2 = q[2]
+        q3 = q[3]
+        ax = v[0]
+        ay = v[1]
+        az = v[2]
+        gx = v[3]
+        gy = v[4]
+        gz = v[5]
+
+        # Normalise accelerometer measurement
+        norm = sqrt(ax * ax + ay * ay + az * az)
+        if norm == 0:
+            return
+        norm = 1 / norm
+        ax *= norm
+        ay *= norm
+        az *= norm
+
+        # Estimated direction of gravity, halved
+        vx = q1 * q3 - q0 * q2
+        vy = q0 * q1 + q2 * q3
+        vz = q0 * q0 - 0.5 + q3 * q3
+
+        # Error is the cross product between estimated and measured gravity, halved
+        ex = ay * vz - az * vy
+        ey = az * vx - ax * vz
+        ez = ax * vy - ay * vx
+
+        # Integral feedback, learns the negated gyro bias
+        integral = self.integral
+        if self.ki > 0:
+            ki = 2 * self.ki * dt
+            integral[0] += ki * ex
+            integral[1] += ki * ey
+            integral[2] += ki * ez
+            gx += integral[0]
+            gy += integral[1]
+            gz += integral[2]
+
+        # Proportional feedback
+        kp = 2 * self.kp
+        gx += kp * ex
+        gy += kp * ey
+        gz += kp * ez
+
+        # Integrate rate of change of quaternion
+        gx *= 0.5 * dt
+        gy *= 0.5 * dt
+        gz *= 0.5 * dt
+        qa = q0
+        qb = q1
+        qc = q2
+        q0 += -qb * gx - qc * gy - q3 * gz
+        q1 += qa * gx + qc * gz - q3 * gy
+        q2 += qa * gy - qb * gz + q3 * gx
+        q3 += qa * gz + qb * gy - qc * gx
+
+        # normalise quaternion
+        norm = 1 / sqrt(q0 * q0 + q1 * q1 + q2 * q2 + q3 * q3)
+        q[0] = q0 * norm
+        q[1] = q1 * norm
+        q[2] = q2 * norm
+        q[3] = q3 * norm
@@ -2,17 +2,47 @@
 #import networking.blue
 
 import uasyncio as asyncio
-from drivers.i2c import i2c
+from drivers.bus import Bus
 from drivers.ahrs import AHRS
+from drivers.gps import GPS
+from control.heading import Heading
+from networking.telemetry import Telemetry
+from system.scheduler import Scheduler
 from store.ahrs import magbias
 print("RoboBuoy V0.0 Dev")
 
-ahrs = AHRS(i2c=i2c)
+bus = Bus()
+bus.register(0x69, 'MPU9250')
+bus.register(0x0C, 'AK8963')
+bus.register(0x75, 'IP5306')
+
+ahrs = AHRS(i2c=bus)
+ahrs.telemetry = Telemetry(decimate=10)
+ahrs.telemetry.timing = ahrs.timing   # loop timing frames, see system.timing
 
 #ahrs.dofusion()
 
+gps = GPS()  # or drivers.ubx.UBX() and gps.configure(rate=20) on a u-blox M8 or later
+
+def position():
+    """ reads the GPS, the declination follows the position """
+    if gps.poll() and gps.fix.valid:
+        ahrs.locate(gps.fix.lat, gps.fix.lon)
+
+# the rudder angle for the thruster mixer, idle until pilot.course is set
+pilot = Heading(ahrs, rate=50)
+
+# fixed rate tasks, the faster the higher the priority. Navigation at 5Hz
+# and telemetry at 1Hz join here as they arrive
+scheduler = Scheduler()
+scheduler.add(ahrs.fusionStep, 200, 'fusion')
+scheduler.add(pilot.step, 50, 'control')
+scheduler.add(position, 10, 'gps')
+
 async def main():
-    asyncio.create_task(ahrs.fusionTask())
+    asyncio.create_task(scheduler.run())
+    asyncio.create_task(ahrs.storeTask())
+    asyncio.create_task(bus.task())
     
     await asyncio.sleep_ms(20000)
 
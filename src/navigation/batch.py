@@ -0,0 +1,54 @@
+"""
+NumPy distance and bearing over waypoint arrays for the host tools
+
+The functions of navigation.route over arrays of latitude, longitude pairs
+in degrees (..., 2), in float64 and returning new arrays of metres and
+degrees. The formulas and the sphere are the same, tools/navigation/route.py
+holds both to them. Not for the device, it needs NumPy.
+
+    from navigation import batch
+    distance, bearing = batch.legs(route)               # (N, 2) -> (N - 1,), (N - 1,)
+    distance, bearing = batch.pairs(route, fence)       # (N, 2), (M, 2) -> (N, M), (N, M)
+"""
+import numpy as np
+
+R = 6371008.8       # mean earth radius, metres, as navigation.route
+
+
+def prepare( points ):
+    """ lat, lon degrees, sin(lat) and cos(lat) of the points, each shaped like points[..., 0] """
+    points = np.asarray(points, dtype=np.float64)
+    lat = points[..., 0]
+    return lat, points[..., 1], np.sin(np.radians(lat)), np.cos(np.radians(lat))
+
+
+def _leg( a, b ):
+    """ distance and bearing from the prepared points a to b, broadcasting """
+    lat1, lon1, s1, c1 = a
+    lat2, lon2, s2, c2 = b
+    dlon = np.radians(lon2 - lon1)
+    sd = np.sin(dlon)
+    cd = np.cos(dlon)
+    y = sd * c2
+    x = np.sin(np.radians(lat2 - lat1)) + s1 * c2 * (1 - cd)
+    z = s1 * s2 + c1 * c2 * cd
+    distance = np.arctan2(np.hypot(y, x), z) * R
+    return distance, np.degrees(np.arctan2(y, x)) % 360
+
+
+def fromPoint( origin, points ):
+    """ from the lat, lon pair origin to every point """
+    return _leg(prepare(origin), prepare(points))
+
+
+def legs( points ):
+    """ along the route, leg k from point k to point k + 1 """
+    lat, lon, s, c = prepare(points)
+    return _leg((lat[:-1], lon[:-1], s[:-1], c[:-1]), (lat[1:], lon[1:], s[1:], c[1:]))
+
+
+def pairs( points, others=None ):
+    """ from every point i to every point j of others, or of points, as (N, M) matrices """
+    a = prepare(points)
+    b = a if others is None else prepare(others)
+    return _leg([t[:, None] for t in a], [t[None, :] for t in b])
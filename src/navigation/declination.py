@@ -0,0 +1,104 @@
+"""
+Magnetic declination from a precomputed grid on flash
+
+The table is written by tools/declination/wmmgrid.py from the World Magnetic Model
+    0   magic       b'DECL'
+    4   version     uint16
+    6   rows, cols  uint16, latitudes and longitudes in the grid
+    10  padding
+    12  lat0, lon0  float32 degrees, the south west corner
+    20  step        float32 degrees between grid points
+    24  epoch       float32 decimal year the model was evaluated for
+    28  grid        rows x cols int16 centidegrees, row major from lat0 north, east positive
+Only the four corners of the cell the boat is in are kept in RAM. They are read
+again when the boat crosses into another cell, in between a lookup is a bilinear
+interpolation without any trigonometry.
+"""
+from array import array
+from struct import unpack, unpack_from
+
+MAGIC = b'DECL'
+VERSION = 1
+HEADER = '<4sHHHxxffff'
+HEADERSIZE = 28
+
+
+def _unwrap( value, reference ):
+    """ value in centidegrees within 180 degrees of reference """
+    if value - reference > 18000:
+        return value - 36000
+    if value - reference < -18000:
+        return value + 36000
+    return value
+
+
+class Declination(object):
+
+    def __init__( self, filename='declination.bin' ):
+        """ a missing or unreadable table leaves available False and lookup returns None """
+        self.filename = filename
+        self.available = False
+        self.row = -1
+        self.col = -1
+        self.corners = bytearray(4)
+        self.c = array('f', [0, 0, 0, 0]) # bilinear coefficients of the memoised cell
+        try:
+            with open(filename, 'rb') as file:
+                magic, version, self.rows, self.cols, self.lat0, self.lon0, self.step, self.epoch = unpack(
+                    HEADER, file.read(HEADERSIZE))
+        except (OSError, ValueError):
+            return
+        self.available = magic == MAGIC and version == VERSION and self.rows > 1 and self.cols > 1
+        self.wraps = (self.cols - 1) * self.step >= 360 - 1e-3
+
+    def load( self, row, col ):
+        """ reads the corners of a cell and memoises its interpolation coefficients """
+        with open(self.filename, 'rb') as file:
+            file.seek(HEADERSIZE + (row * self.cols + col) * 2)
+            file.readinto(self.corners)
+            sw, se = unpack_from('<hh', self.corners)
+            file.seek(HEADERSIZE + ((row + 1) * self.cols + col) * 2)
+            file.readinto(self.corners)
+            nw, ne = unpack_from('<hh', self.corners)
+
+        # near the magnetic poles a cell can straddle +-180, interpolate the unwrapped values
+        se = _unwrap(se, sw)
+        nw = _unwrap(nw, sw)
+        ne = _unwrap(ne, sw)
+
+        c = self.c
+        c[0] = sw / 100
+        c[1] = (nw - sw) / 100
+        c[2] = (se - sw) / 100
+        c[3] = (ne - nw - se + sw) / 100
+        self.row = row
+        self.col = col
+
+    def lookup( self, lat, lon ):
+        """
+        declination in degrees at lat, lon in degrees, east positive
+        returns None without a table
+        """
+        if not self.available:
+            return None
+
+        u = (lat - self.lat0) / self.step
+        if self.wraps:
+            v = ((lon - self.lon0) % 360) / self.step
+        else:
+            v = (lon - self.lon0) / self.step
+        u = min(max(u, 0.0), self.rows - 1.0)
+        v = min(max(v, 0.0), self.cols - 1.0)
+
+        row = min(int(u), self.rows - 2)
+        col = min(int(v), self.cols - 2)
+        if row != self.row or col != self.col:
+            self.load(row, col)
+
+        u -= row
+        v -= col
+        c = self.c
+        d = c[0] + c[1] * u + c[2] * v + c[3] * u * v
+        if -180 <= d < 180:
+            return d
+        return (d + 180) % 360 - 180
@@ -0,0 +1,142 @@
+"""
+Local East-North-Up frame for distance and bearing at control rate
+
+Frame fixes a tangent plane at an origin and keeps the metres per 1e-7 degree
+of latitude and longitude there, from the WGS84 meridian and prime vertical
+radii, so the cosine of the latitude is taken once per anchor instead of on
+every call. Positions, array('i') latitude and longitude in 1e-7 degrees as
+in drivers.gps.Fix, are projected into east and north metres by subtracting
+the origin in integers and scaling, which keeps the float32 error at the
+millimetre level near the origin. Distance and bearing are then a hypot and
+an atan2 in the plane.
+
+The plane drifts from the ellipsoid with the distance from the origin: the
+east scale changes by tan(lat) / R per metre north, so the distance between
+two points within r of the origin is off by up to 2 * r * r * tan(lat) / R.
+The frame takes an accuracy in metres, derives the radius that keeps within
+it, and re-anchors at the boat when locate() finds it further out. Targets
+remember the anchor they were projected for and are projected again after a
+re-anchor. The error to targets beyond the radius grows with the square of
+their distance.
+
+    from navigation.geodesy import Frame, position
+    frame = Frame(gps.fix.position)
+    buoy = frame.target(position(53.5461, 9.9652))
+    ...
+    frame.locate(gps.fix.position)
+    frame.distance(buoy), frame.bearing(buoy)
+"""
+from array import array
+from math import sin, cos, tan, atan2, sqrt, pi
+
+A = 6378137.0               # WGS84 semi-major axis, metres
+E2 = 6.69437999014e-3       # WGS84 first eccentricity squared
+UNIT = pi / 180 / 10000000  # radians per 1e-7 degree
+ACCURACY = 0.1              # metres, the default error budget of the plane
+RADIUS = 20000.0            # metres, the largest radius whatever the accuracy
+
+
+def position( lat, lon ):
+    """ array('i') latitude, longitude in 1e-7 degrees from degrees """
+    return array('i', [int(round(lat * 10000000)), int(round(lon * 10000000))])
+
+def distance( a, b ):
+    """ metres between two projected points """
+    e = b[0] - a[0]
+    n = b[1] - a[1]
+    return sqrt(e * e + n * n)
+
+def bearing( a, b ):
+    """ degrees from a to b, clockwise from north, 0 to 360 """
+    d = atan2(b[0] - a[0], b[1] - a[1]) * 180 / pi
+    return d + 360 if d < 0 else d
+
+
+class Target(object):
+    """ a fixed position and its projection in the frame """
+
+    def __init__( self, position ):
+        self.position = position
+        self.xy = array('f', [0.0, 0.0])    # east, north metres
+        self.anchor = -1                    # Frame.anchors when projected
+
+
+class Frame(object):
+
+    def __init__( self, origin=None, accuracy=ACCURACY ):
+        """
+        origin: array('i') latitude, longitude in 1e-7 degrees, or None until the first locate()
+        accuracy: metres the planar distances may be off by before the frame re-anchors
+        """
+        self.accuracy = accuracy
+        self.origin = array('i', [0, 0])
+        self.scale = array('f', [0.0, 0.0]) # east, north metres per 1e-7 degree
+        self.here = array('f', [0.0, 0.0])  # the boat, from locate()
+        self.radius = 0.0
+        self.anchors = 0                    # counts the anchors, 0 without an origin
+        if origin is not None:
+            self.anchor(origin)
+
+    def anchor( self, origin ):
+        """ moves the origin of the plane to origin """
+        self.origin[0] = origin[0]
+        self.origin[1] = origin[1]
+        lat = origin[0] * UNIT
+        s = sin(lat)
+        w = 1 - E2 * s * s
+        north = A * (1 - E2) / (w * sqrt(w))    # meridian radius
+        east = A / sqrt(w) * cos(lat)           # prime vertical radius, times cos(lat)
+        self.scale[0] = east * UNIT
+        self.scale[1] = north * UNIT
+        self.radius = min(sqrt(self.accuracy * north / (2 * max(abs(tan(lat)), 0.01))), RADIUS)
+        self.anchors += 1
+        self.here[0] = self.here[1] = 0.0
+
+    def project( self, out, position ):
+        """ east and north metres of position into out """
+        dlon = position[1] - self.origin[1]
+        if dlon > 1800000000:
+            dlon -= 3600000000
+        elif dlon < -1800000000:
+            dlon += 3600000000
+        out[0] = dlon * self.scale[0]
+        out[1] = (position[0] - self.origin[0]) * self.scale[1]
+
+    def unproject( self, out, xy ):
+        """ the position of the east and north metres in xy into out, array('i') in 1e-7 degrees """
+        out[0] = self.origin[0] + int(xy[1] / self.scale[1])
+        out[1] = self.origin[1] + int(xy[0] / self.scale[0])
+
+    def locate( self, position ):
+        """
+        the boat is at position, re-anchors there when it is beyond the radius
+        returns True when the frame was re-anchored
+        """
+        if not self.anchors:
+            self.anchor(position)
+            return True
+        here = self.here
+        self.project(here, position)
+        if here[0] * here[0] + here[1] * here[1] > self.radius * self.radius:
+            self.anchor(position)
+            return True
+        return False
+
+    def target( self, position ):
+        """ a Target at position, projected when first used """
+        return Target(position)
+
+    def place( self, target ):
+        """ the projection of target in the current frame """
+        if target.anchor != self.anchors:
+            self.project(target.xy, target.position)
+            target.anchor = self.anchors
+        return target.xy
+
+    def distance( self, target ):
+        """ metres from the boat to target """
+        return distance(self.here, self.place(target))
+
+    def bearing( self, target ):
+        """ degrees from the boat to target, clockwise from true north """
+        return bearing(self.here, self.place(target))
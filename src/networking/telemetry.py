@@ -0,0 +1,94 @@
+"""
+Binary quaternion telemetry over the USB serial port
+
+Each frame is 20 bytes, little endian
+    0   sync        0xAA 0x55
+    2   sequence    uint16, wraps, a gap on the receiver is a dropped frame
+    4   ticks_ms    uint32
+    8   quaternion  4 x int16, w x y z scaled by 32767, magnetic north
+    16  declination int16 centidegrees, added to the yaw for true north
+    18  crc         uint16 CRC-16/CCITT-FALSE over bytes 2..17
+With a system.timing.LoopTiming attached, every TIMING-th quaternion frame is
+followed by a 28 byte timing frame of the window since the previous one
+    0   sync        0xAA 0x56
+    2   ticks_ms    uint32
+    6   loops       uint16, periods in the window, saturated
+    8   period      p50, p99, max uint16 microseconds, saturated
+    14  i2c         p50, p99, max
+    20  fusion      p50, p99, max
+    26  crc         uint16 CRC-16/CCITT-FALSE over bytes 2..25
+The histograms are reset after each timing frame.
+tools/fusion_visualize/visualize.py decodes both.
+"""
+import sys
+import utime
+import micropython
+from struct import pack_into
+
+SYNC = b'\xAA\x55'
+FRAMESIZE = 20
+TIMINGSYNC = b'\xAA\x56'
+TIMINGSIZE = 28
+TIMING = 50     # quaternion frames per timing frame
+
+@micropython.viper
+def crc16( buf: ptr8, start: int, end: int ) -> int:
+    """ CRC-16/CCITT-FALSE, poly 0x1021 init 0xFFFF """
+    crc = 0xFFFF
+    for i in range(start, end):
+        crc ^= buf[i] << 8
+        for _ in range(8):
+            if crc & 0x8000:
+                crc = ((crc << 1) ^ 0x1021) & 0xFFFF
+            else:
+                crc = (crc << 1) & 0xFFFF
+    return crc
+
+class Telemetry(object):
+
+    def __init__( self, stream=None, decimate=10 ):
+        """
+        stream: anything with write(), by default the raw USB serial port
+        decimate: send every n-th update
+        """
+        self.stream = stream or sys.stdout.buffer
+        self.decimate = decimate
+        self.count = 0
+        self.seq = 0
+        self.frame = bytearray(FRAMESIZE)
+        self.frame[0:2] = SYNC
+        self.timing = None  # optional system.timing.LoopTiming, sent every TIMING frames
+        self.timingFrame = bytearray(TIMINGSIZE)
+        self.timingFrame[0:2] = TIMINGSYNC
+
+    def update( self, q, declination=0 ):
+        """ called on every fusion update, sends every decimate-th quaternion """
+        self.count += 1
+        if self.count < self.decimate:
+            return
+        self.count = 0
+        self.send(q, declination)
+        if self.timing is not None and self.seq % TIMING == 0:
+            self.sendTiming(self.timing)
+
+    def send( self, q, declination=0 ):
+        frame = self.frame
+        pack_into('<HIhhhhh', frame, 2, self.seq, utime.ticks_ms(),
+            int(q[0] * 32767), int(q[1] * 32767), int(q[2] * 32767), int(q[3] * 32767),
+            int(declination * 100))
+        pack_into('<H', frame, 18, crc16(frame, 2, 18))
+        self.stream.write(frame)
+        self.seq = (self.seq + 1) & 0xFFFF
+
+    def sendTiming( self, timing ):
+        """ sends the loop timing percentiles and starts a new window """
+        frame = self.timingFrame
+        pack_into('<IH', frame, 2, utime.ticks_ms(), min(timing.period.count, 0xFFFF))
+        offset = 8
+        for histogram in (timing.period, timing.i2c, timing.fusion):
+            pack_into('<HHH', frame, offset, min(histogram.percentile(50), 0xFFFF),
+                min(histogram.percentile(99), 0xFFFF), min(histogram.max, 0xFFFF))
+            offset += 6
+        pack_into('<H', frame, 26, crc16(frame, 2, 26))
+        self.stream.write(frame)
+        timing.reset()
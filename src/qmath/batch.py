@@ -0,0 +1,93 @@
+"""
+NumPy quaternion and vector math for the host tools
+
+The functions of qmath.quaternion over arrays of quaternions (..., 4) as
+w, x, y, z and vectors (..., 3), broadcasting like NumPy and returning new
+arrays. The conventions are the same, tools/qmath/check.py holds both to them.
+Not for the device, it needs NumPy.
+
+    from qmath import batch
+    ypr = batch.euler(q)                # (N, 4) -> (N, 3) degrees
+    earth = batch.rotate(q, accel)
+"""
+import numpy as np
+
+
+def multiply( a, b ):
+    """ a * b, the Hamilton product """
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    a0, a1, a2, a3 = np.moveaxis(a, -1, 0)
+    b0, b1, b2, b3 = np.moveaxis(b, -1, 0)
+    return np.stack((a0 * b0 - a1 * b1 - a2 * b2 - a3 * b3,
+                     a0 * b1 + a1 * b0 + a2 * b3 - a3 * b2,
+                     a0 * b2 - a1 * b3 + a2 * b0 + a3 * b1,
+                     a0 * b3 + a1 * b2 - a2 * b1 + a3 * b0), axis=-1)
+
+
+def conjugate( q ):
+    """ q*, the inverse of a unit quaternion """
+    return np.asarray(q, dtype=np.float64) * (1.0, -1.0, -1.0, -1.0)
+
+
+def normalize( q ):
+    """ q scaled to unit length, zero quaternions are left alone """
+    q = np.asarray(q, dtype=np.float64)
+    norm = np.linalg.norm(q, axis=-1, keepdims=True)
+    return q / np.where(norm == 0, 1.0, norm)
+
+
+def rotate( q, v ):
+    """ q * v * q*, the vectors v in the sensor frame rotated into the earth frame """
+    q = np.asarray(q, dtype=np.float64)
+    v = np.asarray(v, dtype=np.float64)
+    u = q[..., 1:]
+    t = 2 * np.cross(u, v)
+    return v + q[..., :1] * t + np.cross(u, t)
+
+
+def unrotate( q, v ):
+    """ q* * v * q, the vectors v in the earth frame rotated into the sensor frame """
+    return rotate(conjugate(q), v)
+
+
+def slerp( a, b, t ):
+    """
+    the rotations t of the way from a to b along the shorter arc, t in 0..1
+    nearly equal quaternions are interpolated linearly and normalized
+    """
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    t = np.asarray(t, dtype=np.float64)[..., None]
+    d = np.sum(a * b, axis=-1, keepdims=True)
+    b = np.where(d < 0, -b, b)
+    d = np.abs(d)
+    theta = np.arccos(np.clip(d, -1.0, 1.0))
+    near = d > 0.9995
+    s = np.where(near, 1.0, np.sin(theta))
+    ka = np.where(near, 1 - t, np.sin((1 - t) * theta) / s)
+    kb = np.where(near, t, np.sin(t * theta) / s)
+    return normalize(ka * a + kb * b)
+
+
+def euler( q ):
+    """ yaw, pitch, roll of q in degrees, (..., 3) """
+    w, x, y, z = np.moveaxis(np.asarray(q, dtype=np.float64), -1, 0)
+    yaw = np.degrees(np.arctan2(2 * (x * y + w * z), w * w + x * x - y * y - z * z))
+    pitch = np.degrees(-np.arcsin(np.clip(2 * (x * z - w * y), -1, 1)))
+    roll = np.degrees(np.arctan2(2 * (w * x + y * z), w * w - x * x - y * y + z * z))
+    return np.stack((yaw, pitch, roll), axis=-1)
+
+
+def fromEuler( yaw, pitch, roll ):
+    """ the quaternions of yaw, pitch and roll in degrees """
+    yaw = np.radians(np.asarray(yaw, dtype=np.float64)) / 2
+    pitch = np.radians(np.asarray(pitch, dtype=np.float64)) / 2
+    roll = np.radians(np.asarray(roll, dtype=np.float64)) / 2
+    cy, sy = np.cos(yaw), np.sin(yaw)
+    cp, sp = np.cos(pitch), np.sin(pitch)
+    cr, sr = np.cos(roll), np.sin(roll)
+    return np.stack((cy * cp * cr + sy * sp * sr,
+                     cy * cp * sr - sy * sp * cr,
+                     cy * sp * cr + sy * cp * sr,
+                     sy * cp * cr - cy * sp * sr), axis=-1)
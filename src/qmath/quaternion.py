@@ -0,0 +1,150 @@
+"""
+Allocation free quaternion and vector math
+
+Quaternions are array('f') of w, x, y, z and vectors array('f') of x, y, z, the
+same layout as AHRS.q and the fusion engines. Every function writes its result
+into a buffer owned by the caller, out may be one of the inputs. No tuples,
+lists or generators are built, so the only heap traffic left is the boxing of
+intermediate floats on ports without an unboxed float representation.
+
+Euler angles are yaw, pitch and roll in degrees, the convention of AHRS: the
+quaternion is yaw about z, then pitch about y, then roll about x.
+
+qmath.batch is the NumPy version of the same functions for the host tools,
+tools/qmath/check.py runs one set of checks against both.
+
+    from qmath.quaternion import multiply, euler
+    multiply(q, q, dq)
+    euler(ypr, q)
+"""
+import micropython
+from math import sqrt, sin, cos, acos, atan2, asin, degrees, radians
+
+
+@micropython.native
+def multiply( out, a, b ):
+    """ out = a * b, the Hamilton product """
+    w = a[0] * b[0] - a[1] * b[1] - a[2] * b[2] - a[3] * b[3]
+    x = a[0] * b[1] + a[1] * b[0] + a[2] * b[3] - a[3] * b[2]
+    y = a[0] * b[2] - a[1] * b[3] + a[2] * b[0] + a[3] * b[1]
+    z = a[0] * b[3] + a[1] * b[2] - a[2] * b[1] + a[3] * b[0]
+    out[0] = w
+    out[1] = x
+    out[2] = y
+    out[3] = z
+
+
+@micropython.native
+def conjugate( out, q ):
+    """ out = q*, the inverse of a unit quaternion """
+    out[0] = q[0]
+    out[1] = -q[1]
+    out[2] = -q[2]
+    out[3] = -q[3]
+
+
+@micropython.native
+def normalize( q ):
+    """ scales q to unit length in place, a zero quaternion is left alone """
+    norm = sqrt(q[0] * q[0] + q[1] * q[1] + q[2] * q[2] + q[3] * q[3])
+    if norm == 0:
+        return
+    norm = 1 / norm
+    q[0] *= norm
+    q[1] *= norm
+    q[2] *= norm
+    q[3] *= norm
+
+
+@micropython.native
+def rotate( out, q, v ):
+    """ out = q * v * q*, the vector v in the sensor frame rotated into the earth frame """
+    _rotate(out, q[0], q[1], q[2], q[3], v)
+
+
+@micropython.native
+def unrotate( out, q, v ):
+    """ out = q* * v * q, the vector v in the earth frame rotated into the sensor frame """
+    _rotate(out, q[0], -q[1], -q[2], -q[3], v)
+
+
+@micropython.native
+def _rotate( out, w, x, y, z, v ):
+    # v + 2w (u x v) + 2u x (u x v) with u the vector part, 15 multiplies
+    vx = v[0]
+    vy = v[1]
+    vz = v[2]
+    tx = 2 * (y * vz - z * vy)
+    ty = 2 * (z * vx - x * vz)
+    tz = 2 * (x * vy - y * vx)
+    out[0] = vx + w * tx + y * tz - z * ty
+    out[1] = vy + w * ty + z * tx - x * tz
+    out[2] = vz + w * tz + x * ty - y * tx
+
+
+@micropython.native
+def slerp( out, a, b, t ):
+    """
+    out = the rotation t of the way from a to b along the shorter arc, t in 0..1
+    nearly equal quaternions are interpolated linearly and normalized
+    """
+    a0 = a[0]
+    a1 = a[1]
+    a2 = a[2]
+    a3 = a[3]
+    b0 = b[0]
+    b1 = b[1]
+    b2 = b[2]
+    b3 = b[3]
+    d = a0 * b0 + a1 * b1 + a2 * b2 + a3 * b3
+    if d < 0:
+        # q and -q are the same rotation, take the shorter way round
+        d = -d
+        b0 = -b0
+        b1 = -b1
+        b2 = -b2
+        b3 = -b3
+    if d > 0.9995:
+        ka = 1 - t
+        kb = t
+    else:
+        theta = acos(d)
+        s = 1 / sin(theta)
+        ka = sin((1 - t) * theta) * s
+        kb = sin(t * theta) * s
+    out[0] = ka * a0 + kb * b0
+    out[1] = ka * a1 + kb * b1
+    out[2] = ka * a2 + kb * b2
+    out[3] = ka * a3 + kb * b3
+    normalize(out)
+
+
+@micropython.native
+def euler( out, q ):
+    """ out = yaw, pitch, roll of q in degrees """
+    w = q[0]
+    x = q[1]
+    y = q[2]
+    z = q[3]
+    out[0] = degrees(atan2(2 * (x * y + w * z), w * w + x * x - y * y - z * z))
+    s = 2 * (x * z - w * y)
+    out[1] = degrees(-asin(1.0 if s > 1 else -1.0 if s < -1 else s))
+    out[2] = degrees(atan2(2 * (w * x + y * z), w * w - x * x - y * y + z * z))
+
+
+@micropython.native
+def fromEuler( out, yaw, pitch, roll ):
+    """ out = the quaternion of yaw, pitch and roll in degrees """
+    yaw = radians(yaw) / 2
+    pitch = radians(pitch) / 2
+    roll = radians(roll) / 2
+    cy = cos(yaw)
+    sy = sin(yaw)
+    cp = cos(pitch)
+    sp = sin(pitch)
+    cr = cos(roll)
+    sr = sin(roll)
+    out[0] = cy * cp * cr + sy * sp * sr
+    out[1] = cy * cp * sr - sy * sp * cr
+    out[2] = cy * sp * cr + sy * cp * sr
+    out[3] = sy * cp * cr - cy * sp * sr
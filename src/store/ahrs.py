@@ -1,39 +1,220 @@
-
 """
 This stores the AHRS state of the device
+
+The calibration lives in ahrs.cal, a header and up to SETS fixed layout records
+    header  magic b'RBCA', version uint16, sets uint16
+    record  name 8 bytes, flags uint16, accelbias 3f, magbias 9f, magcal 12f,
+            gyrotemp low, step 2f, nodes uint16, table 3 x GYROTEMP f, weight GYROTEMP f,
+            crc32 of the record
+A set is one IMU, selected by name. The file is read on the first access, not at
+import, and written to a temporary file that is then renamed over the old one,
+so a power cut during save leaves either the old or the new calibration. On
+file systems that cannot rename over a file the old one is removed first, and
+load() then finds the new calibration in the temporary file. A record that fails
+its CRC falls back to the temporary file when there is a valid one, else to the
+defaults. Names longer than 8 bytes, more than SETS sets and gyrotemp tables of
+more than GYROTEMP bins raise ValueError.
 """
+import os
+from binascii import crc32
+from struct import calcsize, pack_into, unpack_from
+
+FILENAME = 'ahrs.cal'
+MAGIC = b'RBCA'
+VERSION = 1
+SETS = 4
+GYROTEMP = 17   # temperature bins, fusion.gyrotemp.GyroTemperature() has 17
+
+HEADER = '<4sHH'
+RECORD = '<8sH3f9f12f2fH{}fI'.format(4 * GYROTEMP)
+HEADERSIZE = calcsize(HEADER)
+RECORDSIZE = calcsize(RECORD)
+
+_MAGCAL = 0x01      # flags, the optional parts present in a record
+_GYROTEMP = 0x02
+
+def _defaults():
+    return {
+        "magbias":(20.03906, -23.30859, 17.7207, 48.9375, 54.10547, 36.19727, 0.9484222, 0.8578321, 1.282235),
+        "accelbias":(0,0,1),
+        "magcal":None,
+        "gyrotemp":None
+    }
+
+_sets = None        # name: calibration dict, loaded on first access
+_name = 'imu0'      # the selected set
+ahrs = None         # the selected calibration dict
 
-ahrs = {
-    "magbias":(20.03906, -23.30859, 17.7207, 48.9375, 54.10547, 36.19727, 0.9484222, 0.8578321, 1.282235),
-    "accelbias":(0,0,1)
-}
+def _selected():
+    global ahrs
+    if _sets is None:
+        load()
+    if _name not in _sets:
+        if len(_sets) >= SETS:
+            raise ValueError("more than {} calibration sets".format(SETS))
+        _sets[_name] = _defaults()
+    ahrs = _sets[_name]
+    return ahrs
+
+def select( name='imu0' ):
+    """ selects the calibration set of an IMU, created with the defaults when new """
+    global _name
+    if len(name.encode()) > 8:
+        raise ValueError("calibration set name longer than 8 bytes")
+    if _sets is None:
+        load()
+    if name not in _sets and len(_sets) >= SETS:
+        raise ValueError("more than {} calibration sets".format(SETS))
+    _name = name
+    return _selected()
+
+def sets():
+    """ the names of the calibration sets """
+    _selected()
+    return list(_sets)
 
 # mutations
 
 def accelbias( *argv ):
     if len(argv):
-        ahrs["accelbias"] = argv[0]
-    return ahrs["accebias"]
+        _selected()["accelbias"] = argv[0]
+    return _selected()["accelbias"]
 
 def magbias( *argv ):
     if len(argv):
-        ahrs["magbias"] = argv[0]
-    return ahrs["magbias"]
-
-def save( filename='ahrs.json' ):
-    """write ahrs to flash"""
-    import json
-    with open(filename, 'w') as file:
-        json.dump(ahrs, file)
-
-def load( filename='ahrs.json' ):
-    """load ahrs set from flash"""
-    import json 
+        _selected()["magbias"] = argv[0]
+    return _selected()["magbias"]
+
+def magcal( *argv ):
+    if len(argv):
+        _selected()["magcal"] = argv[0]
+    return _selected()["magcal"]
+
+def gyrotemp( *argv ):
+    if len(argv):
+        _selected()["gyrotemp"] = argv[0]
+    return _selected()["gyrotemp"]
+
+# the binary layout
+
+def _pack( buf, offset, name, cal ):
+    name = name.encode()
+    if len(name) > 8:
+        raise ValueError("calibration set name longer than 8 bytes")
+    flags = 0
+    magcal = cal["magcal"]
+    if magcal:
+        flags |= _MAGCAL
+    else:
+        magcal = (0.0,) * 12
+    gyrotemp = cal["gyrotemp"]
+    if gyrotemp and (len(gyrotemp[3]) > GYROTEMP or len(gyrotemp[2]) > 3 * GYROTEMP):
+        raise ValueError("gyrotemp table of more than {} bins".format(GYROTEMP))
+    if gyrotemp:
+        flags |= _GYROTEMP
+        low, step, table, weight = gyrotemp
+        nodes = len(weight)
+    else:
+        low, step, table, weight, nodes = 0.0, 0.0, (), (), 0
+    table = list(table) + [0.0] * (3 * GYROTEMP - len(table))
+    weight = list(weight) + [0.0] * (GYROTEMP - len(weight))
+
+    pack_into(RECORD, buf, offset, name, flags, *(tuple(cal["accelbias"]) + tuple(cal["magbias"])
+        + tuple(magcal) + (low, step, nodes) + tuple(table) + tuple(weight) + (0,)))
+    pack_into('<I', buf, offset + RECORDSIZE - 4, crc32(buf[offset:offset + RECORDSIZE - 4]))
+
+def _unpack( buf, offset ):
+    """ returns name, calibration or None when the record is corrupt """
+    if unpack_from('<I', buf, offset + RECORDSIZE - 4)[0] != crc32(buf[offset:offset + RECORDSIZE - 4]):
+        return None
+    v = unpack_from(RECORD, buf, offset)
+    name = v[0].rstrip(b'\x00').decode()
+    flags = v[1]
+    cal = {
+        "accelbias":v[2:5],
+        "magbias":v[5:14],
+        "magcal":v[14:26] if flags & _MAGCAL else None,
+        "gyrotemp":None
+    }
+    if flags & _GYROTEMP:
+        nodes = v[28]
+        table = v[29:29 + 3 * GYROTEMP]
+        weight = v[29 + 3 * GYROTEMP:29 + 4 * GYROTEMP]
+        cal["gyrotemp"] = (v[26], v[27], list(table[:3 * nodes]), list(weight[:nodes]))
+    return name, cal
+
+def save( filename=FILENAME ):
+    """write the calibration sets to flash, atomically"""
+    _selected()
+    names = list(_sets)
+    if len(names) > SETS:
+        raise ValueError("more than {} calibration sets".format(SETS))
+    buf = bytearray(HEADERSIZE + len(names) * RECORDSIZE)
+    for i, name in enumerate(names):
+        _pack(buf, HEADERSIZE + i * RECORDSIZE, name, _sets[name])
+    pack_into(HEADER, buf, 0, MAGIC, VERSION, len(names))
+
+    temp = filename + '.tmp'
+    with open(temp, 'wb') as file:
+        file.write(buf)
     try:
-        with open(filename, 'r') as file:
-            global ahrs
-            ahrs = json.load(file)
-    except Exception :
-        pass
+        os.rename(temp, filename)
+    except OSError:
+        # file systems that do not replace on rename
+        os.remove(filename)
+        os.rename(temp, filename)
+
+def _read( filename ):
+    """ returns the sets in filename and whether all of them were intact, None when there is no file """
+    try:
+        with open(filename, 'rb') as file:
+            buf = file.read()
+    except OSError:
+        return None
+    sets = {}
+    if len(buf) < HEADERSIZE:
+        return sets, False
+    magic, version, count = unpack_from(HEADER, buf)
+    if magic != MAGIC or version != VERSION:
+        return sets, False
+    intact = count <= SETS
+    for i in range(min(count, SETS)):
+        offset = HEADERSIZE + i * RECORDSIZE
+        if offset + RECORDSIZE > len(buf):
+            intact = False
+            break
+        record = _unpack(buf, offset)
+        if record is None:
+            intact = False
+        else:
+            sets[record[0]] = record[1]
+    return sets, intact
 
-load() # the ahrs set from flash, when the library is first called
\ No newline at end of file
+def load( filename=FILENAME ):
+    """load the calibration sets from flash, the defaults when there are none"""
+    global _sets
+    found = _read(filename)
+    if found is None or not found[1]:
+        # a save interrupted between removing the old file and the rename
+        temp = _read(filename + '.tmp')
+        if temp is not None and temp[1]:
+            found = temp
+    if found is None:
+        _sets = {}
+        _migrate()
+        return
+    _sets = found[0]
+
+def _migrate( filename='ahrs.json' ):
+    """ takes over the calibration of the JSON store used before ahrs.cal """
+    try:
+        import json
+        with open(filename, 'r') as file:
+            old = json.load(file)
+    except Exception:
+        return
+    cal = _defaults()
+    for key in cal:
+        if old.get(key) is not None:
+            cal[key] = old[key]
+    _sets[_name] = cal
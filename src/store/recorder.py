@@ -0,0 +1,207 @@
+"""
+Records the raw AHRS sensor data to a preallocated ring file on flash
+
+Each record is 32 bytes
+    0   ticks_us            uint32 little endian
+    4   ACCEL_XOUT_H..GYRO_ZOUT_L, the 14 byte MPU9250 burst, big endian
+    18  HXL..ST2, the 7 byte AK8963 read, little endian
+    25  flags               bit0 the magnetometer data is new, bit1 from the FIFO
+    26  padding
+    28  sequence            uint32 little endian, the block written, 1 for the first, 0 never written
+AHRS feeds it from fastStep and from readFifo. FIFO samples carry no
+temperature, their records hold the last TEMP_OUT read, and their ticks are
+a hardware sample period apart, see AHRS.readFifo.
+Records are collected in a RAM block and writerTask writes a full block to
+flash in CHUNK byte writes, yielding to the other tasks between them, and
+updates the header and flushes only every HEADEREVERY blocks. The head and
+total in the header can be that many blocks stale after a power cut, so every
+record carries the sequence number of its block, open() recovers the head from
+them and logreader orders the ring by them. The fusion loop
+never waits for a whole block, but each write call still blocks the event
+loop for as long as the flash takes to write one chunk, an erase included.
+Two blocks alternate, when both are full the new records are dropped and
+counted. A new ring file is preallocated the same way, in chunks, and once
+both blocks are full the records that come in meanwhile are dropped too.
+
+The file starts with a 64 byte header, see HEADER, followed by capacity records.
+tools/replay/logreader.py reads it back on the host.
+"""
+import uasyncio
+import utime
+import micropython
+from struct import pack, pack_into, unpack_from
+
+MAGIC = b'RBLG'
+VERSION = 2
+HEADER = '<4sHHIII5f'   # magic, version, record size, capacity, head, total, accelSSF, gyroSSF, asax, asay, asaz
+HEADERSIZE = 64
+RECORD = 32
+BLOCK = 128             # records per block, 4096 bytes
+CHUNK = 512             # bytes per flash write call
+HEADEREVERY = 8         # blocks between header updates, the saved head is at most as many behind
+SEQUENCE = 28           # offset of the block sequence number in a record
+_FIFO = 0x02
+
+@micropython.viper
+def _copy( dst: ptr8, offset: int, src: ptr8, n: int ):
+    for i in range(n):
+        dst[offset + i] = src[i]
+
+@micropython.viper
+def _fifo( dst: ptr8, offset: int, src: ptr8, start: int ):
+    """ the accel and gyro of the FIFO sample at src[start] around the temperature slot of a burst """
+    for i in range(6):
+        dst[offset + i] = src[start + i]
+        dst[offset + 8 + i] = src[start + 6 + i]
+
+class Recorder(object):
+
+    def __init__( self, ahrs, filename='log.bin', capacity=BLOCK * 256 ):
+        """
+        ahrs: the AHRS whose samples are recorded, it calls append from fastStep and appendFifo from readFifo
+        capacity: records in the ring, rounded up to whole blocks. 32768 records is 1MB, 5 minutes at 100Hz
+        """
+        self.ahrs = ahrs
+        self.filename = filename
+        self.capacity = -(-capacity // BLOCK) * BLOCK
+        self.blocks = [bytearray(BLOCK * RECORD), bytearray(BLOCK * RECORD)]
+        self.active = 0     # the block being filled
+        self.fill = 0       # records in the active block
+        self.pending = None # the full block waiting for the writer
+        self.ready = uasyncio.Event()
+        self.head = 0
+        self.total = 0
+        self.dropped = 0
+        self.unsaved = 0    # blocks written since the last header update
+        self.file = None
+
+    def open( self ):
+        """
+        opens the ring file, returns True when it matches, otherwise it is created
+        empty and False tells that it still has to be preallocated
+        """
+        file = None
+        try:
+            file = open(self.filename, 'r+b')
+            magic, version, size, capacity, head, total = unpack_from(HEADER, file.read(HEADERSIZE))[:6]
+            if magic == MAGIC and version == VERSION and size == RECORD and capacity == self.capacity:
+                self.file = file
+                self.head = head
+                self.total = total
+                self.recover()
+                self.writeHeader()
+                return True
+        except (OSError, ValueError):
+            pass
+        if file is not None:
+            file.close()
+
+        self.file = open(self.filename, 'w+b')
+        self.head = 0
+        self.total = 0
+        return False
+
+    async def preallocate( self ):
+        """ writes the empty ring in chunks, the header last so an interrupted file does not match """
+        self.file.write(bytes(HEADERSIZE))
+        empty = bytes(CHUNK)
+        for _ in range(self.capacity * RECORD // CHUNK):
+            self.file.write(empty)
+            await uasyncio.sleep_ms(0)
+        self.writeHeader()
+
+    def recover( self ):
+        """ head and total after the newest block on flash, the saved ones may be stale """
+        buf = bytearray(4)
+        newest = 0
+        for block in range(self.capacity // BLOCK):
+            self.file.seek(HEADERSIZE + block * BLOCK * RECORD + SEQUENCE)
+            self.file.readinto(buf)
+            sequence = unpack_from('<I', buf)[0]
+            if sequence > newest:
+                newest = sequence
+                self.head = (block + 1) * BLOCK % self.capacity
+        self.total = newest * BLOCK
+
+    def writeHeader( self ):
+        ahrs = self.ahrs
+        self.file.seek(0)
+        self.file.write(pack(HEADER, MAGIC, VERSION, RECORD, self.capacity, self.head, self.total,
+            ahrs.accelSSF, ahrs.gyroSSF, ahrs.asax, ahrs.asay, ahrs.asaz))
+        self.file.flush()
+
+    def next( self ):
+        """ the offset of the next record in the active block, -1 when it is dropped """
+        if self.fill == BLOCK:
+            if self.pending is not None:
+                self.dropped += 1
+                return -1
+            self.pending = self.active
+            self.active ^= 1
+            self.fill = 0
+            self.ready.set()
+        offset = self.fill * RECORD
+        self.fill += 1
+        return offset
+
+    def append( self, motion, magdata, newmag ):
+        """ copies one sample into the active block, allocation free """
+        offset = self.next()
+        if offset < 0:
+            return
+        block = self.blocks[self.active]
+        pack_into('<I', block, offset, utime.ticks_us())
+        _copy(block, offset + 4, motion, 14)
+        _copy(block, offset + 18, magdata, 7)
+        block[offset + 25] = 1 if newmag else 0
+
+    def appendFifo( self, fifo, start, temperature, magdata, newmag, ticks ):
+        """
+        copies one 12 byte FIFO sample at fifo[start] into the active block, allocation free
+        temperature: the 2 byte TEMP_OUT last read, ticks: the ticks_us of the sample
+        """
+        offset = self.next()
+        if offset < 0:
+            return
+        block = self.blocks[self.active]
+        pack_into('<I', block, offset, ticks)
+        _fifo(block, offset + 4, fifo, start)
+        _copy(block, offset + 10, temperature, 2)
+        _copy(block, offset + 18, magdata, 7)
+        block[offset + 25] = (1 if newmag else 0) | _FIFO
+
+    async def writerTask( self ):
+        """ writes the full blocks to the ring file a chunk at a time """
+        if self.file is None and not self.open():
+            await self.preallocate()
+        while True:
+            await self.ready.wait()
+            self.ready.clear()
+            block = self.blocks[self.pending]
+            sequence = self.total // BLOCK + 1
+            for offset in range(SEQUENCE, BLOCK * RECORD, RECORD):
+                pack_into('<I', block, offset, sequence)
+            block = memoryview(block)
+            self.file.seek(HEADERSIZE + self.head * RECORD)
+            for start in range(0, BLOCK * RECORD, CHUNK):
+                self.file.write(block[start:start + CHUNK])
+                await uasyncio.sleep_ms(0)
+            self.head = (self.head + BLOCK) % self.capacity
+            self.total += BLOCK
+            self.pending = None
+            self.unsaved += 1
+            if self.unsaved >= HEADEREVERY:
+                self.saveHead()
+                await uasyncio.sleep_ms(0)
+                self.file.flush()
+
+    def saveHead( self ):
+        self.unsaved = 0
+        self.file.seek(12)
+        self.file.write(pack('<II', self.head, self.total))
+
+    def close( self ):
+        if self.file is not None:
+            self.saveHead()
+            self.file.close()
+            self.file = None
@@ -0,0 +1,137 @@
+"""
+Fixed rate tasks on top of uasyncio, rate monotonic
+
+Each task is a plain function run once per period, released on a ticks_us
+deadline grid so the rate does not drift with the run times. When several
+tasks are due the one with the shortest period runs first, and after every run
+the scan starts again from the top, so a slow telemetry send delays the fusion
+by at most one run. Between releases run() sleeps until the next deadline
+instead of spinning on sleep_ms(0), leaving the CPU to the other coroutines.
+uasyncio counts in milliseconds, so the sleep is rounded up to the next one
+and a release can start up to 1ms late, only waits of at most SPIN
+microseconds are spun out in place.
+
+A run that ends after the next release of its task is an overrun. A task
+released more than a period late skips the releases it missed, keeping its
+phase, and counts them. Every task keeps a system.timing.Histogram of its
+release latency and one of its run time.
+
+    from system.scheduler import Scheduler
+    scheduler = Scheduler()
+    scheduler.add(ahrs.fastStep, 200, 'fusion')
+    scheduler.add(pilot.step, 50, 'control')
+    asyncio.create_task(scheduler.run())
+    ...
+    >>> scheduler.report()
+"""
+import utime
+import uasyncio
+from system.timing import Histogram
+
+SPIN = 50   # microseconds, shorter waits block in utime.sleep_us rather than go through the event loop
+
+
+class Task(object):
+    """
+    function: called without arguments once per period
+    period: microseconds
+    """
+
+    def __init__( self, function, period, name ):
+        self.function = function
+        self.period = period
+        self.name = name
+        self.deadline = utime.ticks_us()    # the next release
+        self.latency = Histogram()          # release to start, microseconds
+        self.time = Histogram()             # run time, microseconds
+        self.runs = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.errors = 0
+        self.error = None                   # the last exception raised by function
+
+
+class Scheduler(object):
+
+    def __init__( self ):
+        self.tasks = []
+
+    def add( self, function, rate, name=None ):
+        """
+        runs function rate times per second, the faster the rate the higher the priority
+        returns the Task with its counters
+        """
+        task = Task(function, int(1000000 / rate), name or function.__name__)
+        self.tasks.append(task)
+        self.tasks.sort(key=lambda task: task.period)
+        return task
+
+    def remove( self, task ):
+        self.tasks.remove(task)
+
+    def reset( self ):
+        """ clears the counters and histograms of every task """
+        for task in self.tasks:
+            task.latency.reset()
+            task.time.reset()
+            task.runs = task.overruns = task.skipped = task.errors = 0
+
+    def poll( self ):
+        """ runs the due tasks in priority order, returns microseconds until the next release """
+        tasks = self.tasks
+        i = 0
+        while i < len(tasks):
+            task = tasks[i]
+            start = utime.ticks_us()
+            late = utime.ticks_diff(start, task.deadline)
+            if late < 0:
+                i += 1
+                continue
+
+            try:
+                task.function()
+            except Exception as e:
+                task.errors += 1
+                task.error = e
+            end = utime.ticks_us()
+            task.runs += 1
+            task.latency.add(late)
+            task.time.add(utime.ticks_diff(end, start))
+
+            period = task.period
+            task.deadline = utime.ticks_add(task.deadline, period)
+            late = utime.ticks_diff(end, task.deadline)
+            if late > 0:
+                task.overruns += 1
+                if late >= period:
+                    # keep the phase, skip the releases that were missed
+                    missed = late // period
+                    task.skipped += missed
+                    task.deadline = utime.ticks_add(task.deadline, missed * period)
+            # back to the top, a faster task may have become due meanwhile
+            i = 0
+
+        wait = 1000000
+        now = utime.ticks_us()
+        for task in tasks:
+            wait = min(wait, utime.ticks_diff(task.deadline, now))
+        return wait
+
+    async def run( self ):
+        """ the scheduler coroutine, sleeps between releases """
+        while True:
+            wait = self.poll()
+            if wait > SPIN:
+                await uasyncio.sleep_ms((wait + 999) // 1000)
+            else:
+                if wait > 0:
+                    utime.sleep_us(wait)
+                await uasyncio.sleep_ms(0)
+
+    def report( self ):
+        """ prints the counters and percentiles of every task, for the REPL """
+        for task in self.tasks:
+            print("{:10s} {:6d}us {:7d} runs {:5d} overruns {:5d} skipped {:3d} errors".format(
+                task.name, task.period, task.runs, task.overruns, task.skipped, task.errors))
+            task.latency.report("  latency")
+            task.time.report("  run")
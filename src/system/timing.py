@@ -0,0 +1,131 @@
+"""
+Loop timing instrumentation in fixed bucket histograms
+
+A Histogram counts microsecond durations into buckets with fixed upper edges,
+so recording a sample is a bucket search and an increment in preallocated
+arrays, no allocation however long it runs. It keeps the count and the
+largest value, and answers percentiles to the resolution of its buckets.
+
+LoopTiming holds the histograms of one fusion loop: the period between loop
+starts, the time spent in the I2C reads and the fusion compute after them.
+The loop calls begin(), split() and end(), AHRS.fastStep and AHRS.readFifo do
+when AHRS.timing is set. The period shows the deltat() jitter, a long tail in
+it while the I2C and fusion times stay short means other tasks held the loop up.
+
+    >>> ahrs.timing.report()
+    period    4414 samples  p50 <=   2000us  p99 <=   2000us  max  32000us
+    i2c       4415 samples  p50 <=    500us  p99 <=    720us  max    720us
+    fusion    4415 samples  p50 <=    400us  p99 <=    400us  max    400us
+    >>> ahrs.timing.period.buckets()
+    [(2000, 4375), (50000, 39)]
+networking.telemetry sends the percentiles when the LoopTiming is attached to it.
+"""
+import utime
+import micropython
+from array import array
+
+# upper bucket edges in microseconds, a 1-1.5-2-3-5-7 series from 50us to 100ms,
+# everything longer lands in the last bucket
+EDGES = (50, 70, 100, 150, 200, 300, 500, 700, 1000, 1500, 2000, 3000, 5000, 7000,
+    10000, 15000, 20000, 30000, 50000, 70000, 100000)
+
+
+@micropython.viper
+def _bucket( edges: ptr32, n: int, x: int ) -> int:
+    """ the index of the first edge at or above x, n when there is none """
+    i = 0
+    while i < n:
+        if x <= edges[i]:
+            return i
+        i += 1
+    return n
+
+
+class Histogram(object):
+    """
+    edges: ascending upper bucket edges in microseconds
+    """
+
+    def __init__( self, edges=EDGES ):
+        self.edges = array('i', edges)
+        self.n = len(edges)
+        self.counts = array('i', [0] * (self.n + 1))
+        self.reset()
+
+    def reset( self ):
+        counts = self.counts
+        for i in range(len(counts)):
+            counts[i] = 0
+        self.count = 0
+        self.max = 0
+
+    def add( self, x ):
+        """ records a duration of x microseconds """
+        self.counts[_bucket(self.edges, self.n, x)] += 1
+        self.count += 1
+        if x > self.max:
+            self.max = x
+
+    def percentile( self, p ):
+        """
+        the upper edge of the bucket holding the p-th percentile, in microseconds,
+        at most the largest value seen. 0 when empty
+        """
+        if not self.count:
+            return 0
+        rank = self.count * p / 100
+        seen = 0
+        for i in range(self.n):
+            seen += self.counts[i]
+            if seen >= rank:
+                return min(self.edges[i], self.max)
+        return self.max
+
+    def report( self, name ):
+        print("{:7s} {:6d} samples  p50 <= {:6d}us  p99 <= {:6d}us  max {:6d}us".format(
+            name, self.count, self.percentile(50), self.percentile(99), self.max))
+
+    def buckets( self ):
+        """ (upper edge, count) of the buckets that hold samples, None for the open last bucket """
+        return [(self.edges[i] if i < self.n else None, self.counts[i])
+            for i in range(self.n + 1) if self.counts[i]]
+
+
+class LoopTiming(object):
+
+    def __init__( self, edges=EDGES ):
+        self.period = Histogram(edges)  # loop start to loop start
+        self.i2c = Histogram(edges)     # begin() to split(), the sensor reads
+        self.fusion = Histogram(edges)  # split() to end(), the filter update
+        self.last = None
+        self.mark = 0
+
+    def reset( self ):
+        """ clears the histograms, the next period counts from the next begin() """
+        self.period.reset()
+        self.i2c.reset()
+        self.fusion.reset()
+        self.last = None
+
+    def begin( self ):
+        """ the loop starts, the I2C reads follow """
+        now = utime.ticks_us()
+        if self.last is not None:
+            self.period.add(utime.ticks_diff(now, self.last))
+        self.last = now
+
+    def split( self ):
+        """ the reads are done, the fusion follows """
+        now = utime.ticks_us()
+        self.i2c.add(utime.ticks_diff(now, self.last))
+        self.mark = now
+
+    def end( self ):
+        """ the fusion is done """
+        self.fusion.add(utime.ticks_diff(utime.ticks_us(), self.mark))
+
+    def report( self ):
+        """ prints the percentiles of the three histograms, for the REPL """
+        self.period.report("period")
+        self.i2c.report("i2c")
+        self.fusion.report("fusion")
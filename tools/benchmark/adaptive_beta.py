@@ -0,0 +1,92 @@
+"""
+Compares the scheduled Madgwick gain against fixed gains
+
+fixed 40: the old fixed gain, a 40 degrees per second gyro error
+fixed 10: the steady state gain alone
+adaptive: Madgwick() as AHRS uses it, boosted while converging and after
+          disturbances, accel samples far from 1g rejected
+
+Reports per engine
+    converge  seconds until the error stays within TOLERANCE degrees
+    recover   the same after the wave slam, synthetic data only
+    rms       error in the steady state, outside CONVERGENCE seconds after the start and the slam
+    jitter    rms of the sample to sample change of the error, the noise the filter lets through
+The error is the largest of the heading, pitch and roll errors on synthetic data
+and the heading error against the reference column of a recording, see engines.py.
+
+    py ./tools/benchmark/adaptive_beta.py [recording.csv]
+"""
+import os
+import sys
+from array import array
+from math import radians, sqrt
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'simulator'))
+import sim
+import motion
+import engines
+
+sim.install()
+from fusion.madgwick import Madgwick
+
+TOLERANCE = 2.0
+CONVERGENCE = 30
+SLAM = 60
+BIAS = (0.05, -0.03, 0.04) # residual gyro bias after the online estimate, degrees per second
+
+
+def synthetic():
+    return [(t, accel, gyro, mag, motion.ypr(q)) for t, accel, gyro, mag, q in motion.boat(seconds=120, slam=SLAM, bias=BIAS)]
+
+def recording( filename ):
+    return [(t, accel, gyro, mag, (heading,)) for t, accel, gyro, mag, heading in engines.recording(filename)]
+
+
+def settled( times, errors, start ):
+    """ seconds from start until the error stays within TOLERANCE for the next CONVERGENCE seconds """
+    last = None
+    for t, e in zip(times, errors):
+        if start <= t < start + CONVERGENCE and e > TOLERANCE:
+            last = t
+    return 0.0 if last is None else last - start
+
+def run( name, engine, samples, slam ):
+    q = array('f', [1.0, 0.0, 0.0, 0.0])
+    v = array('f', [0.0] * 9)
+    t0 = samples[0][0]
+    last = t0
+    times = []
+    errors = []
+
+    for t, accel, gyro, mag, truth in samples:
+        v[0:3] = array('f', accel)
+        v[3:6] = array('f', gyro)
+        v[6:9] = array('f', mag)
+        dt = t - last or 0.01
+        last = t
+        engine.update(q, v, dt)
+
+        ypr = motion.ypr(q)
+        times.append(t - t0)
+        errors.append(max(abs(engines.wrap(ypr[k] - truth[k])) for k in range(len(truth))))
+
+    steady = [k for k, t in enumerate(times)
+        if t >= CONVERGENCE and not (slam is not None and slam <= t < slam + CONVERGENCE)]
+    rms = sqrt(sum(errors[k] ** 2 for k in steady) / len(steady))
+    jitter = sqrt(sum((errors[k] - errors[k - 1]) ** 2 for k in steady) / len(steady))
+
+    recover = "" if slam is None else "recover {:5.2f}s ".format(settled(times, errors, slam))
+    print("{:9s} converge {:5.2f}s {}rms {:5.2f} jitter {:6.3f} degrees".format(
+        name, settled(times, errors, 0.0), recover, rms, jitter))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        samples, slam = recording(sys.argv[1]), None
+    else:
+        samples, slam = synthetic(), SLAM
+    b40 = sqrt(3.0 / 4.0) * radians(40)
+    b10 = sqrt(3.0 / 4.0) * radians(10)
+    run("fixed 40", Madgwick(b40, b40, reject=float('inf')), samples, slam)
+    run("fixed 10", Madgwick(b10, b10, reject=float('inf')), samples, slam)
+    run("adaptive", Madgwick(), samples, slam)
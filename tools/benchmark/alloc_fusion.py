@@ -0,0 +1,125 @@
+"""
+Counts the heap allocations of the fusion engine updates in src/fusion
+
+On MicroPython (upload ./src/fusion then `ampy run` this file, or the unix port)
+the gc is disabled and gc.mem_alloc() is read around a batch of updates.
+The engines build no tuples, lists or generators, so the only allocations
+left are float objects on builds that box floats (the ESP32 default). A
+float-only loop measures the bytes of one float, and an update may allocate
+no more than FLOATS of them, its arithmetic results and array reads. On
+builds with unboxed floats that is zero.
+
+On CPython there is no allocation counter, the script checks FLOATS against
+the engine source with sim.floats(), checks AHRS.fusion() and
+AHRS.fusionIMU() reproduce the engine updates and reports their cost.
+
+    py ./tools/benchmark/alloc_fusion.py
+"""
+import sys
+
+UPDATES = 1000
+
+try:
+    import gc
+    gc.mem_alloc
+    MICROPYTHON = True
+except AttributeError:
+    MICROPYTHON = False
+
+if not MICROPYTHON:
+    import os
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'simulator'))
+    import sim
+    sim.install()
+
+from array import array
+from fusion.madgwick import Madgwick
+from fusion.mahony import Mahony
+
+ENGINES = (("madgwick", Madgwick), ("mahony", Mahony))
+
+# float objects one update creates at most, and the functions it runs
+FLOATS = {
+    ("madgwick", "update"): (307, 'fusion.madgwick', 'Madgwick.gain', 'update'),
+    ("madgwick", "updateIMU"): (164, 'fusion.madgwick', 'Madgwick.gain', 'updateIMU'),
+    ("mahony", "update"): (184, 'fusion.mahony', 'Mahony.update'),
+    ("mahony", "updateIMU"): (104, 'fusion.mahony', 'Mahony.updateIMU'),
+}
+
+
+def sample():
+    q = array('f', [0.9, 0.1, -0.2, 0.3])
+    v = array('f', [0.05, -0.02, 0.98, 0.01, -0.03, 0.2, 180.0, -20.0, -390.0])
+    return q, v
+
+def floats( n ):
+    x = 1.5
+    for _ in range(n):
+        x = x * 1.0000001
+
+def mem( f, *args ):
+    gc.collect()
+    gc.disable()
+    before = gc.mem_alloc()
+    f(*args)
+    after = gc.mem_alloc()
+    gc.enable()
+    return after - before
+
+def updates( update, q, v ):
+    for _ in range(UPDATES):
+        update(q, v, 0.005)
+
+def micropython():
+    q, v = sample()
+    perFloat = mem(floats, UPDATES) / UPDATES
+    print("{:.1f} bytes per float object".format(perFloat))
+    for name, Engine in ENGINES:
+        engine = Engine()
+        for method, update in (("update", engine.update), ("updateIMU", engine.updateIMU)):
+            n = mem(updates, update, q, v) / UPDATES
+            budget = FLOATS[name, method][0] * perFloat
+            print("{:8s} {:9s} {:8.1f} bytes/update, float-only budget {:.1f}".format(name, method, n, budget))
+            assert n <= budget, "the engine allocates more than its floats"
+
+def cpython():
+    import time
+    from math import degrees
+    from drivers.ahrs import AHRS
+
+    for key, (n, module, *functions) in FLOATS.items():
+        assert sim.floats(module, *functions) == n, "FLOATS {} is {}, the source has {}".format(
+            key, n, sim.floats(module, *functions))
+    print("FLOATS matches the engine source, at most {} float objects per update".format(max(v[0] for v in FLOATS.values())))
+
+    for name, Engine in ENGINES:
+        ahrs = AHRS(i2c=sim.bus(), engine=Engine())
+        ahrs.gyroBias = None # compare the engines alone
+        engine = Engine()
+        for method in ("update", "updateIMU"):
+            q, v = sample()
+            accel = v[0], v[1], v[2]
+            gyro = degrees(v[3]), degrees(v[4]), degrees(v[5])
+            mag = v[6], v[7], v[8]
+            ahrs.q[:] = q
+            ahrs.engine.reset()
+            engine.reset()
+            update = getattr(engine, method)
+            for _ in range(UPDATES):
+                update(q, v, 0.005)
+                if method == "update":
+                    ahrs.fusion(accel, gyro, mag, 0.005)
+                else:
+                    ahrs.fusionIMU(accel, gyro, 0.005)
+            error = max(abs(q[i] - ahrs.q[i]) for i in range(4))
+            assert error < 1e-5, error
+
+            start = time.perf_counter()
+            updates(update, q, v)
+            elapsed = time.perf_counter() - start
+            print("{:8s} {:9s} {:6.2f} us/update, max deviation from AHRS {:.1e}".format(
+                name, method, elapsed / UPDATES * 1e6, error))
+
+
+if __name__ == '__main__':
+    micropython() if MICROPYTHON else cpython()
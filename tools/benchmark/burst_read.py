@@ -0,0 +1,64 @@
+"""
+Benchmarks the accel/gyro read path of AHRS against the simulated I2C bus
+
+separate: readAccel() + readGyro(), two transactions, two new bytes objects
+burst:    readMotion(), one 14 byte transaction into a preallocated buffer
+
+updates per second = updates / (host CPU time + modelled 400kHz wire time)
+The CPU share is CPython on the host, the wire share is what the ESP32 pays too.
+The simulator clock moves on by a sample period per update, so the AK8963 in
+its 100Hz continuous mode has a new measurement for every fusion step.
+
+    py ./tools/benchmark/burst_read.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'simulator'))
+import sim
+
+sim.install()
+import clock
+from drivers.ahrs import AHRS
+
+UPDATES = 20000
+RATE = 100  # Hz, the AK8963 continuous measurement mode 2
+
+
+def separate( ahrs ):
+    mag = ahrs.readMag()
+    ahrs.fusion(ahrs.readAccel(), ahrs.readGyro(), mag, 1.0 / RATE)
+    return mag
+
+def burst( ahrs ):
+    mag = ahrs.readMag()
+    accel, gyro = ahrs.readMotion()
+    ahrs.fusion(accel, gyro, mag, 1.0 / RATE)
+    return mag
+
+
+def run( name, step ):
+    bus = sim.bus()
+    ahrs = AHRS(i2c=bus)
+    bus.reset()
+
+    fused = 0
+    cpu = 0.0
+    for _ in range(UPDATES):
+        clock.advance(1.0 / RATE)
+        start = time.perf_counter()
+        mag = step(ahrs)
+        cpu += time.perf_counter() - start
+        fused += mag is not None
+    assert fused == UPDATES, "{} of {} updates without a new magnetometer sample".format(UPDATES - fused, UPDATES)
+
+    wire = bus.busTime()
+    print("{:9s} {:4.1f} transactions/update {:5.1f} bytes/update wire {:6.1f}us/update {:8.0f} updates/s".format(
+        name, bus.transactions / UPDATES, bus.bytes / UPDATES,
+        wire / UPDATES * 1e6, UPDATES / (cpu + wire)))
+
+
+if __name__ == '__main__':
+    run("separate", separate)
+    run("burst", burst)
@@ -0,0 +1,65 @@
+"""
+Two IMUs and the power management SOC sharing the I2C bus through drivers.bus
+
+The primary MPU9250 at 0x69 fuses with its AK8963, the second at 0x68 runs 6-DOF
+with its bypass closed, both through fastStep at RATE Hz on the simulator clock.
+The IP5306 charge status and battery level are scheduled reads at 1Hz, the two
+status registers are coalesced into one transfer, the level two registers
+further on is not. The callback of the level read raises, it must be counted
+against the IP5306 while the polling goes on.
+
+Reports the transfers the scheduler built, then per device the transactions,
+bytes and share of the bus, and the headroom left at each loop rate.
+
+    py ./tools/benchmark/bus_manager.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'simulator'))
+import sim
+
+sim.install()
+import clock
+import motion
+from drivers.ahrs import AHRS
+from drivers.bus import Bus
+
+SECONDS = 10
+RATES = (100, 200, 500, 1000)
+
+
+def broken( read ):
+    raise ValueError('level callback')
+
+def run( rate ):
+    bus = Bus(sim.bus(motion.synthetic(seconds=SECONDS), imus=2))
+    bus.register(0x69, 'MPU9250')
+    bus.register(0x68, 'MPU9250b')
+    bus.register(0x0C, 'AK8963')
+    bus.register(0x75, 'IP5306')
+
+    primary = AHRS(i2c=bus)
+    secondary = AHRS(i2c=bus, calibration='imu1', address=0x68, magnetometer=False)
+    charging = bus.schedule(0x75, 0x70, 1, rate=1)
+    full = bus.schedule(0x75, 0x71, 1, rate=1)
+    level = bus.schedule(0x75, 0x78, 1, rate=1, callback=broken)
+
+    bus.reset()
+    start = clock.now()
+    while clock.now() - start < SECONDS:
+        primary.fastStep()
+        secondary.fastStep()
+        bus.poll()
+        clock.advance(1.0 / rate - (clock.now() - start) % (1.0 / rate))
+
+    assert bus.device(0x75).failures >= SECONDS - 1 and bus.device(0x75).transactions >= 2 * (SECONDS - 1)
+    print("{}Hz, {} IP5306 transfers for 3 scheduled reads, heading {:.1f} / {:.1f}".format(
+        rate, len(bus.transfers), primary.yaw, secondary.yaw))
+    bus.report()
+    print()
+
+
+if __name__ == '__main__':
+    for rate in RATES:
+        run(rate)
@@ -0,0 +1,128 @@
+"""
+Counts the I2C traffic of each AHRS loop against the register level simulator
+
+Runs the loops on the virtual clock for SECONDS of synthetic boat motion, with
+CPU microseconds of modelled processing per step on top of the wire time, and
+reports per device and per step: transactions, payload bytes and wire time,
+plus the bus utilisation and how many magnetometer measurements were fused.
+
+step:     readMag() + readMotion(), the tuple based loop
+fastStep: readSample() + readMagSample(), the allocation free loop
+fifo:     readFifo() every 20ms with the FIFO at 200Hz
+overflow: the fifo loop stalls for 300ms, the FIFO fills up to its last byte
+          and ends in part of a sample. The batch must be dropped, the FIFO
+          reset and every sample after it aligned, the boat upright with the
+          accel z near 1g. A misaligned FIFO turns the axes
+
+The exit status is 1 when a loop needs more bytes per fused sample than its
+BUDGET, so this can run in CI to catch traffic regressions.
+
+    py ./tools/benchmark/bus_traffic.py [cpu_us]
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'simulator'))
+import sim
+
+sim.install()
+import clock
+import motion
+from drivers.ahrs import AHRS
+
+SECONDS = 10
+CPU = 500e-6    # modelled processing per step, seconds
+NAMES = {0x69: 'MPU9250', 0x0C: 'AK8963', 0x75: 'IP5306'}
+
+# bytes per fused sample: 14 motion + 1 ST1 poll + 7 mag at 100Hz, with slack
+BUDGET = {'step': 20, 'fastStep': 20, 'fifo': 16}
+
+
+def step( ahrs ):
+    ahrs.step()
+    clock.advance(CPU)
+    return 1
+
+def fastStep( ahrs ):
+    ahrs.fastStep()
+    clock.advance(CPU)
+    return 1
+
+def fifo( ahrs ):
+    clock.advance(0.020)
+    return ahrs.readFifo()
+
+
+def run( name, loop, source ):
+    bus = sim.bus(source)
+    ahrs = AHRS(i2c=bus)
+    ahrs.gyroBias = None
+    if loop is fifo:
+        ahrs.initFifo(200)
+
+    # count the magnetometer measurements that made it into the fusion
+    readMag = ahrs.readMag
+    readMagSample = ahrs.readMagSample
+    fused = [0]
+    def countMag():
+        m = readMag()
+        fused[0] += m is not None
+        return m
+    def countMagSample():
+        new = readMagSample()
+        fused[0] += new
+        return new
+    ahrs.readMag = countMag
+    ahrs.readMagSample = countMagSample
+
+    bus.reset()
+    start = clock.now()
+    steps = samples = 0
+    while clock.now() - start < SECONDS:
+        samples += loop(ahrs)
+        steps += 1
+    elapsed = clock.now() - start
+
+    print("{:9s} {:6.0f} steps/s {:6.0f} samples/s {:5.1f} mag/s  bus {:4.1f}%".format(
+        name, steps / elapsed, samples / elapsed, fused[0] / elapsed, 100 * bus.busTime() / elapsed))
+    for addr, (transactions, nbytes, bits) in sorted(bus.stats.items()):
+        print("    {:8s} {:5.2f} transactions/step {:6.2f} bytes/step {:7.1f}us/step".format(
+            NAMES.get(addr, hex(addr)), transactions / steps, nbytes / steps, bits / bus.freq / steps * 1e6))
+
+    perSample = bus.bytes / max(samples, 1)
+    print("    {:.2f} bytes per fused sample, budget {}".format(perSample, BUDGET[name]))
+    return perSample <= BUDGET[name]
+
+
+def overflow( source ):
+    bus = sim.bus(source)
+    ahrs = AHRS(i2c=bus)
+    ahrs.gyroBias = None
+    ahrs.initFifo(200)
+    clock.advance(0.300)
+    dropped = ahrs.readFifo()
+    lowest = 1.0
+    samples = 0
+    fusionIMU = ahrs.fusionIMU
+    def check( accel, gyro, dt ):
+        nonlocal lowest
+        lowest = min(lowest, accel[2])
+        fusionIMU(accel, gyro, dt)
+    ahrs.fusionIMU = check
+    for _ in range(50):
+        clock.advance(0.020)
+        samples += ahrs.readFifo()
+    print("overflow  {} samples after a 300ms stall, {} overflows, then {} samples with the accel z at least {:.2f}g".format(
+        dropped, ahrs.fifoOverflows, samples, lowest))
+    return dropped == 0 and ahrs.fifoOverflows == 1 and samples > 150 and lowest > 0.8
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        CPU = float(sys.argv[1]) * 1e-6
+    source = motion.synthetic(seconds=SECONDS)
+    ok = True
+    for name, loop in (('step', step), ('fastStep', fastStep), ('fifo', fifo)):
+        ok &= run(name, loop, source)
+    ok &= overflow(source)
+    sys.exit(0 if ok else 1)
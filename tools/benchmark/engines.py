@@ -0,0 +1,78 @@
+"""
+Compares the fusion engines: cost per update and heading error
+
+Runs Madgwick and Mahony over the same data and reports the host CPU time per
+update and the heading error after the first 30 seconds of convergence.
+Without arguments the data is synthetic boat motion with a known truth, see
+../simulator/motion.py. A recording can be given as a csv file with the columns
+    t, ax, ay, az, gx, gy, gz, mx, my, mz, heading
+accel in g, gyro in degrees per second, calibrated mag, reference heading in degrees
+
+    py ./tools/benchmark/engines.py [recording.csv]
+"""
+import os
+import sys
+import time
+from array import array
+from math import radians, sqrt
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'simulator'))
+import sim
+import motion
+
+sim.install()
+from fusion.madgwick import Madgwick
+from fusion.mahony import Mahony
+
+CONVERGENCE = 30 # seconds excluded from the error statistics
+
+
+def synthetic():
+    return [(t, accel, gyro, mag, motion.ypr(q)[0]) for t, accel, gyro, mag, q in motion.boat(seconds=120)]
+
+def recording( filename ):
+    samples = []
+    with open(filename) as file:
+        for line in file:
+            try:
+                v = [float(x) for x in line.split(',')]
+            except ValueError:
+                continue # header
+            samples.append((v[0], tuple(v[1:4]), tuple(radians(x) for x in v[4:7]), tuple(v[7:10]), v[10]))
+    return samples
+
+
+def wrap( angle ):
+    return (angle + 180) % 360 - 180
+
+def run( name, engine, samples ):
+    q = array('f', [1.0, 0.0, 0.0, 0.0])
+    v = array('f', [0.0] * 9)
+    t0 = samples[0][0]
+    last = t0
+    errors = []
+    elapsed = 0.0
+
+    for t, accel, gyro, mag, heading in samples:
+        v[0:3] = array('f', accel)
+        v[3:6] = array('f', gyro)
+        v[6:9] = array('f', mag)
+        dt = t - last or 0.01
+        last = t
+
+        start = time.perf_counter()
+        engine.update(q, v, dt)
+        elapsed += time.perf_counter() - start
+
+        if t - t0 >= CONVERGENCE:
+            errors.append(wrap(motion.ypr(q)[0] - heading))
+
+    rms = sqrt(sum(e * e for e in errors) / len(errors))
+    print("{:8s} {:6.2f} us/update  heading error rms {:6.2f} max {:6.2f} degrees".format(
+        name, elapsed / len(samples) * 1e6, rms, max(abs(e) for e in errors)))
+
+
+if __name__ == '__main__':
+    samples = recording(sys.argv[1]) if len(sys.argv) > 1 else synthetic()
+    run("madgwick", Madgwick(), samples)
+    run("mahony", Mahony(), samples)
@@ -0,0 +1,54 @@
+"""
+NMEA against UBX NAV-PVT, bytes and parse time per fix
+
+Both harbour fixtures in ../gps/fixtures go through their driver epoch by
+epoch, drivers.gps.GPS for the 10Hz NMEA and drivers.ubx.UBX for the 20Hz
+UBX. A fix is a GGA, RMC and VTG set for NMEA, one NAV-PVT for UBX. Reports
+the bytes received per fix, the share of a 38400 baud line each output needs
+at 10 and 20Hz, and the host time per fix and per byte received. On the host
+the viper scanners run as plain Python, so the host times compare the work
+per byte rather than predict the ESP32.
+
+    py ./tools/benchmark/gps_parser.py
+"""
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'gps'))
+import replay
+import replay_ubx
+from drivers.gps import GPS
+from drivers.ubx import UBX
+
+ROUNDS = 5
+BAUDRATE = 38400
+
+
+def run( driver, chunks ):
+    """ seconds spent polling the driver after each epoch arrives """
+    uart = replay.Lines()
+    gps = driver(uart)
+    host = 0.0
+    for chunk in chunks:
+        uart.data += chunk
+        t = time.perf_counter()
+        gps.poll()
+        host += time.perf_counter() - t
+    return host, gps
+
+def measure( name, driver, filename, epochs, fixes ):
+    with open(filename, 'rb') as file:
+        data = file.read()
+    chunks = epochs(data)
+    host = min(run(driver, chunks)[0] for _ in range(ROUNDS))
+    n = fixes(run(driver, chunks)[1])
+    per = len(data) / n
+    print("{:5s} {:6.0f} bytes/fix  {:3.0f}% of {} baud at 10Hz, {:3.0f}% at 20Hz  {:6.1f}us/fix  {:5.2f}us/byte".format(
+        name, per, per * 10 * 10 / BAUDRATE * 100, BAUDRATE, per * 10 * 20 / BAUDRATE * 100,
+        host / n * 1e6, host / len(data) * 1e6))
+
+if __name__ == '__main__':
+    measure("NMEA", GPS, replay.FIXTURE, replay.epochs, lambda gps: gps.sentences // 3)
+    measure("UBX", UBX, replay_ubx.FIXTURE, replay_ubx.epochs, lambda gps: gps.frames)
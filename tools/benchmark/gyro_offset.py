@@ -0,0 +1,94 @@
+"""
+Gyro bias learning for zero rate offsets beyond the stillness gate
+
+fusion.gyrobias on a boat lying still with a gyro offset of OFFSETS degrees per
+second on each axis, plus sensor noise, with the plain filter and with the
+temperature table. Reports the time until the applied bias is within 0.05
+degrees per second of the offset, and the table bins filled.
+
+turn: with the bias learned, the boat turns steadily at 3 degrees per second on
+    flat water for 20 seconds. The turn must not be learned as bias.
+reseed: the bias was learned before the offset moved by 4 degrees per second,
+    after patience still samples it must be seeded anew.
+
+    py ./tools/benchmark/gyro_offset.py
+"""
+import os
+import sys
+import random
+from array import array
+from math import radians, degrees, sqrt
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'simulator'))
+import sim
+
+sim.install()
+from fusion.gyrobias import GyroBias
+from fusion.gyrotemp import GyroTemperature
+
+RATE = 100
+OFFSETS = (0.5, 2.5, 4.0, 10.0)
+NOISE = 0.1     # degrees per second
+SECONDS = 30
+
+
+def error( estimate, offset ):
+    return sqrt(sum((degrees(estimate.bias[k]) - offset[k]) ** 2 for k in range(3)))
+
+def still( estimate, offset, seconds, rnd, turn=0.0 ):
+    """ feeds still samples, returns the seconds until the bias is within 0.05 deg/s, None if never """
+    v = array('f', [0.0] * 6)
+    converged = None
+    for i in range(int(seconds * RATE)):
+        v[0] = rnd.gauss(0, 0.005)
+        v[1] = rnd.gauss(0, 0.005)
+        v[2] = 1.0 + rnd.gauss(0, 0.005)
+        v[3] = radians(offset[0] + rnd.gauss(0, NOISE))
+        v[4] = radians(offset[1] + rnd.gauss(0, NOISE))
+        v[5] = radians(offset[2] + turn + rnd.gauss(0, NOISE))
+        estimate.update(v)
+        if converged is None and error(estimate, offset) < 0.05:
+            converged = i / RATE
+    return converged
+
+def run( table ):
+    for size in OFFSETS:
+        rnd = random.Random(1)
+        offset = (size, -size * 0.6, size * 0.8)
+        estimate = GyroBias()
+        if table:
+            estimate.table = GyroTemperature()
+            estimate.temperature(30.0)
+        converged = still(estimate, offset, SECONDS, rnd)
+        filled = sum(1 for w in estimate.table.weight if w) if table else 0
+        print("{:5s} offset {:4.1f}deg/s: within 0.05deg/s after {}, {} table bins".format(
+            "table" if table else "plain", size,
+            "{:.1f}s".format(converged) if converged is not None else "never", filled))
+        assert converged is not None and (filled or not table)
+
+def turn():
+    rnd = random.Random(2)
+    offset = (2.5, -1.5, 2.0)
+    estimate = GyroBias()
+    still(estimate, offset, 5, rnd)
+    before = error(estimate, offset)
+    still(estimate, offset, 20, rnd, turn=3.0)
+    after = error(estimate, offset)
+    print("turn 3deg/s for 20s: bias error {:.3f} before, {:.3f}deg/s after".format(before, after))
+    assert after < 0.05, after
+
+def reseed():
+    rnd = random.Random(3)
+    estimate = GyroBias()
+    still(estimate, (0.5, 0.5, 0.5), 5, rnd)
+    offset = (4.5, 0.5, 0.5)
+    converged = still(estimate, offset, 2 * estimate.patience / RATE, rnd)
+    print("reseed after a 4deg/s jump: within 0.05deg/s after {:.1f}s, patience {:.0f}s".format(
+        converged, estimate.patience / RATE))
+    assert converged is not None
+
+if __name__ == '__main__':
+    run(False)
+    run(True)
+    turn()
+    reseed()
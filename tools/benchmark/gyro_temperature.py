@@ -0,0 +1,78 @@
+"""
+Gyro bias tracking over temperature, with and without the temperature table
+
+The simulated MPU9250 gets a gyro bias of TEMPCO degrees per second per degree C.
+The boat first lies still at the dock while the enclosure warms from COLD to HOT
+in the sun, then puts out to sea while it cools down again. At sea the boat is
+never still, so the plain estimate keeps the bias it learned at the dock when it
+was hot, while the table follows the temperature back down.
+
+Reports the rms error of the applied bias and of the heading, both at sea.
+AHRS runs unchanged through fastStep at RATE Hz on the simulator clock.
+
+    py ./tools/benchmark/gyro_temperature.py
+"""
+import os
+import sys
+from math import degrees, sqrt
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'simulator'))
+import sim
+
+sim.install()
+import clock
+import motion
+from drivers.ahrs import AHRS
+
+TEMPCO = (0.03, -0.02, 0.04)
+COLD = 20.0
+HOT = 50.0
+PHASE = 300     # seconds at the dock and at sea
+RATE = 100
+
+
+def run( name, table ):
+    dock = motion.still(yaw=90)
+    sea = motion.synthetic(seconds=PHASE, yaw=90, bias=(0.0, 0.0, 0.0))
+    bus = sim.bus(dock)
+    mpu = bus.devices[0x69]
+    ak = bus.devices[0x0C]
+    mpu.tempco = TEMPCO
+    mpu.temperature = COLD
+
+    ahrs = AHRS(i2c=bus)
+    ahrs.setMagCalibration((0, 0, 0), ((1, 0, 0), (0, 1, 0), (0, 0, 1)))
+    if not table:
+        ahrs.gyroBias.table = None
+
+    biasErrors = []
+    headingErrors = []
+    start = clock.now()
+    for phase in (0, 1):
+        if phase:
+            mpu.source = ak.source = sea
+        begin = clock.now()
+        while clock.now() - begin < PHASE:
+            t = clock.now() - begin
+            if phase:
+                mpu.temperature = HOT + (COLD - HOT) * t / PHASE
+            else:
+                mpu.temperature = COLD + (HOT - COLD) * t / PHASE
+            ahrs.fastStep()
+            clock.advance(1.0 / RATE - (clock.now() - start) % (1.0 / RATE))
+
+            if phase:
+                drift = mpu.temperature - 25.0
+                bias = ahrs.gyroBias.bias
+                biasErrors.append(sum((degrees(bias[k]) - TEMPCO[k] * drift) ** 2 for k in range(3)))
+                truth = motion.ypr(sea.truth[min(int(t * 100), len(sea.truth) - 1)])[0]
+                headingErrors.append((ahrs.yaw - truth + 180) % 360 - 180)
+
+    print("{:8s} bias error rms {:5.3f} deg/s  heading error rms {:5.2f} max {:5.2f} degrees".format(name,
+        sqrt(sum(biasErrors) / len(biasErrors)),
+        sqrt(sum(e * e for e in headingErrors) / len(headingErrors)), max(abs(e) for e in headingErrors)))
+
+
+if __name__ == '__main__':
+    run("plain", False)
+    run("table", True)
@@ -0,0 +1,183 @@
+"""
+control.heading on a simulated boat under system.scheduler
+
+The boat turns at a rate that follows the rudder with a first order lag, and
+a steady wind pushes its bow to port, which only the integral can hold
+against. The heading controller runs as the 50Hz control task next to a
+200Hz stand-in for the fusion, on the simulator clock, and reads the heading
+from a stand-in AHRS with sensor noise.
+
+turn: a 90 degree course change, rise time, overshoot, settling and the
+    steady error against the wind
+wrap: from 10 to 350 degrees, the boat must turn 20 degrees to port
+windup: a 180 degree turn that keeps the rudder hard over, with the clamping
+    anti-windup and with the integral left to run and the rudder clipped
+    after the controller
+tune: kp doubled mid turn, the rudder may move no faster than the slew limit
+slewing: a PID held back by its slew limit well inside its output limits,
+    the integral must not wind up past the output
+timing: the host time per tick and the scheduler view of the control task
+
+    py ./tools/benchmark/heading_control.py
+"""
+import os
+import sys
+import time
+import random
+from math import pi
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'simulator'))
+import sim
+
+sim.install()
+import clock
+from control.heading import Heading, SLEW
+from control.pid import PID
+from system.scheduler import Scheduler
+
+RATE = 50
+GAIN = 25.0     # degrees per second of turn per radian of rudder
+LAG = 1.2       # seconds, the turn rate lags the rudder
+WIND = -2.0     # degrees per second the wind turns the bow
+NOISE = 0.3     # degrees of heading noise
+STEP = 0.001    # seconds, the boat model step
+
+
+class Boat(object):
+    """ the stand-in AHRS, yaw in degrees """
+
+    def __init__( self, heading ):
+        self.heading = heading
+        self.rate = 0.0
+        self.rudder = 0.0
+        self.noise = random.Random(1)
+
+    @property
+    def yaw( self ):
+        return self.heading + self.noise.gauss(0, NOISE)
+
+    def actuate( self, rudder ):
+        self.rudder = max(-pi / 2, min(pi / 2, rudder))
+
+    def move( self, dt ):
+        self.rate += (GAIN * self.rudder - self.rate) * dt / LAG
+        self.heading = (self.heading + (self.rate + WIND) * dt) % 360
+
+
+def wrapped( a ):
+    return (a + 180) % 360 - 180
+
+def sail( boat, pilot, seconds, log=None, host=None ):
+    """ runs the scheduler and the boat for seconds, log gets (t, heading, rudder) per tick """
+    scheduler = Scheduler()
+    step = pilot.step
+    if host is not None:
+        def step():
+            t = time.perf_counter()
+            pilot.step()
+            host.append(time.perf_counter() - t)
+    control = scheduler.add(step, RATE, 'control')
+    scheduler.add(lambda: clock.advance(400e-6), 200, 'fusion')
+    start = clock.now()
+    while clock.now() - start < seconds:
+        runs = control.runs
+        wait = scheduler.poll()
+        if log is not None and control.runs != runs:
+            log.append((clock.now() - start, boat.heading, pilot.rudder))
+        dt = max(wait / 1000000, STEP) if wait > 0 else 0
+        if dt:
+            clock.advance(dt)
+            boat.move(dt)
+    return scheduler
+
+def turn():
+    boat = Boat(0.0)
+    pilot = Heading(boat, rate=RATE, actuator=boat.actuate)
+    pilot.course = 0.0
+    sail(boat, pilot, 20)   # settle on the first course
+    pilot.course = 90.0
+    log = []
+    sail(boat, pilot, 40, log)
+    error = [wrapped(h - 90) for t, h, r in log]
+    rise = next(t for t, h, r in log if wrapped(h - 90) > -9)
+    overshoot = max(error)
+    settled = max([t for t, e in zip((t for t, h, r in log), error) if abs(e) > 2] or [0])
+    steady = sum(abs(e) for e in error[-250:]) / 250
+    print("turn 0 to 90: rise {:.1f}s, overshoot {:.1f}deg, within 2deg after {:.1f}s, steady error {:.2f}deg in {}deg/s wind".format(
+        rise, overshoot, settled, steady, -WIND))
+    assert overshoot < 10 and steady < 1, (overshoot, steady)
+
+def wrap():
+    boat = Boat(10.0)
+    pilot = Heading(boat, rate=RATE, actuator=boat.actuate)
+    pilot.course = 10.0
+    sail(boat, pilot, 20)   # settle on the first course
+    pilot.course = 350.0
+    log = []
+    sail(boat, pilot, 30, log)
+    furthest = min(wrapped(h - 10) for t, h, r in log)
+    assert log[5][2] < 0 and furthest > -30, (log[5], furthest)
+    print("wrap 10 to 350: rudder {:.2f}rad to port, turned at most {:.1f}deg to port".format(log[5][2], -furthest))
+
+def windup():
+    results = []
+    for clamp in (True, False):
+        boat = Boat(0.0)
+        pilot = Heading(boat, rate=RATE, actuator=boat.actuate)
+        pilot.pid.ki = 0.01
+        if not clamp:
+            pilot.pid.low, pilot.pid.high = -1e9, 1e9   # the rudder clips it, the integral runs on
+        pilot.course = 0.0
+        sail(boat, pilot, 20)   # settle on the first course
+        pilot.course = 179.0
+        log = []
+        sail(boat, pilot, 60, log)
+        error = [wrapped(h - 179) for t, h, r in log]
+        results.append((max(error), max([t for (t, h, r), e in zip(log, error) if abs(e) > 2] or [0])))
+    print("windup 0 to 179, ki 0.01: overshoot {:.1f}deg, within 2deg after {:.1f}s with clamping, {:.1f}deg and {:.1f}s without".format(
+        *(results[0] + results[1])))
+    assert results[0][0] < results[1][0]
+
+def tune():
+    boat = Boat(0.0)
+    pilot = Heading(boat, rate=RATE, actuator=boat.actuate)
+    pilot.course = 0.0
+    sail(boat, pilot, 20)   # settle on the first course
+    pilot.course = 40.0
+    log = []
+    sail(boat, pilot, 1.0, log)
+    pilot.pid.tune(kp=pilot.pid.kp * 2)
+    sail(boat, pilot, 2.0, log)
+    jump = max(abs(b[2] - a[2]) for a, b in zip(log, log[1:]))
+    assert jump <= SLEW / RATE * 1.01, jump
+    print("tune: kp doubled mid turn, the rudder moved at most {:.3f}rad per tick, the slew limit is {:.3f}".format(jump, SLEW / RATE))
+
+def slewing():
+    pid = PID(0.0, ki=1.0, low=-10.0, high=10.0, slew=0.1)
+    for _ in range(RATE):
+        output = pid.update(1.0, 0.0, 1.0 / RATE)
+    print("slewing: 1s of error 1 with ki 1 and slew 0.1/s, output {:.3f}, integral {:.3f}".format(output, pid.integral))
+    assert pid.integral <= output + 1.0 / RATE, (output, pid.integral)
+    for _ in range(RATE):
+        output = pid.update(-1.0, 0.0, 1.0 / RATE)
+    assert output < 0, output   # back through 0 within a second, no wound up integral to work off
+
+def timing():
+    boat = Boat(0.0)
+    pilot = Heading(boat, rate=RATE, actuator=boat.actuate)
+    pilot.course = 45.0
+    host = []
+    scheduler = sail(boat, pilot, 30, host=host)
+    host.sort()
+    print("timing: host {:.1f}us per tick, p99 {:.1f}us, budget {}us".format(
+        1e6 * sum(host) / len(host), 1e6 * host[len(host) * 99 // 100], pilot.budget))
+    pilot.report()
+    scheduler.report()
+
+if __name__ == '__main__':
+    turn()
+    wrap()
+    windup()
+    tune()
+    slewing()
+    timing()
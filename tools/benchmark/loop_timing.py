@@ -0,0 +1,62 @@
+"""
+The loop timing histograms of system.timing with and without a busy neighbour
+
+Runs AHRS.fastStep on the simulator clock at RATE Hz with CPU seconds of
+modelled fusion compute per step, first alone and then sharing the CPU with a
+display task that takes DISPLAY seconds every REFRESH seconds, as the ILI9341
+redraw does. The I2C and fusion times stay put while the loop period grows a
+tail, which is what starvation of the filter looks like in AHRS.timing.
+
+    py ./tools/benchmark/loop_timing.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'simulator'))
+import sim
+
+sim.install()
+import clock
+import motion
+from drivers.ahrs import AHRS
+
+SECONDS = 10
+RATE = 500
+CPU = 400e-6        # modelled fusion compute per step, seconds
+DISPLAY = 0.030     # display redraw, seconds
+REFRESH = 0.250     # display redraw period, seconds
+
+
+def run( name, display ):
+    ahrs = AHRS(i2c=sim.bus(motion.synthetic(seconds=SECONDS)))
+    engine = ahrs.engine
+
+    class Busy(object):
+        """ the engine with its compute time on the simulator clock """
+        def update( self, q, v, dt ):
+            engine.update(q, v, dt)
+            clock.advance(CPU)
+        def updateIMU( self, q, v, dt ):
+            engine.updateIMU(q, v, dt)
+            clock.advance(CPU)
+    ahrs.engine = Busy()
+
+    start = clock.now()
+    redraw = start + REFRESH
+    ahrs.timing.reset()
+    while clock.now() - start < SECONDS:
+        ahrs.fastStep()
+        if display and clock.now() >= redraw:
+            clock.advance(DISPLAY)
+            redraw += REFRESH
+        clock.advance(1.0 / RATE - (clock.now() - start) % (1.0 / RATE))
+
+    print(name)
+    ahrs.timing.report()
+    print("period buckets", ahrs.timing.period.buckets())
+    print()
+
+
+if __name__ == '__main__':
+    run("fusion alone", False)
+    run("with the display", True)
@@ -0,0 +1,97 @@
+"""
+system.scheduler against the busy fusion loop of the old main.py
+
+The busy loop runs AHRS.fastStep back to back, as fusionTask on sleep_ms(0)
+did with nothing else to run. The scheduler runs the rates the pseudocode
+asks for: 200Hz fusion, 50Hz control, 5Hz navigation and 1Hz telemetry, each
+with its modelled CPU time on the simulator clock. The scheduler runs as its
+run() coroutine on the simulator uasyncio, next to a coroutine that wakes
+every 10ms as the other tasks of main.py would. The time the event loop sleeps
+with nothing to run is counted as idle, a wait spun out in utime.sleep_us is not.
+
+A second scheduled run makes the telemetry send take SLOW seconds, longer
+than a fusion period, to show the overruns and skipped releases.
+
+    py ./tools/benchmark/scheduler.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'simulator'))
+import sim
+
+sim.install()
+import clock
+import motion
+import uasyncio
+from drivers.ahrs import AHRS
+from system.scheduler import Scheduler
+
+SECONDS = 10
+CPU = 400e-6    # modelled fusion compute per step, seconds
+TASKS = (       # name, rate Hz, modelled CPU seconds per run
+    ('control', 50, 300e-6),
+    ('nav', 5, 2e-3),
+    ('telemetry', 1, 5e-3),
+)
+SLOW = 12e-3
+
+
+def busy( ahrs ):
+    def step():
+        ahrs.fastStep()
+        clock.advance(CPU)
+    return step
+
+def work( seconds ):
+    def run():
+        clock.advance(seconds)
+    return run
+
+
+def spin():
+    ahrs = AHRS(i2c=sim.bus(motion.synthetic(seconds=SECONDS)))
+    step = busy(ahrs)
+    start = clock.now()
+    steps = 0
+    while clock.now() - start < SECONDS:
+        step()
+        steps += 1
+    print("busy loop: {:.0f} fusion steps/s, idle 0%".format(steps / SECONDS))
+    print()
+
+
+def scheduled( name, telemetry ):
+    ahrs = AHRS(i2c=sim.bus(motion.synthetic(seconds=SECONDS)))
+    scheduler = Scheduler()
+    scheduler.add(busy(ahrs), 200, 'fusion')
+    for task, rate, seconds in TASKS:
+        scheduler.add(work(telemetry if task == 'telemetry' else seconds), rate, task)
+
+    wakes = []
+
+    async def other():
+        while True:
+            due = clock.now() + 0.01
+            await uasyncio.sleep_ms(10)
+            wakes.append(clock.now() - due)
+
+    async def main():
+        start = clock.now()
+        task = uasyncio.create_task(scheduler.run())
+        neighbour = uasyncio.create_task(other())
+        await uasyncio.sleep(SECONDS)
+        task.cancel()
+        neighbour.cancel()
+        return uasyncio.idle() / (clock.now() - start)
+
+    idle = uasyncio.run(main())
+    print("{}: idle {:.0f}%, a 10ms coroutine woke up to {:.2f}ms late".format(name, 100 * idle, 1000 * max(wakes)))
+    scheduler.report()
+    print()
+
+
+if __name__ == '__main__':
+    spin()
+    scheduled("scheduled", TASKS[-1][2])
+    scheduled("scheduled, {:.0f}ms telemetry".format(SLOW * 1000), SLOW)
@@ -0,0 +1,61 @@
+"""
+Checks of Bus.task of src/drivers/bus.py on the simulator clock
+
+wake: a read scheduled while task() sleeps towards a 1Hz read is issued
+    within a millisecond, not after the rest of the second.
+fast: a read at 2kHz, under a millisecond apart, is issued about once a
+    millisecond, as the sleeps are rounded up to one, with one poll per
+    transfer instead of task() spinning on sleep_ms(0) until it is due.
+
+    py ./tools/bus/check.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'simulator'))
+import sim
+
+sim.install()
+import clock
+import uasyncio
+from drivers.bus import Bus
+
+
+def transfers( bus, address ):
+    return bus.device(address).transactions
+
+async def wake():
+    bus = Bus(sim.bus())
+    bus.schedule(0x75, 0x70, 1, rate=1)
+    task = uasyncio.create_task(bus.task())
+    await uasyncio.sleep_ms(100)
+    assert transfers(bus, 0x75) == 1
+    issued = []
+    start = clock.now()
+    bus.schedule(0x75, 0x78, 1, rate=1, callback=lambda read: issued.append(clock.now()))
+    await uasyncio.sleep_ms(10)
+    task.cancel()
+    assert issued, "the new read waited for the 1Hz one"
+    delay = issued[0] - start
+    print("wake: the read scheduled 100ms into a 1s sleep was issued after {:.2f}ms".format(delay * 1000))
+    assert delay <= 0.001, delay
+
+async def fast():
+    bus = Bus(sim.bus())
+    bus.schedule(0x69, 0x3B, 14, rate=2000)
+    polls = [0]
+    poll = bus.poll
+    def counted():
+        polls[0] += 1
+        return poll()
+    bus.poll = counted
+    task = uasyncio.create_task(bus.task())
+    await uasyncio.sleep_ms(1000)
+    task.cancel()
+    n = transfers(bus, 0x69)
+    print("fast: {} transfers of a 2kHz read in 1s, {} polls".format(n, polls[0]))
+    assert 500 <= n <= 2000 and polls[0] <= 2 * n, (n, polls[0])
+
+if __name__ == '__main__':
+    uasyncio.run(wake())
+    uasyncio.run(fast())
@@ -0,0 +1,109 @@
+"""
+Checks the World Magnetic Model evaluator of wmmgrid.py
+
+potential: random coefficients up to degree 12, the declination of wmmgrid
+    against the numerical gradient of the scalar potential, built from the
+    Legendre polynomials of NumPy instead of the recursions of wmmgrid.
+    Needs no model file.
+values: with WMM.COF and NOAA's test value table from the same release, the
+    declination at every tabulated date, height and position. Rows are
+    whitespace separated, date in decimal years, height in km above the
+    ellipsoid, geodetic lat, lon in degrees, then the declination in the
+    column given, 4 in the TestValues.txt of the recent releases. Lines
+    starting with # are skipped.
+
+    py ./tools/declination/check.py [WMM.COF TestValues.txt [column]]
+"""
+import os
+import sys
+from math import factorial
+
+import numpy as np
+from numpy.polynomial import legendre
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import wmmgrid
+
+NMAX = 12
+TOLERANCE = 0.01    # degrees, NOAA rounds the test values to 0.01
+
+
+def schmidt( n, m, x ):
+    """ the Schmidt semi normalised P_n^m(x), as the m-th derivative of the Legendre polynomial """
+    c = np.zeros(n + 1)
+    c[n] = 1.0
+    p = (1 - x * x) ** (m / 2) * legendre.legval(x, legendre.legder(c, m)) if m else legendre.legval(x, c)
+    return p * np.sqrt(2.0 * factorial(n - m) / factorial(n + m)) if m else p
+
+def potential( model, r, theta, phi ):
+    """ the scalar potential in geocentric r km, colatitude and longitude in radians """
+    epoch, g, h, dg, dh = model
+    v = 0.0
+    for n in range(1, g.shape[0]):
+        for m in range(n + 1):
+            v = v + (wmmgrid.A / r) ** (n + 1) * (g[n, m] * np.cos(m * phi) + h[n, m] * np.sin(m * phi)) * \
+                schmidt(n, m, np.cos(theta))
+    return wmmgrid.A * v
+
+def gradient( model, lat, lon, height ):
+    """ the declination in degrees from the central differences of the potential """
+    lat, lon = np.radians(lat), np.radians(lon)
+    e2 = wmmgrid.WGS84_F * (2 - wmmgrid.WGS84_F)
+    rc = wmmgrid.WGS84_A / np.sqrt(1 - e2 * np.sin(lat) ** 2)
+    p = (rc + height) * np.cos(lat)
+    z = (rc * (1 - e2) + height) * np.sin(lat)
+    r = np.hypot(p, z)
+    theta = np.pi / 2 - np.arcsin(z / r)
+    d = 1e-6
+    north = (potential(model, r, theta + d, lon) - potential(model, r, theta - d, lon)) / (2 * d * r)
+    east = -(potential(model, r, theta, lon + d) - potential(model, r, theta, lon - d)) / (2 * d * r * np.sin(theta))
+    down = (potential(model, r + d * r, theta, lon) - potential(model, r - d * r, theta, lon)) / (2 * d * r)
+    psi = np.pi / 2 - theta - lat
+    north = north * np.cos(psi) - down * np.sin(psi)
+    return np.degrees(np.arctan2(east, north))
+
+def angle( a, b ):
+    return np.abs((a - b + 180) % 360 - 180)
+
+def check_potential():
+    rnd = np.random.default_rng(1)
+    g = np.zeros((NMAX + 1, NMAX + 1))
+    h = np.zeros_like(g)
+    for n in range(1, NMAX + 1):
+        # the field falls off with the degree roughly as the real one does
+        g[n, :n + 1] = rnd.normal(0, 30000 / 4 ** n, n + 1)
+        h[n, 1:n + 1] = rnd.normal(0, 30000 / 4 ** n, n)
+    model = (2025.0, g, h, np.zeros_like(g), np.zeros_like(h))
+    lat = rnd.uniform(-89, 89, 200)
+    lon = rnd.uniform(-180, 180, 200)
+    height = rnd.choice([0.0, 100.0], 200)
+    errors = angle(np.array([wmmgrid.declination(model, a, b, height=c) for a, b, c in zip(lat, lon, height)]),
+                   np.array([gradient(model, a, b, c) for a, b, c in zip(lat, lon, height)]))
+    print("potential: degree {} random model, {} points, worst declination difference {:.1e} degrees".format(
+        NMAX, len(lat), errors.max()))
+    assert errors.max() < 1e-4, errors.max()
+
+def check_values( cof, values, column=4 ):
+    model = wmmgrid.load(cof)
+    worst = 0.0
+    rows = 0
+    with open(values) as file:
+        for line in file:
+            fields = line.split()
+            if not fields or fields[0].startswith('#'):
+                continue
+            year, height, lat, lon = (float(x) for x in fields[:4])
+            expected = float(fields[column])
+            error = angle(float(wmmgrid.declination(model, lat, lon, year, height)), expected)
+            worst = max(worst, error)
+            rows += 1
+            if error > TOLERANCE:
+                print("  {} {}km {} {}: {:.2f} expected {:.2f}".format(year, height, lat, lon,
+                    float(wmmgrid.declination(model, lat, lon, year, height)), expected))
+    print("values: {} test values, worst declination difference {:.3f} degrees".format(rows, worst))
+    assert rows and worst <= TOLERANCE, worst
+
+if __name__ == '__main__':
+    check_potential()
+    if len(sys.argv) > 2:
+        check_values(sys.argv[1], sys.argv[2], int(sys.argv[3]) if len(sys.argv) > 3 else 4)
@@ -0,0 +1,154 @@
+"""
+Writes the declination table for src/navigation/declination.py
+
+Evaluates the World Magnetic Model at sea level on a regular lat/lon grid and
+stores the declination in centidegrees. The model coefficients are NOAA's
+WMM.COF, download the current one from
+https://www.ncei.noaa.gov/products/world-magnetic-model and regenerate the
+table about once a year, the declination drifts by up to 0.2 degrees a year.
+The model is public domain. The table is not in the tree yet: run
+tools/declination/check.py against NOAA's test values first, then write
+src/declination.bin and commit it, upload.bat puts it on the device when it
+exists. Without it the device heading stays magnetic.
+
+Cells are step degrees, 5 degrees is 5.4kB and 2 degrees 33kB. The interpolation
+error grows with the field gradient and is large only in the cells around the
+magnetic poles, where the declination turns through all directions. The tool
+reports the error at the cell centres, looked up through the device code.
+
+    py ./tools/declination/wmmgrid.py WMM.COF [src/declination.bin] [step] [year]
+"""
+import os
+import sys
+from struct import pack
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'simulator'))
+import sim
+
+sim.install()
+from navigation.declination import MAGIC, VERSION, HEADER, Declination
+
+TABLE = os.path.join(sim.SRC, 'declination.bin')
+
+A = 6371.2                  # geomagnetic reference radius, km
+WGS84_A = 6378.137          # km
+WGS84_F = 1 / 298.257223563
+POLE = 89.99                # the declination is undefined at the geographic poles
+
+
+def load( filename ):
+    """ returns the epoch, g, h, dg, dh as (n+1, n+1) arrays indexed [n, m] """
+    with open(filename) as file:
+        lines = file.read().splitlines()
+    epoch = float(lines[0].split()[0])
+    rows = []
+    for line in lines[1:]:
+        fields = line.split()
+        if not fields or fields[0].startswith('9999'):
+            break
+        rows.append([float(x) for x in fields[:6]])
+    nmax = int(max(r[0] for r in rows))
+    g, h, dg, dh = (np.zeros((nmax + 1, nmax + 1)) for _ in range(4))
+    for n, m, gnm, hnm, dgnm, dhnm in rows:
+        n, m = int(n), int(m)
+        g[n, m], h[n, m], dg[n, m], dh[n, m] = gnm, hnm, dgnm, dhnm
+    return epoch, g, h, dg, dh
+
+
+def declination( model, lat, lon, year=None, height=0.0 ):
+    """ declination in degrees for arrays of geodetic lat, lon in degrees, height in km above the ellipsoid """
+    epoch, g, h, dg, dh = model
+    if year is not None:
+        g = g + (year - epoch) * dg
+        h = h + (year - epoch) * dh
+    nmax = g.shape[0] - 1
+
+    lat, lon = np.broadcast_arrays(np.radians(np.clip(lat, -POLE, POLE)), np.radians(lon))
+
+    # geodetic to geocentric on the ellipsoid
+    e2 = WGS84_F * (2 - WGS84_F)
+    rc = WGS84_A / np.sqrt(1 - e2 * np.sin(lat) ** 2)
+    p = (rc + height) * np.cos(lat)
+    z = (rc * (1 - e2) + height) * np.sin(lat)
+    r = np.hypot(p, z)
+    latc = np.arcsin(z / r)
+
+    x = np.sin(latc)                # cos of the colatitude
+    s = np.cos(latc)                # sin of the colatitude
+
+    # Schmidt semi normalised associated Legendre functions and their colatitude derivatives
+    P = np.zeros((nmax + 1, nmax + 1) + np.shape(x))
+    dP = np.zeros_like(P)
+    P[0, 0] = 1.0
+    for m in range(1, nmax + 1):
+        P[m, m] = P[m - 1, m - 1] * s * (2 * m - 1)
+    for m in range(nmax):
+        P[m + 1, m] = x * (2 * m + 1) * P[m, m]
+        for n in range(m + 2, nmax + 1):
+            P[n, m] = ((2 * n - 1) * x * P[n - 1, m] - (n + m - 1) * P[n - 2, m]) / (n - m)
+    for n in range(1, nmax + 1):
+        for m in range(n + 1):
+            dP[n, m] = (n * x * P[n, m] - (n + m) * P[n - 1, m]) / s
+    for n in range(1, nmax + 1):
+        for m in range(1, n + 1):
+            k = np.sqrt(2.0 * np.prod(np.arange(n - m + 1, n + m + 1, dtype=np.float64)) ** -1)
+            P[n, m] *= k
+            dP[n, m] *= k
+
+    north = np.zeros_like(x)
+    east = np.zeros_like(x)
+    down = np.zeros_like(x)
+    for n in range(1, nmax + 1):
+        scale = (A / r) ** (n + 2)
+        for m in range(n + 1):
+            c = np.cos(m * lon)
+            sm = np.sin(m * lon)
+            north += scale * (g[n, m] * c + h[n, m] * sm) * dP[n, m]
+            east += scale * m * (g[n, m] * sm - h[n, m] * c) * P[n, m] / s
+            down -= scale * (n + 1) * (g[n, m] * c + h[n, m] * sm) * P[n, m]
+
+    # rotate from the geocentric to the geodetic north, east is unchanged
+    psi = latc - lat
+    north = north * np.cos(psi) - down * np.sin(psi)
+    return np.degrees(np.arctan2(east, north))
+
+
+def write( filename, model, step=5.0, year=None ):
+    """ writes the global table, returns the grid in degrees """
+    epoch = model[0] if year is None else year
+    lats = np.arange(-90.0, 90.0 + step / 2, step)
+    lons = np.arange(-180.0, 180.0 + step / 2, step)
+    grid = declination(model, lats[:, None], lons[None, :], epoch)
+    with open(filename, 'wb') as file:
+        file.write(pack(HEADER, MAGIC, VERSION, len(lats), len(lons), lats[0], lons[0], step, epoch))
+        file.write(np.round(grid * 100).astype('<i2').tobytes())
+    return grid
+
+
+def check( filename, model, step, year=None ):
+    """ the interpolation error at the cell centres through the device lookup, away from the poles """
+    table = Declination(filename)
+    lats = np.arange(-80.0 + step / 2, 80.0, step)
+    lons = np.arange(-180.0 + step / 2, 180.0, step)
+    truth = declination(model, lats[:, None], lons[None, :], table.epoch if year is None else year)
+    errors = np.array([[table.lookup(lat, lon) for lon in lons] for lat in lats]) - truth
+    errors = (errors + 180) % 360 - 180
+    errors = np.abs(errors)
+    return np.sqrt(np.mean(errors ** 2)), np.percentile(errors, 99), errors.max()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("usage: py ./tools/declination/wmmgrid.py WMM.COF [src/declination.bin] [step] [year]")
+        sys.exit(1)
+    filename = os.path.normpath(sys.argv[2]) if len(sys.argv) > 2 else os.path.normpath(TABLE)
+    step = float(sys.argv[3]) if len(sys.argv) > 3 else 5.0
+    year = float(sys.argv[4]) if len(sys.argv) > 4 else None
+    model = load(sys.argv[1])
+    grid = write(filename, model, step, year)
+    rms, p99, worst = check(filename, model, step, year)
+    print("{}: {} x {} grid, {} bytes, epoch {:.1f}".format(
+        filename, grid.shape[0], grid.shape[1], os.path.getsize(filename), year or model[0]))
+    print("interpolation error between 80S and 80N: rms {:.2f} 99% {:.2f} max {:.2f} degrees".format(rms, p99, worst))
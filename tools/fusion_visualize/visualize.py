@@ -1,14 +1,22 @@
 """
 PyTeapot module for drawing rotating cube using OpenGL as per
 quaternion or yaw, pitch, roll angles received over serial port.
+The quaternion arrives in the binary telemetry frames of src/networking/telemetry.py
 """
 
+import os
+import sys
 import pygame
 import math
+import struct
+import binascii
 from OpenGL.GL import *
 from OpenGL.GLU import *
 from pygame.locals import *
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'src'))
+from qmath import batch
+
 useSerial = True # set true for using serial for data transmission, false for wifi
 useQuat = True   # set true for using quaternions, false for using y,p,r angles
 
@@ -51,6 +59,7 @@ def main():
         except Exception:
             pass
     print("fps: %d" % ((frames*1000)/(pygame.time.get_ticks()-ticks)))
+    print("telemetry frames: %d dropped: %d corrupt: %d" % (decoder.frames, decoder.dropped, decoder.corrupt))
     if(useSerial):
         ser.close()
 
@@ -78,52 +87,94 @@ def init():
     glHint(GL_PERSPECTIVE_CORRECTION_HINT, GL_NICEST)
 
 
-def cleanSerialBegin():
-    if(useQuat):
-        try:
-            line = ser.readline().decode('UTF-8').replace('\n', '')
-            w = float(line.split('w')[1])
-            nx = float(line.split('a')[1])
-            ny = float(line.split('b')[1])
-            nz = float(line.split('c')[1])
-        except Exception:
-            pass
-    else:
-        try:
-            line = ser.readline().decode('UTF-8').replace('\n', '')
-            yaw = float(line.split('y')[1])
-            pitch = float(line.split('p')[1])
-            roll = float(line.split('r')[1])
-        except Exception:
-            pass
+class Decoder(object):
+    """
+    Decodes the binary telemetry frames
+    sync 0xAA 0x55, uint16 sequence, uint32 ticks_ms, 4 x int16 quaternion / 32767,
+    int16 declination in centidegrees, CRC-16/CCITT-FALSE
+    and the loop timing frames between them
+    sync 0xAA 0x56, uint32 ticks_ms, uint16 loops, p50, p99 and max uint16 microseconds
+    of the loop period, I2C and fusion time, CRC-16/CCITT-FALSE
+    """
+
+    SYNC = b'\xAA\x55'
+    SIZE = 20
+    TIMINGSYNC = b'\xAA\x56'
+    TIMINGSIZE = 28
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.seq = None
+        self.frames = 0
+        self.dropped = 0
+        self.corrupt = 0
+        self.declination = 0.0 # of the latest frame, degrees
+        self.timing = None # of the latest timing frame, {'loops': n, 'period': (p50, p99, max), 'i2c': .., 'fusion': ..}
+
+    def find(self):
+        """ the offset and size of the first frame start in the buffer, -1 when there is none """
+        start = self.buffer.find(b'\xAA')
+        while 0 <= start < len(self.buffer) - 1:
+            sync = bytes(self.buffer[start:start + 2])
+            if sync == self.SYNC:
+                return start, self.SIZE
+            if sync == self.TIMINGSYNC:
+                return start, self.TIMINGSIZE
+            start = self.buffer.find(b'\xAA', start + 1)
+        return -1, 0
+
+    def feed(self, data):
+        """ returns a list of (sequence, ticks_ms, [w, x, y, z], declination) for the complete frames in data """
+        self.buffer += data
+        frames = []
+        while True:
+            start, size = self.find()
+            if start < 0:
+                del self.buffer[:-1]
+                break
+            if len(self.buffer) - start < size:
+                del self.buffer[:start]
+                break
+            frame = self.buffer[start:start + size]
+            if binascii.crc_hqx(bytes(frame[2:size - 2]), 0xFFFF) != struct.unpack_from('<H', frame, size - 2)[0]:
+                # not a frame, resync after this sync pattern
+                self.corrupt += 1
+                del self.buffer[:start + 1]
+                continue
+            del self.buffer[:start + size]
+            if size == self.TIMINGSIZE:
+                v = struct.unpack_from('<IH9H', frame, 2)
+                self.timing = {'ticks': v[0], 'loops': v[1], 'period': v[2:5], 'i2c': v[5:8], 'fusion': v[8:11]}
+                continue
+            seq, ticks, w, x, y, z, declination = struct.unpack_from('<HIhhhhh', frame, 2)
+            if self.seq is not None:
+                self.dropped += (seq - self.seq - 1) & 0xFFFF
+            self.seq = seq
+            self.frames += 1
+            self.declination = declination / 100
+            frames.append((seq, ticks, [w / 32767, x / 32767, y / 32767, z / 32767], declination / 100))
+        return frames
+
+decoder = Decoder()
 
 
 def read_data():
     try:
-        if(useSerial):
-            
-            ser.reset_input_buffer()
-            cleanSerialBegin()
-            line = ser.readline().decode('UTF-8').replace('\n', '')
-            print(line)
-    
-        else:
-            # Waiting for data from udp port 5005
-            data, addr = sock.recvfrom(1024) # buffer size is 1024 bytes
-            line = data.decode('UTF-8').replace('\n', '')
-            print(line)
-                    
+        frames = []
+        while not frames:
+            if(useSerial):
+                frames = decoder.feed(ser.read(max(1, ser.in_waiting)))
+            else:
+                # Waiting for data from udp port 5005
+                data, addr = sock.recvfrom(1024) # buffer size is 1024 bytes
+                frames = decoder.feed(data)
+
+        # only the latest attitude is drawn
+        seq, ticks, q, declination = frames[-1]
         if(useQuat):
-            w = float(line.split('w')[1])
-            nx = float(line.split('a')[1])
-            ny = float(line.split('b')[1])
-            nz = float(line.split('c')[1])
-            return [w, nx, ny, nz]
+            return q
         else:
-            yaw = float(line.split('y')[1])
-            pitch = float(line.split('p')[1])
-            roll = float(line.split('r')[1])
-            return [yaw, pitch, roll]
+            return quat_to_ypr(q)
     
     except Exception:
         pass
@@ -137,6 +188,10 @@ def draw(w, nx, ny, nz):
     drawText((-2.6, 1.8, 2), "PyTeapot", 18)
     drawText((-2.6, 1.6, 2), "Module to visualize quaternion or Euler angles data", 16)
     drawText((-2.6, -2, 2), "Press Escape to exit.", 16)
+    if decoder.timing is not None:
+        t = decoder.timing
+        drawText((-2.6, -1.6, 2), "Loop p99 %dus max %dus, I2C p99 %dus, fusion p99 %dus" % (
+            t['period'][1], t['period'][2], t['i2c'][1], t['fusion'][1]), 16)
 
     if(useQuat):
         [yaw, pitch , roll] = quat_to_ypr([w, nx, ny, nz])
@@ -198,15 +253,9 @@ def drawText(position, textString, size):
     glDrawPixels(textSurface.get_width(), textSurface.get_height(), GL_RGBA, GL_UNSIGNED_BYTE, textData)
 
 def quat_to_ypr(q):
-    yaw   = math.atan2(2.0 * (q[1] * q[2] + q[0] * q[3]), q[0] * q[0] + q[1] * q[1] - q[2] * q[2] - q[3] * q[3])
-    pitch = -math.asin(2.0 * (q[1] * q[3] - q[0] * q[2]))
-    roll  = math.atan2(2.0 * (q[0] * q[1] + q[2] * q[3]), q[0] * q[0] - q[1] * q[1] - q[2] * q[2] + q[3] * q[3])
-    pitch *= 180.0 / math.pi
-    yaw   *= 180.0 / math.pi
-    yaw   -= -0.13  # Declination at Chandrapur, Maharashtra is - 0 degress 13 min
-    roll  *= 180.0 / math.pi
+    yaw, pitch, roll = batch.euler(q)
+    yaw += decoder.declination  # sent by the device from its position, true north
     return [yaw, pitch, roll]
 
-
 if __name__ == '__main__':
     main()
\ No newline at end of file
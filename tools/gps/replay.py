@@ -0,0 +1,221 @@
+"""
+Replays NMEA recordings through src/drivers/gps.py on the host
+
+check: feeds the recording sentence by sentence and compares the fix after
+    every GGA, RMC and VTG with a plain str.split parse of the same sentence.
+    Sentences with a bad checksum must be dropped and counted. A receiver
+    sending GGA only must get a valid fix from the fix quality.
+stream: sends each 10Hz epoch of the recording down a simulated UART at the
+    baud rate and polls the driver at RATE Hz on the simulator clock, as the
+    scheduler would. Reports how much of the line the output needs, the backlog
+    when the line is too slow, the bytes lost to a full receive buffer, the
+    sentences parsed and the host time per poll.
+
+    py ./tools/gps/replay.py [recording.nmea] [baudrate]
+    py ./tools/gps/replay.py --synthesize fixtures/harbour_10hz.nmea
+
+The fixture in ./fixtures is synthetic, a boat leaving harbour at 10Hz in the
+sentence mix of a u-blox M8 (GGA, GSA, RMC and VTG every epoch, GSV every second)
+with a few corrupted sentences. Recordings off a real receiver replay the same way.
+"""
+import os
+import sys
+import time
+from math import sin, cos, radians
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'simulator'))
+import sim
+
+sim.install()
+import clock
+from drivers.gps import GPS
+
+FIXTURE = os.path.join(HERE, 'fixtures', 'harbour_10hz.nmea')
+RATE = 10
+BAUDRATE = 38400
+
+
+def checksum( body ):
+    x = 0
+    for c in body.encode():
+        x ^= c
+    return x
+
+def sentence( body ):
+    return '${}*{:02X}\r\n'.format(body, checksum(body))
+
+
+class Lines(object):
+    """ a UART holding whatever was put in data """
+
+    def __init__( self ):
+        self.data = bytearray()
+
+    def readinto( self, buf ):
+        n = min(len(buf), len(self.data))
+        buf[:n] = self.data[:n]
+        del self.data[:n]
+        return n
+
+
+def reference( line ):
+    """ the fields the driver keeps, parsed with str.split, or None for other or corrupt sentences """
+    line = line.strip()
+    if not line.startswith('$') or '*' not in line:
+        return None
+    body, sent = line[1:].split('*')
+    if checksum(body) != int(sent, 16):
+        return 'corrupt'
+    f = body.split(',')
+    kind = f[0][2:]
+
+    def coordinate( value, hemisphere ):
+        dot = value.index('.')
+        degrees = int(value[:dot - 2]) + float(value[dot - 2:]) / 60
+        return -degrees if hemisphere in 'SW' else degrees
+
+    def seconds( value ):
+        return int(value[0:2]) * 3600 + int(value[2:4]) * 60 + float(value[4:])
+
+    if kind == 'GGA':
+        return {'time': seconds(f[1]), 'lat': coordinate(f[2], f[3]), 'lon': coordinate(f[4], f[5]),
+            'quality': int(f[6]), 'valid': int(f[6]) > 0, 'satellites': int(f[7]), 'hdop': float(f[8]), 'altitude': float(f[9])}
+    if kind == 'RMC':
+        fix = {'time': seconds(f[1]), 'valid': f[2] == 'A', 'lat': coordinate(f[3], f[4]),
+            'lon': coordinate(f[5], f[6]), 'speed': float(f[7]) * 1852 / 3600, 'date': int(f[9])}
+        if f[8]:
+            fix['course'] = float(f[8]) # empty while stationary, the last course stays
+        return fix
+    if kind == 'VTG':
+        fix = {'speed': float(f[5]) * 1852 / 3600}
+        if f[1]:
+            fix['course'] = float(f[1])
+        return fix
+    return None
+
+
+TOLERANCE = {'lat': 1e-7, 'lon': 1e-7, 'time': 1e-3, 'speed': 1e-3, 'course': 0.01, 'hdop': 0.01, 'altitude': 1e-3}
+
+def check( filename ):
+    uart = Lines()
+    gps = GPS(uart)
+    compared = corrupt = 0
+    with open(filename) as file:
+        for line in file:
+            uart.data += line.encode()
+            errors = gps.errors
+            parsed = gps.poll()
+            expect = reference(line)
+            if expect == 'corrupt':
+                assert parsed == 0 and gps.errors == errors + 1, line
+                corrupt += 1
+                continue
+            assert parsed == (expect is not None), line
+            if expect is None:
+                continue
+            fix = gps.fix
+            for key, value in expect.items():
+                got = fix.data[fix.TIME] / 1000 if key == 'time' else fix.data[fix.DATE] if key == 'date' else getattr(fix, key)
+                assert abs(got - value) <= TOLERANCE.get(key, 0), (line, key, got, value)
+            compared += 1
+    print("check: {} sentences match the reference parse, {} corrupt sentences dropped".format(compared, corrupt))
+
+    gps = GPS(uart)
+    for quality in (1, 0, 2):
+        uart.data += sentence('GPGGA,101500.00,5332.79120,N,00958.01400,E,{},08,1.10,3.2,M,44.2,M,,'.format(
+            quality)).encode()
+        assert gps.poll() == 1 and gps.fix.valid == (quality > 0), quality
+    print("check: GGA only, the fix is valid with the fix quality")
+
+
+def epochs( data ):
+    """ splits a recording into the output of each epoch, every epoch starts with its GGA """
+    chunks = []
+    for line in data.splitlines(True):
+        if line[3:6] == b'GGA' or not chunks:
+            chunks.append(bytearray())
+        chunks[-1] += line
+    return chunks
+
+def stream( filename, baudrate=BAUDRATE, rate=10 ):
+    with open(filename, 'rb') as file:
+        data = file.read()
+    chunks = epochs(data)
+    uart = sim.uart(b'', baudrate=baudrate)
+    gps = GPS()
+    start = clock.now()
+    polls = parsed = 0
+    backlog = 0
+    host = 0.0
+    tick = 0
+    # 1ms ticks: the receiver sends an epoch every 1 / rate seconds, the driver polls at RATE Hz
+    while chunks or uart.pending() or uart.any():
+        if chunks and tick % (1000 // rate) == 0:
+            backlog = max(backlog, uart.pending())
+            uart.feed(chunks.pop(0))
+        if tick % (1000 // RATE) == 0:
+            t = time.perf_counter()
+            parsed += gps.poll()
+            host += time.perf_counter() - t
+            polls += 1
+        clock.advance(0.001)
+        tick += 1
+    seconds = clock.now() - start
+    print("{:6d} baud: {:.0f}% of the line, {} bytes lost, {:.0f}ms largest backlog at an epoch start".format(
+        baudrate, 100 * len(data) * 10 / baudrate / seconds, uart.lost, backlog * 10000 / baudrate))
+    print("    {} polls at {}Hz, {} sentences parsed, {} dropped, {:.0f}us host time per poll".format(
+        polls, RATE, parsed, gps.errors, host / polls * 1e6))
+
+
+def track( seconds=20, rate=10 ):
+    """ the synthetic boat accelerating out of harbour on a slow turn, (i, t, lat, lon, speed, course) per epoch """
+    lat, lon = 53.54652, 9.96690
+    speed = 0.0
+    course = 250.0
+    for i in range(seconds * rate):
+        t = i / rate
+        speed = min(3.0, speed + 0.2 / rate)
+        course = (course + 1.5 / rate) % 360
+        lat += speed / rate * cos(radians(course)) / 111320
+        lon += speed / rate * sin(radians(course)) / (111320 * cos(radians(lat)))
+        yield i, t, lat, lon, speed, course
+
+def synthesize( filename, seconds=20, rate=10 ):
+    """ writes the synthetic fixture """
+    lines = []
+    for i, t, lat, lon, speed, course in track(seconds, rate):
+        hms = '{:02d}{:02d}{:05.2f}'.format(10, 15 + int(t) // 60, t % 60)
+        la = '{:02d}{:08.5f}'.format(int(lat), (lat - int(lat)) * 60)
+        lo = '{:03d}{:08.5f}'.format(int(lon), (lon - int(lon)) * 60)
+        knots = speed * 3600 / 1852
+        lines.append(sentence('GNGGA,{},{},N,{},E,1,{:02d},{:.2f},{:.1f},M,44.2,M,,'.format(
+            hms, la, lo, 9 + i // 50, 1.1 - i / 2000, 3.2 + 0.1 * sin(t))))
+        lines.append(sentence('GNGSA,A,3,02,05,07,13,15,18,20,23,30,,,,1.95,1.10,1.61'))
+        lines.append(sentence('GNRMC,{},A,{},N,{},E,{:.3f},{},180418,,,A'.format(
+            hms, la, lo, knots, '{:.2f}'.format(course) if speed > 0.3 else '')))
+        lines.append(sentence('GNVTG,{},T,,M,{:.3f},N,{:.3f},K,A'.format(
+            '{:.2f}'.format(course) if speed > 0.3 else '', knots, speed * 3.6)))
+        if i % rate == 0:
+            for k in range(3):
+                lines.append(sentence('GPGSV,3,{},11,{:02d},63,078,42,{:02d},41,294,38,{:02d},17,138,33,{:02d},08,041,'.format(
+                    k + 1, 2 + 4 * k, 3 + 4 * k, 4 + 4 * k, 5 + 4 * k)))
+        if i in (37, 121):
+            # a corrupted sentence, as after a dropped byte
+            lines[-2] = lines[-2][:20] + lines[-2][21:]
+    with open(filename, 'w', newline='') as file:
+        file.write(''.join(lines))
+    print("wrote {} sentences to {}".format(len(lines), filename))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2 and sys.argv[1] == '--synthesize':
+        synthesize(sys.argv[2])
+        sys.exit()
+    filename = sys.argv[1] if len(sys.argv) > 1 else FIXTURE
+    check(filename)
+    if len(sys.argv) > 2:
+        stream(filename, int(sys.argv[2]))
+    else:
+        for baudrate in (9600, 38400, 115200):
+            stream(filename, baudrate)
@@ -0,0 +1,212 @@
+"""
+Replays UBX recordings through src/drivers/ubx.py on the host
+
+check: feeds the recording in random sized pieces, so frames straddle polls and
+    the end of the ring, and compares the fix after every NAV-PVT with a
+    struct.unpack_from decode of the same frame. Frames with a bad checksum
+    must be dropped and counted. Then checks the configuration messages
+    configure() sends.
+stream: sends each epoch of the recording down a simulated UART at the baud
+    rate and polls the driver at the navigation rate on the simulator clock.
+    Reports how much of the line the output needs, the bytes lost, the frames
+    decoded and the host time per poll.
+
+    py ./tools/gps/replay_ubx.py [recording.ubx] [baudrate]
+    py ./tools/gps/replay_ubx.py --synthesize fixtures/harbour_20hz.ubx
+
+The fixture in ./fixtures is the harbour track of replay.py at 20Hz as a
+u-blox M8 sends it after configure(): the NMEA of the epoch before the switch,
+the three acknowledgements, NAV-PVT every epoch and a 1Hz NAV-SAT the driver
+skips, with two corrupted frames.
+"""
+import os
+import sys
+import time
+import random
+import struct
+from math import sin, cos, radians
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+from replay import Lines, track, sim
+
+import clock
+from drivers.ubx import UBX, message, NAV_PVT, ACK_ACK, CFG_PRT, CFG_MSG, CFG_RATE
+
+FIXTURE = os.path.join(HERE, 'fixtures', 'harbour_20hz.ubx')
+RATE = 20
+BAUDRATE = 38400
+
+# NAV-PVT payload, 92 bytes
+PVT = struct.Struct('<IHBBBBBBIiBBBBiiiiIIiiiiiIIHB5sihH')
+NAV_SAT = 0x0135
+
+
+def frames( data ):
+    """ (kind, payload, good) of every frame in data, following the lengths """
+    found = []
+    i = 0
+    while i + 8 <= len(data):
+        if data[i] != 0xB5 or data[i + 1] != 0x62:
+            i += 1
+            continue
+        n = data[i + 4] | data[i + 5] << 8
+        frame = bytes(data[i:i + n + 8])
+        found.append((frame[2] << 8 | frame[3], frame[6:-2], message(frame[2] << 8 | frame[3], frame[6:-2]) == frame))
+        i += n + 8
+    return found
+
+def reference( payload ):
+    """ the Fix fields of a NAV-PVT payload """
+    f = PVT.unpack_from(payload)
+    (itow, year, month, day, hour, minute, second, valid, tacc, nano, kind, flags, flags2, satellites,
+        lon, lat, height, msl, hacc, vacc, north, east, down, speed, heading, sacc, headacc, pdop) = f[:28]
+    return {'time': hour * 3600 + minute * 60 + second + nano / 1e9, 'date': day * 10000 + month * 100 + year % 100,
+        'lat': lat / 1e7, 'lon': lon / 1e7, 'altitude': msl / 1000, 'accuracy': hacc / 1000,
+        'north': north / 1000, 'east': east / 1000, 'speed': speed / 1000, 'course': heading / 1e5,
+        'satellites': satellites, 'hdop': pdop / 100, 'valid': bool(flags & 1) and 2 <= kind <= 4}
+
+
+TOLERANCE = {'lat': 1e-7, 'lon': 1e-7, 'time': 1e-3, 'course': 0.01}
+
+def check( filename ):
+    with open(filename, 'rb') as file:
+        data = file.read()
+    expect = [(kind, payload) for kind, payload, good in frames(data) if good and kind == NAV_PVT]
+    corrupt = sum(1 for kind, payload, good in frames(data) if not good)
+    acks = sum(1 for kind, payload, good in frames(data) if good and kind == ACK_ACK)
+    uart = Lines()
+    gps = UBX(uart)
+    rnd = random.Random(1)
+    fed = 0
+    while fed < len(data):
+        n = rnd.randint(1, 300)
+        uart.data += data[fed:fed + n]
+        fed += n
+        gps.poll()
+        # every good NAV-PVT that has fully arrived is decoded, the fix is the last of them
+        arrived = [payload for kind, payload, good in frames(data[:fed]) if good and kind == NAV_PVT]
+        assert gps.frames == len(arrived), (fed, gps.frames, len(arrived))
+        if arrived:
+            fix = gps.fix
+            for key, value in reference(arrived[-1]).items():
+                got = fix.data[fix.TIME] / 1000 if key == 'time' else fix.data[fix.DATE] if key == 'date' else getattr(fix, key)
+                assert abs(got - value) <= TOLERANCE.get(key, 1e-9), (fed, key, got, value)
+    assert gps.errors == corrupt and gps.acks == acks, (gps.errors, corrupt, gps.acks)
+    print("check: {} NAV-PVT frames match the reference decode, {} corrupt frames dropped".format(len(expect), corrupt))
+
+    # configure() sends well formed CFG-MSG, CFG-RATE and CFG-PRT, then follows the receiver to the new rate
+    uart = sim.uart(b'', baudrate=BAUDRATE)
+    gps = UBX()
+    gps.configure(rate=RATE, baudrate=115200)
+    sent = frames(uart.written)
+    assert [kind for kind, payload, good in sent if good] == [CFG_MSG, CFG_RATE, CFG_PRT], sent
+    assert sent[1][1][:2] == struct.pack('<H', 1000 // RATE)
+    port = struct.unpack('<BBHIIHHHH', sent[2][1])
+    assert port[0] == 1 and port[4] == 115200 and port[6] == 0x01, port # UBX out only
+    assert uart.baudrate == 115200 and gps.baudrate == 115200
+    print("check: configure() sends CFG-MSG, CFG-RATE and CFG-PRT for {}Hz UBX only at 115200 baud".format(RATE))
+
+
+def epochs( data ):
+    """ splits a recording into the output of each epoch, every epoch ends with its NAV-PVT """
+    chunks = [bytearray()]
+    i = 0
+    while i + 8 <= len(data):
+        if data[i] != 0xB5 or data[i + 1] != 0x62:
+            chunks[-1].append(data[i])
+            i += 1
+            continue
+        n = data[i + 4] | data[i + 5] << 8
+        chunks[-1] += data[i:i + n + 8]
+        if data[i + 2] << 8 | data[i + 3] == NAV_PVT:
+            chunks.append(bytearray())
+        i += n + 8
+    chunks[-1] += data[i:]
+    return [chunk for chunk in chunks if chunk]
+
+def stream( filename, baudrate=BAUDRATE, rate=RATE ):
+    with open(filename, 'rb') as file:
+        data = file.read()
+    chunks = epochs(data)
+    uart = sim.uart(b'', baudrate=baudrate)
+    gps = UBX()
+    start = clock.now()
+    polls = 0
+    backlog = 0
+    host = 0.0
+    tick = 0
+    # 1ms ticks: the receiver sends an epoch and the driver polls every 1 / rate seconds, 10ms apart
+    while chunks or uart.pending() or uart.any():
+        if chunks and tick % (1000 // rate) == 0:
+            backlog = max(backlog, uart.pending())
+            uart.feed(chunks.pop(0))
+        if tick % (1000 // rate) == 10:
+            t = time.perf_counter()
+            gps.poll()
+            host += time.perf_counter() - t
+            polls += 1
+        clock.advance(0.001)
+        tick += 1
+    seconds = clock.now() - start
+    print("{:6d} baud: {:.0f}% of the line, {} bytes lost, {:.0f}ms largest backlog at an epoch start".format(
+        baudrate, 100 * len(data) * 10 / baudrate / seconds, uart.lost, backlog * 10000 / baudrate))
+    print("    {} polls at {}Hz, {} NAV-PVT decoded, {} dropped, {:.0f}us host time per poll".format(
+        polls, rate, gps.frames, gps.errors, host / polls * 1e6))
+
+
+def pvt( t, lat, lon, speed, course, satellites, pdop ):
+    """ the NAV-PVT frame of an epoch at t seconds after 10:15 on 18 April 2018 """
+    seconds = 10 * 3600 + 15 * 60 + t
+    ms = int(round(seconds * 1000))
+    second = ms // 1000
+    nano = (ms % 1000) * 1000000
+    if nano > 500000000:
+        # u-blox rounds to the nearest second and sends the rest signed
+        second += 1
+        nano -= 1000000000
+    hour, minute, second = second // 3600, second // 60 % 60, second % 60
+    north = speed * 1000 * cos(radians(course))
+    east = speed * 1000 * sin(radians(course))
+    payload = PVT.pack(int(seconds * 1000) % 604800000, 2018, 4, 18, hour, minute, second, 0x37, 25, nano,
+        3, 0x01, 0xEA, satellites, int(round(lon * 1e7)), int(round(lat * 1e7)), 47400, 3200 + int(100 * sin(t)),
+        1400, 2100, int(north), int(east), -12, int(speed * 1000), int(round(course * 1e5)), 180, 210000,
+        pdop, 0, bytes(5), 0, 0, 0)
+    return message(NAV_PVT, payload)
+
+def synthesize( filename, seconds=20, rate=RATE ):
+    """ writes the synthetic fixture """
+    from replay import sentence
+    out = bytearray()
+    out += sentence('GNGGA,101459.90,5332.79120,N,00958.01400,E,1,09,1.10,3.2,M,44.2,M,,').encode()
+    out += sentence('GNRMC,101459.90,A,5332.79120,N,00958.01400,E,0.000,,180418,,,A').encode()
+    for kind in (CFG_MSG, CFG_RATE, CFG_PRT):
+        out += message(ACK_ACK, bytes((kind >> 8, kind & 0xFF)))
+    count = 0
+    for i, t, lat, lon, speed, course in track(seconds, rate):
+        frame = pvt(t, lat, lon, speed, course, 9 + i // 100, 195 - i // 20)
+        if i in (57, 243):
+            # a flipped bit in the payload
+            frame[40] ^= 0x10
+        out += frame
+        count += 1
+        if i % rate == 0:
+            # NAV-SAT, 12 satellites
+            out += message(NAV_SAT, struct.pack('<IBBH', 0, 1, 12, 0) + bytes(12 * 12))
+            count += 1
+    with open(filename, 'wb') as file:
+        file.write(out)
+    print("wrote {} frames, {} bytes to {}".format(count, len(out), filename))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2 and sys.argv[1] == '--synthesize':
+        synthesize(sys.argv[2])
+        sys.exit()
+    filename = sys.argv[1] if len(sys.argv) > 1 else FIXTURE
+    check(filename)
+    if len(sys.argv) > 2:
+        stream(filename, int(sys.argv[2]))
+    else:
+        for baudrate in (9600, 38400, 115200):
+            stream(filename, baudrate)
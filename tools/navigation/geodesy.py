@@ -0,0 +1,166 @@
+"""
+Checks and times src/navigation/geodesy.py against the ellipsoid
+
+accuracy: distances and bearings in a Frame between random points around its
+    origin, against Vincenty's inverse solution on WGS84, and the error of the
+    flat earth distance() and great circle bearing() of src/pseudocode.py.
+drift: the boat drifts 10km away on a curve while a station keeping loop
+    asks for distance and bearing to three targets at 10Hz. Reports the
+    re-anchors and the worst distance error against Vincenty, which must stay
+    within the accuracy for targets inside the radius.
+timing: host time per distance plus bearing call, the pseudocode functions
+    against Frame with cached targets.
+
+    py ./tools/navigation/geodesy.py [latitude]
+"""
+import os
+import sys
+import time
+import random
+from math import sin, cos, tan, atan, atan2, sqrt, radians, degrees
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'simulator'))
+import sim
+
+sim.install()
+from array import array
+from navigation.geodesy import Frame, position, distance, bearing, A, E2
+
+LAT, LON = 53.54652, 9.96690
+CALLS = 20000
+
+
+def vincenty( lat1, lon1, lat2, lon2 ):
+    """ metres and initial bearing in degrees on WGS84 """
+    f = 1 - sqrt(1 - E2)
+    b = A * (1 - f)
+    L = radians(lon2 - lon1)
+    U1 = atan((1 - f) * tan(radians(lat1)))
+    U2 = atan((1 - f) * tan(radians(lat2)))
+    sU1, cU1, sU2, cU2 = sin(U1), cos(U1), sin(U2), cos(U2)
+    lam = L
+    for _ in range(200):
+        sl, cl = sin(lam), cos(lam)
+        ss = sqrt((cU2 * sl) ** 2 + (cU1 * sU2 - sU1 * cU2 * cl) ** 2)
+        if ss == 0:
+            return 0.0, 0.0
+        cs = sU1 * sU2 + cU1 * cU2 * cl
+        s = atan2(ss, cs)
+        sa = cU1 * cU2 * sl / ss
+        c2a = 1 - sa * sa
+        c2sm = cs - 2 * sU1 * sU2 / c2a if c2a else 0.0
+        C = f / 16 * c2a * (4 + f * (4 - 3 * c2a))
+        previous = lam
+        lam = L + (1 - C) * f * sa * (s + C * ss * (c2sm + C * cs * (-1 + 2 * c2sm * c2sm)))
+        if abs(lam - previous) < 1e-12:
+            break
+    u2 = c2a * (A * A - b * b) / (b * b)
+    a = 1 + u2 / 16384 * (4096 + u2 * (-768 + u2 * (320 - 175 * u2)))
+    bb = u2 / 1024 * (256 + u2 * (-128 + u2 * (74 - 47 * u2)))
+    ds = bb * ss * (c2sm + bb / 4 * (cs * (-1 + 2 * c2sm * c2sm) - bb / 6 * c2sm * (-3 + 4 * ss * ss) * (-3 + 4 * c2sm * c2sm)))
+    heading = degrees(atan2(cU2 * sin(lam), cU1 * sU2 - sU1 * cU2 * cos(lam))) % 360
+    return b * a * (s - ds), heading
+
+
+# src/pseudocode.py, which cannot be imported on the host
+
+def flatDistance( position1, position2 ):
+    R = 6373000
+    lat1, long1 = radians(position1[0]), radians(position1[1])
+    lat2, long2 = radians(position2[0]), radians(position2[1])
+    x = (long2 - long1) * cos((lat1 + lat2) / 2)
+    return sqrt(x ** 2 + (lat2 - lat1) ** 2) * R
+
+def circleBearing( position1, position2 ):
+    lat1, long1 = radians(position1[0]), radians(position1[1])
+    lat2, long2 = radians(position2[0]), radians(position2[1])
+    dLon = long2 - long1
+    y = sin(dLon) * cos(lat2)
+    x = cos(lat1) * sin(lat2) - sin(lat1) * cos(lat2) * cos(dLon)
+    return (degrees(atan2(y, x)) + 360) % 360
+
+
+def disc( rnd, lat, lon, r ):
+    """ a random point within r metres """
+    while True:
+        east, north = rnd.uniform(-r, r), rnd.uniform(-r, r)
+        if east * east + north * north <= r * r:
+            return offset(lat, lon, east, north)
+
+def offset( lat, lon, east, north ):
+    """ degrees roughly east and north metres away, for placing test points """
+    return lat + north / 111132, lon + east / (111320 * cos(radians(lat)))
+
+def angle( a, b ):
+    return abs((a - b + 180) % 360 - 180)
+
+def accuracy( lat, lon ):
+    frame = Frame(position(lat, lon))
+    rnd = random.Random(1)
+    pa = array('f', [0.0, 0.0])
+    pb = array('f', [0.0, 0.0])
+    print("latitude {:.1f}, accuracy {}m gives a {:.0f}m radius".format(lat, frame.accuracy, frame.radius))
+    for reach in (frame.radius, 2000, 10000):
+        worst = [0.0] * 4
+        for _ in range(500):
+            a = disc(rnd, lat, lon, reach)
+            b = disc(rnd, lat, lon, reach)
+            d, h = vincenty(a[0], a[1], b[0], b[1])
+            if d < 10:
+                continue
+            frame.project(pa, position(*a))
+            frame.project(pb, position(*b))
+            worst[0] = max(worst[0], abs(distance(pa, pb) - d))
+            worst[1] = max(worst[1], angle(bearing(pa, pb), h))
+            worst[2] = max(worst[2], abs(flatDistance(a, b) - d))
+            worst[3] = max(worst[3], angle(circleBearing(a, b), h))
+        if reach == frame.radius:
+            assert worst[0] <= frame.accuracy, worst
+        print("  points within {:5.0f}m: Frame {:6.3f}m {:6.4f}deg, pseudocode {:6.2f}m {:6.4f}deg".format(
+            reach, *worst))
+
+def drift( lat, lon ):
+    frame = Frame()
+    points = [position(*offset(lat, lon, e, n)) for e, n in ((150, 40), (-80, 210), (30, -120))]
+    targets = [frame.target(p) for p in points]
+    worst = 0.0
+    near = 0.0
+    steps = 6000
+    for i in range(steps):
+        # 10km in 10 minutes on a slow curve
+        t = i / steps
+        here = offset(lat, lon, 10000 * sin(t * 1.2) * t, 10000 * t * cos(t * 1.2))
+        frame.locate(position(*here))
+        for p, target in zip(points, targets):
+            d = vincenty(here[0], here[1], p[0] / 1e7, p[1] / 1e7)[0]
+            error = abs(frame.distance(target) - d)
+            worst = max(worst, error)
+            if d < frame.radius:
+                near = max(near, error)
+    print("drift: 10km at 10Hz, {} anchors, worst distance error {:.3f}m, {:.3f}m for targets inside the radius".format(
+        frame.anchors, worst, near))
+    assert near <= frame.accuracy, near
+
+def timing( lat, lon ):
+    a = (lat, lon)
+    b = offset(lat, lon, 120, 80)
+    t = time.perf_counter()
+    for _ in range(CALLS):
+        flatDistance(a, b)
+        circleBearing(a, b)
+    before = (time.perf_counter() - t) / CALLS
+    frame = Frame(position(*a))
+    frame.locate(position(*a))
+    target = frame.target(position(*b))
+    t = time.perf_counter()
+    for _ in range(CALLS):
+        frame.distance(target)
+        frame.bearing(target)
+    after = (time.perf_counter() - t) / CALLS
+    print("timing: distance and bearing {:.2f}us in pseudocode, {:.2f}us with Frame".format(before * 1e6, after * 1e6))
+
+if __name__ == '__main__':
+    lat = float(sys.argv[1]) if len(sys.argv) > 1 else LAT
+    accuracy(lat, LON)
+    drift(lat, LON)
+    timing(lat, LON)
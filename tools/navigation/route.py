@@ -0,0 +1,116 @@
+"""
+Checks and times src/navigation/route.py and its NumPy twin navigation.batch
+
+check: on a random route, the device functions on array('f') against the
+    batch functions, and both against Vincenty's inverse on WGS84, from legs of
+    a few metres to across the Atlantic. pairs() must hold the legs in both
+    directions.
+benchmark: a route of 10k points, legs and one to many, and every route
+    point against a geofence of 100 vertices, in NumPy, with the device
+    functions (plain Python on the host) and with the scalar distance() and
+    bearing() of src/pseudocode.py called per leg.
+
+    py ./tools/navigation/route.py
+"""
+import os
+import sys
+import time
+from array import array
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+from geodesy import vincenty, flatDistance, circleBearing, angle, LAT, LON
+
+import numpy as np
+from navigation import route, batch
+
+POINTS = 10000
+FENCE = 100
+
+
+def walk( rnd, n, step ):
+    """ a random route of n points, legs of up to step metres """
+    lat = LAT + np.cumsum(rnd.uniform(-step, step, n)) / 111132
+    lon = LON + np.cumsum(rnd.uniform(-step, step, n)) / (111320 * np.cos(np.radians(LAT)))
+    return np.stack((lat, lon), axis=-1)
+
+def device( points ):
+    """ the points as the device keeps them, with their prepared terms """
+    flat = array('f', points.ravel().tolist())
+    trig = array('f', [0.0] * (route.TRIG * len(points)))
+    route.prepare(trig, flat)
+    return flat, trig
+
+def out( n ):
+    return array('f', [0.0] * n), array('f', [0.0] * n)
+
+def check():
+    rnd = np.random.default_rng(1)
+    for step in (3, 300, 30000, 3000000):
+        points = walk(rnd, 50, step)
+        points[:, 0] = np.clip(points[:, 0], -80, 80)
+        # float32 degrees as on the device, the batch gets the same points
+        flat, trig = device(points)
+        points = np.array(flat, dtype=np.float64).reshape(-1, 2)
+        d, b = out(len(points) - 1)
+        route.legs(d, b, trig)
+        bd, bb = batch.legs(points)
+        reference = [vincenty(*points[k], *points[k + 1]) for k in range(len(points) - 1)]
+        vd = np.array([r[0] for r in reference])
+        vb = np.array([r[1] for r in reference])
+        # the end of each leg as device and batch place it, relative to the leg
+        miss = np.hypot(np.array(d) * np.sin(np.radians(b)) - bd * np.sin(np.radians(bb)),
+            np.array(d) * np.cos(np.radians(b)) - bd * np.cos(np.radians(bb))) / bd
+        ellipsoid = np.abs(bd - vd) / vd
+        print("legs up to {:7d}m: device and batch within {:.1e} of the leg, batch within {:.2%} and {:.3f}deg of WGS84".format(
+            step, miss.max(), ellipsoid.max(), max(angle(x, y) for x, y in zip(bb, vb))))
+        assert miss.max() < 1e-5 and ellipsoid.max() < 5e-3
+
+        n = len(points)
+        pd, pb = out(n * n)
+        route.pairs(pd, pb, trig)
+        bpd, bpb = batch.pairs(points)
+        assert np.allclose(np.array(pd).reshape(n, n), bpd, rtol=1e-3, atol=0.5)
+        assert all(angle(pb[k * n + k + 1], b[k]) < 0.1 for k in range(n - 1))
+        origin = array('f', [0.0] * route.TRIG)
+        route.prepare(origin, flat[:2])
+        fd, fb = out(n)
+        route.fromPoint(fd, fb, origin, trig)
+        assert np.allclose(fd, bpd[0], rtol=1e-3, atol=0.5) and np.allclose(pd[:n], fd)
+    print("check: legs, pairs and fromPoint agree")
+
+def timed( f, rounds=3 ):
+    best = None
+    for _ in range(rounds):
+        t = time.perf_counter()
+        f()
+        t = time.perf_counter() - t
+        best = t if best is None else min(best, t)
+    return best
+
+def benchmark():
+    rnd = np.random.default_rng(2)
+    points = walk(rnd, POINTS, 50)
+    fence = walk(rnd, FENCE, 200)
+    flat, trig = device(points)
+    d, b = out(POINTS)
+
+    def scalar():
+        for k in range(POINTS - 1):
+            flatDistance(points[k], points[k + 1])
+            circleBearing(points[k], points[k + 1])
+
+    origin = array('f', [0.0] * route.TRIG)
+    route.prepare(origin, array('f', [LAT, LON]))
+    print("{} points, host times".format(POINTS))
+    print("  legs         numpy {:7.2f}ms  device {:7.1f}ms  pseudocode per leg {:7.1f}ms".format(
+        timed(lambda: batch.legs(points)) * 1e3, timed(lambda: route.legs(d, b, trig)) * 1e3, timed(scalar) * 1e3))
+    print("  one to many  numpy {:7.2f}ms  device {:7.1f}ms".format(
+        timed(lambda: batch.fromPoint((LAT, LON), points)) * 1e3, timed(lambda: route.fromPoint(d, b, origin, trig)) * 1e3))
+    print("  prepare      device {:6.1f}ms, once per route".format(timed(lambda: route.prepare(trig, flat)) * 1e3))
+    print("  to a {} vertex geofence, {} pairs: numpy {:.1f}ms".format(
+        FENCE, POINTS * FENCE, timed(lambda: batch.pairs(points, fence)) * 1e3))
+
+if __name__ == '__main__':
+    check()
+    benchmark()
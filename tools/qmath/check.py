@@ -0,0 +1,267 @@
+"""
+Checks of src/qmath, one suite for the device and the host copy
+
+Every check is written once against the tuple interface of Device and Batch
+below. Device calls qmath.quaternion on preallocated array('f') buffers, Batch
+calls qmath.batch on single rows. On CPython both run, with NumPy, and Batch is
+also compared against Device on a batch of random quaternions.
+On MicroPython (upload ./src/qmath then `ampy run` this file, or the unix port)
+only Device runs, followed by the heap allocation count of every function.
+A call may allocate no more than FLOATS float objects, its arithmetic results
+and array reads, at the bytes of a float measured by a float-only loop. On
+builds with unboxed floats that is zero. On CPython FLOATS is checked
+against the source with sim.floats().
+
+    py ./tools/qmath/check.py
+"""
+import sys
+from array import array
+from math import sqrt, sin, cos, radians
+
+CALLS = 1000
+
+# float objects one call creates at most, and the functions it runs
+FLOATS = {
+    "multiply": (60, 'multiply'),
+    "conjugate": (7, 'conjugate'),
+    "normalize": (21, 'normalize'),
+    "rotate": (37, 'rotate', '_rotate'),
+    "unrotate": (40, 'unrotate', '_rotate'),
+    "slerp": (64, 'slerp', 'normalize'),
+    "euler": (39, 'euler'),
+    "fromEuler": (32, 'fromEuler'),
+}
+
+try:
+    import gc
+    gc.mem_alloc
+    MICROPYTHON = True
+except AttributeError:
+    MICROPYTHON = False
+
+if not MICROPYTHON:
+    import os
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'simulator'))
+    import sim
+    sim.install()
+
+from qmath import quaternion
+
+
+class Device(object):
+    """ qmath.quaternion, results copied out of the buffers into tuples """
+
+    def __init__( self ):
+        self.a = array('f', [0.0] * 4)
+        self.b = array('f', [0.0] * 4)
+        self.q = array('f', [0.0] * 4)
+        self.v = array('f', [0.0] * 3)
+        self.r = array('f', [0.0] * 3)
+
+    def multiply( self, a, b ):
+        self.a[:] = array('f', a)
+        self.b[:] = array('f', b)
+        quaternion.multiply(self.q, self.a, self.b)
+        return tuple(self.q)
+
+    def conjugate( self, q ):
+        self.a[:] = array('f', q)
+        quaternion.conjugate(self.q, self.a)
+        return tuple(self.q)
+
+    def normalize( self, q ):
+        self.q[:] = array('f', q)
+        quaternion.normalize(self.q)
+        return tuple(self.q)
+
+    def rotate( self, q, v ):
+        self.a[:] = array('f', q)
+        self.v[:] = array('f', v)
+        quaternion.rotate(self.r, self.a, self.v)
+        return tuple(self.r)
+
+    def unrotate( self, q, v ):
+        self.a[:] = array('f', q)
+        self.v[:] = array('f', v)
+        quaternion.unrotate(self.r, self.a, self.v)
+        return tuple(self.r)
+
+    def slerp( self, a, b, t ):
+        self.a[:] = array('f', a)
+        self.b[:] = array('f', b)
+        quaternion.slerp(self.q, self.a, self.b, t)
+        return tuple(self.q)
+
+    def euler( self, q ):
+        self.a[:] = array('f', q)
+        quaternion.euler(self.r, self.a)
+        return tuple(self.r)
+
+    def fromEuler( self, yaw, pitch, roll ):
+        quaternion.fromEuler(self.q, yaw, pitch, roll)
+        return tuple(self.q)
+
+
+class Batch(object):
+    """ qmath.batch on single rows """
+
+    def __init__( self ):
+        from qmath import batch
+        self.batch = batch
+
+    def __getattr__( self, name ):
+        f = getattr(self.batch, name)
+        return lambda *args: tuple(float(x) for x in f(*args))
+
+
+def near( a, b, tolerance=1e-5 ):
+    assert len(a) == len(b) and all(abs(x - y) <= tolerance for x, y in zip(a, b)), (a, b)
+
+def same( a, b ):
+    """ the same rotation, q and -q """
+    if sum(x * y for x, y in zip(a, b)) < 0:
+        b = [-x for x in b]
+    near(a, b)
+
+def angle( a, b ):
+    """ degrees, wrapped """
+    return abs((a - b + 180) % 360 - 180)
+
+def axis( degrees, x, y, z ):
+    h = radians(degrees) / 2
+    return (cos(h), x * sin(h), y * sin(h), z * sin(h))
+
+I = (1.0, 0.0, 0.0, 0.0)
+Q = (0.8, 0.1, -0.3, 0.5)
+S = sqrt(sum(x * x for x in Q))
+Q = tuple(x / S for x in Q)
+
+# the checks
+
+def checkMultiply( m ):
+    near(m.multiply(I, Q), Q)
+    near(m.multiply(Q, I), Q)
+    near(m.multiply((0, 1, 0, 0), (0, 0, 1, 0)), (0, 0, 0, 1)) # ij = k
+    near(m.multiply((0, 0, 1, 0), (0, 1, 0, 0)), (0, 0, 0, -1)) # ji = -k
+    same(m.multiply(axis(30, 0, 0, 1), axis(60, 0, 0, 1)), axis(90, 0, 0, 1))
+
+def checkConjugate( m ):
+    near(m.multiply(Q, m.conjugate(Q)), I)
+
+def checkNormalize( m ):
+    near(m.normalize((2.0, 0.0, 0.0, 0.0)), I)
+    near(m.normalize(tuple(3 * x for x in Q)), Q)
+    near(m.normalize((0.0, 0.0, 0.0, 0.0)), (0.0, 0.0, 0.0, 0.0))
+
+def checkRotate( m ):
+    near(m.rotate(axis(90, 0, 0, 1), (1, 0, 0)), (0, 1, 0))
+    near(m.rotate(axis(90, 1, 0, 0), (0, 1, 0)), (0, 0, 1))
+    near(m.unrotate(axis(90, 0, 0, 1), (0, 1, 0)), (1, 0, 0))
+    v = (0.3, -0.5, 0.8)
+    near(m.unrotate(Q, m.rotate(Q, v)), v)
+    # against the sandwich product
+    r = m.multiply(m.multiply(Q, (0.0,) + v), m.conjugate(Q))
+    near(m.rotate(Q, v), r[1:])
+
+def checkSlerp( m ):
+    a = axis(10, 0, 0, 1)
+    b = axis(100, 0, 0, 1)
+    same(m.slerp(a, b, 0.0), a)
+    same(m.slerp(a, b, 1.0), b)
+    same(m.slerp(a, b, 0.5), axis(55, 0, 0, 1))
+    same(m.slerp(a, tuple(-x for x in b), 0.5), axis(55, 0, 0, 1)) # the shorter arc
+    same(m.slerp(Q, Q, 0.3), Q)
+
+def checkEuler( m ):
+    for yaw in (-170, -90, -30, 0, 45, 135, 179):
+        for pitch in (-80, -20, 0, 35, 80):
+            for roll in (-150, -10, 0, 60, 170):
+                q = m.fromEuler(yaw, pitch, roll)
+                near(q, m.normalize(q))
+                e = m.euler(q)
+                assert angle(e[0], yaw) < 1e-2 and abs(e[1] - pitch) < 1e-2 and angle(e[2], roll) < 1e-2, (yaw, pitch, roll, e)
+    same(m.fromEuler(90, 0, 0), axis(90, 0, 0, 1))
+    near(m.euler(axis(90, 0, 1, 0)), (0, 90, 0), 0.1) # clamped at the pole, float32 asin is coarse there
+    near(m.euler(axis(30, 0, 0, 1)), (30, 0, 0), 1e-4)
+
+CHECKS = (checkMultiply, checkConjugate, checkNormalize, checkRotate, checkSlerp, checkEuler)
+
+
+def run( name, m ):
+    for check in CHECKS:
+        check(m)
+    print("{:6s} {} checks passed".format(name, len(CHECKS)))
+
+def agree( n=1000 ):
+    """ the batch functions over n random rows against the device functions row by row """
+    import numpy as np
+    from qmath import batch
+    rnd = np.random.default_rng(1)
+    a = batch.normalize(rnd.normal(size=(n, 4)))
+    b = batch.normalize(rnd.normal(size=(n, 4)))
+    v = rnd.normal(size=(n, 3))
+    t = rnd.uniform(size=n)
+    device = Device()
+    results = (
+        (batch.multiply(a, b), [device.multiply(a[i], b[i]) for i in range(n)]),
+        (batch.rotate(a, v), [device.rotate(a[i], v[i]) for i in range(n)]),
+        (batch.unrotate(a, v), [device.unrotate(a[i], v[i]) for i in range(n)]),
+        (batch.slerp(a, b, t), [device.slerp(a[i], b[i], t[i]) for i in range(n)]),
+    )
+    error = max(np.abs(x - np.array(y)).max() for x, y in results)
+    assert error < 1e-5, error
+    e = batch.euler(a)
+    degrees = max(angle(x, y) for i in range(n) for x, y in zip(e[i], device.euler(a[i])))
+    assert degrees < 1e-2, degrees
+    print("batch  agrees with device over {} rows, max deviation {:.1e}, euler {:.1e} degrees".format(n, error, degrees))
+
+def allocations():
+    def mem( f ):
+        gc.collect()
+        gc.disable()
+        before = gc.mem_alloc()
+        for _ in range(CALLS):
+            f()
+        after = gc.mem_alloc()
+        gc.enable()
+        return (after - before) / CALLS
+
+    def floats():
+        x = 1.5
+        x = x * 1.0000001
+
+    q = array('f', Q)
+    p = array('f', [0.9, 0.1, 0.0, 0.1])
+    out = array('f', [0.0] * 4)
+    v = array('f', [0.3, -0.5, 0.8])
+    perFloat = mem(floats)
+    print("{:.1f} bytes per float object".format(perFloat))
+    # closures, a call with *args would allocate the argument array
+    for name, f in (
+            ("multiply", lambda: quaternion.multiply(out, q, p)),
+            ("conjugate", lambda: quaternion.conjugate(out, q)),
+            ("normalize", lambda: quaternion.normalize(out)),
+            ("rotate", lambda: quaternion.rotate(v, q, v)),
+            ("unrotate", lambda: quaternion.unrotate(v, q, v)),
+            ("slerp", lambda: quaternion.slerp(out, q, p, 0.3)),
+            ("euler", lambda: quaternion.euler(v, q)),
+            ("fromEuler", lambda: quaternion.fromEuler(out, 30.0, 10.0, -5.0))):
+        n = mem(f)
+        budget = FLOATS[name][0] * perFloat
+        print("{:10s} {:6.1f} bytes/call, float-only budget {:.1f}".format(name, n, budget))
+        assert n <= budget, name + " allocates more than its floats"
+
+def budgets():
+    for name, (n, *functions) in FLOATS.items():
+        assert sim.floats('qmath.quaternion', *functions) == n, "FLOATS {} is {}, the source has {}".format(
+            name, n, sim.floats('qmath.quaternion', *functions))
+    print("FLOATS matches the source of qmath.quaternion")
+
+if __name__ == '__main__':
+    run("device", Device())
+    if MICROPYTHON:
+        allocations()
+    else:
+        run("batch", Batch())
+        agree()
+        budgets()
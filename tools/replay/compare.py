@@ -0,0 +1,97 @@
+"""
+Checks the replay against the device implementation and measures its throughput
+
+The default device Madgwick engine from src/fusion, with its scheduled gain and
+accel rejection, runs on CPython through the simulator shims on synthetic boat
+motion with a wave slam, the replay runs the same samples with its defaults.
+The device keeps its state in array('f') so the tolerance is single precision.
+The engine gets the bare gyro, so the replay runs with gyrobias=False. The
+C loop and, with replay.COMPILED off, the kernels and the blocks are checked,
+and a diagonal magcal against the same calibration as magbias.
+
+    py ./tools/replay/compare.py
+"""
+import os
+import sys
+import time
+from array import array
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'simulator'))
+import sim
+import motion
+import replay
+
+sim.install()
+from fusion.madgwick import Madgwick
+
+TOLERANCE = 1e-3
+
+
+def synthetic( seconds ):
+    samples = motion.boat(seconds=seconds, slam=seconds / 2)
+    data = {
+        't': np.array([s[0] for s in samples]),
+        'accel': np.array([s[1] for s in samples]),
+        'gyro': np.degrees(np.array([s[2] for s in samples])),
+        'mag': np.array([s[3] for s in samples]),
+        'reference': np.array([motion.ypr(s[4]) for s in samples]),
+    }
+    data['mag'][1::2] = np.nan # the magnetometer runs at half the rate
+    return data
+
+def device( data ):
+    engine = Madgwick()
+    defaults = (engine.beta, engine.betaHigh, engine.converge, engine.hold, engine.boost, engine.reject)
+    assert np.allclose(defaults, (replay.BETA, replay.BETAHIGH, replay.CONVERGE, replay.HOLD, replay.BOOST, replay.REJECT)), \
+        "the replay defaults differ from fusion.madgwick.Madgwick"
+    q = array('f', [1.0, 0.0, 0.0, 0.0])
+    v = array('f', [0.0] * 9)
+    dt = np.diff(data['t'], prepend=data['t'][0])
+    dt[0] = 0.0001
+    yaw = []
+    for i in range(len(dt)):
+        v[0:3] = array('f', data['accel'][i])
+        v[3:6] = array('f', np.radians(data['gyro'][i]))
+        if np.isnan(data['mag'][i, 0]):
+            engine.updateIMU(q, v, float(dt[i]))
+        else:
+            v[6:9] = array('f', data['mag'][i])
+            engine.update(q, v, float(dt[i]))
+        yaw.append(motion.ypr(q)[0])
+    return np.array(q), np.array(yaw), engine.rejected
+
+
+if __name__ == '__main__':
+    data = synthetic(60)
+    q, yaw, rejected = device(data)
+    # without the C loop one set runs through the kernels, more through the blocks
+    for compiled in (True, False):
+        replay.COMPILED = compiled
+        if compiled and replay._compiled() is None:
+            print("no C compiler, the C loop is not checked")
+            continue
+        for p in (1, replay.KERNELS + 1):
+            result = replay.run(data, beta=np.full(p, replay.BETA), every=1, history=True, gyrobias=False)
+            deviation = np.abs(result['q'] - q).max()
+            heading = np.abs(replay.wrap(result['ypr'][:, :, 0] - yaw[:, None])).max()
+            print("device vs {} replay of {} sets: max quaternion deviation {:.1e}, max heading deviation {:.1e} degrees, {} and {} samples rejected".format(
+                'C' if compiled else 'NumPy', p, deviation, heading, rejected, result['rejected']))
+            assert deviation < TOLERANCE and heading < 0.1 and rejected == result['rejected'] > 0
+
+        magbias = (2.0, -1.0, 0.5, 40.0, 50.0, 45.0, 45.0, 45.0, 45.0)
+        magcal = (2.0, -1.0, 0.5, 45.0 / 40.0, 0, 0, 0, 45.0 / 50.0, 0, 0, 0, 1.0)
+        a = replay.run(data, beta=np.full(2, replay.BETA), magbias=magbias, gyrobias=False)['q']
+        b = replay.run(data, beta=np.full(2, replay.BETA), magcal=magcal, gyrobias=False)['q']
+        print("magcal vs magbias: max quaternion deviation {:.1e}".format(np.abs(a - b).max()))
+        assert np.abs(a - b).max() < 1e-9
+    replay.COMPILED = True
+
+    for p in (1, 100, 1000):
+        start = time.perf_counter()
+        replay.run(data, beta=np.linspace(0.02, 1.0, p))
+        elapsed = time.perf_counter() - start
+        print("{:5d} parameter sets: {:6.2f}s per hour of 100Hz data, {:8.1f}ms per parameter set hour".format(
+            p, elapsed * 60, elapsed * 60 / p * 1000))
@@ -0,0 +1,184 @@
+/*
+ * The sample loop of replay.py in C, loaded through ctypes
+ *
+ * The update is src/fusion/madgwick.py update and updateIMU term by term in
+ * double precision. The samples are the outer loop, what they share is
+ * worked out once, and the parameter sets are the inner loop over columns,
+ * one per sample in marg or imu. The inner loops have no branches, the early
+ * returns of the device kernels are selects, so the compiler vectorizes them
+ * across the sets. Built by replay.py with the host C compiler, see
+ * _compiled().
+ */
+#include <math.h>
+
+/*
+ * One sample with the magnetometer for the p sets in the columns Q1 .. Q4, a
+ * is the normalised accel, g the gyro, m the adjusted magnetometer, gain is
+ * beta + boosted f and 0 when the accel is rejected
+ */
+static void marg( long p, double *restrict Q1, double *restrict Q2, double *restrict Q3, double *restrict Q4,
+                  const double *a, const double *g, const double *m, double h, double f, int skip,
+                  const double *beta, const double *boosted, const double *offset, const double *matrix )
+{
+    double ax = a[0], ay = a[1], az = a[2];
+    double gx = g[0], gy = g[1], gz = g[2];
+    double rx = m[0], ry = m[1], rz = m[2];
+    for (long s = 0; s < p; s++) {
+        double q1 = Q1[s], q2 = Q2[s], q3 = Q3[s], q4 = Q4[s];
+        double gain = skip ? 0.0 : beta[s] + boosted[s] * f;
+
+        double x = rx - offset[s], y = ry - offset[p + s], z = rz - offset[2 * p + s];
+        double mx = matrix[s] * x + matrix[p + s] * y + matrix[2 * p + s] * z;
+        double my = matrix[3 * p + s] * x + matrix[4 * p + s] * y + matrix[5 * p + s] * z;
+        double mz = matrix[6 * p + s] * x + matrix[7 * p + s] * y + matrix[8 * p + s] * z;
+
+        double mnorm = sqrt(mx * mx + my * my + mz * mz);
+        // a zero field leaves q as it is on the device, here it is only renormalised
+        double step = mnorm != 0 ? h : 0.0;
+        mnorm = mnorm != 0 ? 1 / mnorm : 0.0;
+        mx *= mnorm;
+        my *= mnorm;
+        mz *= mnorm;
+
+        double _2q1 = 2 * q1;
+        double _2q2 = 2 * q2;
+        double _2q3 = 2 * q3;
+        double _2q4 = 2 * q4;
+        double _2q1q3 = 2 * q1 * q3;
+        double _2q3q4 = 2 * q3 * q4;
+        double q1q1 = q1 * q1;
+        double q1q2 = q1 * q2;
+        double q1q3 = q1 * q3;
+        double q1q4 = q1 * q4;
+        double q2q2 = q2 * q2;
+        double q2q3 = q2 * q3;
+        double q2q4 = q2 * q4;
+        double q3q3 = q3 * q3;
+        double q3q4 = q3 * q4;
+        double q4q4 = q4 * q4;
+
+        double _2q1mx = 2 * q1 * mx;
+        double _2q1my = 2 * q1 * my;
+        double _2q1mz = 2 * q1 * mz;
+        double _2q2mx = 2 * q2 * mx;
+        double hx = mx * q1q1 - _2q1my * q4 + _2q1mz * q3 + mx * q2q2 + _2q2 * my * q3 + _2q2 * mz * q4 - mx * q3q3 - mx * q4q4;
+        double hy = _2q1mx * q4 + my * q1q1 - _2q1mz * q2 + _2q2mx * q3 - my * q2q2 + my * q3q3 + _2q3 * mz * q4 - my * q4q4;
+        double _2bx = sqrt(hx * hx + hy * hy);
+        double _2bz = -_2q1mx * q3 + _2q1my * q2 + mz * q1q1 + _2q2mx * q4 - mz * q2q2 + _2q3 * my * q4 - mz * q3q3 + mz * q4q4;
+        double _4bx = 2 * _2bx;
+        double _4bz = 2 * _2bz;
+
+        double fx = 2 * q2q4 - _2q1q3 - ax;
+        double fy = 2 * q1q2 + _2q3q4 - ay;
+        double fz = 1 - 2 * q2q2 - 2 * q3q3 - az;
+        double bx = _2bx * (0.5 - q3q3 - q4q4) + _2bz * (q2q4 - q1q3) - mx;
+        double by = _2bx * (q2q3 - q1q4) + _2bz * (q1q2 + q3q4) - my;
+        double bz = _2bx * (q1q3 + q2q4) + _2bz * (0.5 - q2q2 - q3q3) - mz;
+
+        double s1 = -_2q3 * fx + _2q2 * fy - _2bz * q3 * bx + (-_2bx * q4 + _2bz * q2) * by + _2bx * q3 * bz;
+        double s2 = _2q4 * fx + _2q1 * fy - 4 * q2 * fz + _2bz * q4 * bx + (_2bx * q3 + _2bz * q1) * by + (_2bx * q4 - _4bz * q2) * bz;
+        double s3 = -_2q1 * fx + _2q4 * fy - 4 * q3 * fz + (-_4bx * q3 - _2bz * q1) * bx + (_2bx * q2 + _2bz * q4) * by + (_2bx * q1 - _4bz * q3) * bz;
+        double s4 = _2q2 * fx + _2q3 * fy + (-_4bx * q4 + _2bz * q2) * bx + (-_2bx * q1 + _2bz * q3) * by + _2bx * q2 * bz;
+
+        // normalise step magnitude, a zero step means we are already at the minimum
+        double snorm = sqrt(s1 * s1 + s2 * s2 + s3 * s3 + s4 * s4);
+        snorm = snorm != 0 ? gain / snorm : 0.0;
+
+        double n1 = q1 + (0.5 * (-q2 * gx - q3 * gy - q4 * gz) - s1 * snorm) * step;
+        double n2 = q2 + (0.5 * (q1 * gx + q3 * gz - q4 * gy) - s2 * snorm) * step;
+        double n3 = q3 + (0.5 * (q1 * gy - q2 * gz + q4 * gx) - s3 * snorm) * step;
+        double n4 = q4 + (0.5 * (q1 * gz + q2 * gy - q3 * gx) - s4 * snorm) * step;
+
+        double qnorm = 1 / sqrt(n1 * n1 + n2 * n2 + n3 * n3 + n4 * n4);
+        Q1[s] = n1 * qnorm;
+        Q2[s] = n2 * qnorm;
+        Q3[s] = n3 * qnorm;
+        Q4[s] = n4 * qnorm;
+    }
+}
+
+/* One sample without the magnetometer, as marg */
+static void imu( long p, double *restrict Q1, double *restrict Q2, double *restrict Q3, double *restrict Q4,
+                 const double *a, const double *g, double h, double f, int skip,
+                 const double *beta, const double *boosted )
+{
+    double ax = a[0], ay = a[1], az = a[2];
+    double gx = g[0], gy = g[1], gz = g[2];
+    double _ax = 2 * ax, _ay = 2 * ay, _4az = 4 * az;
+    for (long s = 0; s < p; s++) {
+        double q1 = Q1[s], q2 = Q2[s], q3 = Q3[s], q4 = Q4[s];
+        double gain = skip ? 0.0 : beta[s] + boosted[s] * f;
+
+        double _4q1 = 4 * q1;
+        double _4q2 = 4 * q2;
+        double _4q3 = 4 * q3;
+        double _8q2 = 8 * q2;
+        double _8q3 = 8 * q3;
+        double q1q1 = q1 * q1;
+        double q2q2 = q2 * q2;
+        double q3q3 = q3 * q3;
+        double q4q4 = q4 * q4;
+
+        double s1 = _4q1 * q3q3 + q3 * _ax + _4q1 * q2q2 - q2 * _ay;
+        double s2 = _4q2 * q4q4 - q4 * _ax + 4 * q1q1 * q2 - q1 * _ay - _4q2 + _8q2 * q2q2 + _8q2 * q3q3 + q2 * _4az;
+        double s3 = 4 * q1q1 * q3 + q1 * _ax + _4q3 * q4q4 - q4 * _ay - _4q3 + _8q3 * q2q2 + _8q3 * q3q3 + q3 * _4az;
+        double s4 = 4 * q2q2 * q4 - q2 * _ax + 4 * q3q3 * q4 - q3 * _ay;
+
+        double snorm = sqrt(s1 * s1 + s2 * s2 + s3 * s3 + s4 * s4);
+        snorm = snorm != 0 ? gain / snorm : 0.0;
+
+        double n1 = q1 + (0.5 * (-q2 * gx - q3 * gy - q4 * gz) - s1 * snorm) * h;
+        double n2 = q2 + (0.5 * (q1 * gx + q3 * gz - q4 * gy) - s2 * snorm) * h;
+        double n3 = q3 + (0.5 * (q1 * gy - q2 * gz + q4 * gx) - s3 * snorm) * h;
+        double n4 = q4 + (0.5 * (q1 * gz + q2 * gy - q3 * gx) - s4 * snorm) * h;
+
+        double qnorm = 1 / sqrt(n1 * n1 + n2 * n2 + n3 * n3 + n4 * n4);
+        Q1[s] = n1 * qnorm;
+        Q2[s] = n2 * qnorm;
+        Q3[s] = n3 * qnorm;
+        Q4[s] = n4 * qnorm;
+    }
+}
+
+/*
+ * accel, gyro, mag (n, 3): g, radians per second, adjusted magnetometer
+ * hasmag, rejected (n): the magnetometer is new, the accel is rejected
+ * dt, share (n): the sample period, the share of boosted added to beta
+ * beta, boosted (p), offset (3, p), matrix (9, p): the parameter sets, the
+ *     magnetometer is matrix (mag - offset) with the matrix row by row
+ * q (4, p): the state, updated in place
+ * snapshots (k, p, 4): the quaternions after the samples in index
+ */
+void replay( long n, long p, const double *accel, const double *gyro, const double *mag,
+             const unsigned char *hasmag, const unsigned char *rejected, const double *dt, const double *share,
+             const double *beta, const double *boosted, const double *offset, const double *matrix,
+             double *q, long k, const long *index, double *snapshots )
+{
+    double *Q1 = q, *Q2 = q + p, *Q3 = q + 2 * p, *Q4 = q + 3 * p;
+    long at = 0;
+    for (long i = 0; i < n; i++) {
+        double a[3] = {accel[3 * i], accel[3 * i + 1], accel[3 * i + 2]};
+        double norm = sqrt(a[0] * a[0] + a[1] * a[1] + a[2] * a[2]);
+        if (norm != 0) {
+            norm = 1 / norm;
+            a[0] *= norm;
+            a[1] *= norm;
+            a[2] *= norm;
+            if (hasmag[i])
+                marg(p, Q1, Q2, Q3, Q4, a, gyro + 3 * i, mag + 3 * i, dt[i], share[i], rejected[i],
+                     beta, boosted, offset, matrix);
+            else
+                imu(p, Q1, Q2, Q3, Q4, a, gyro + 3 * i, dt[i], share[i], rejected[i], beta, boosted);
+        }
+        if (at < k && index[at] == i) {
+            double *out = snapshots + 4 * p * at;
+            for (long s = 0; s < p; s++) {
+                out[4 * s] = Q1[s];
+                out[4 * s + 1] = Q2[s];
+                out[4 * s + 2] = Q3[s];
+                out[4 * s + 3] = Q4[s];
+            }
+            at++;
+        }
+    }
+}
@@ -0,0 +1,111 @@
+"""
+Reads the binary sensor log written by src/store/recorder.py
+
+The ring file is memory mapped and streamed oldest record first in chunks,
+ordered by the block sequence numbers of version 2, the head in the header
+can be stale after a power cut, version 1 logs have only that head. Each
+chunk is a dict of NumPy arrays in the format of replay.load
+    t       seconds since the first record, unwrapped from ticks_us
+    accel   g
+    gyro    degrees per second
+    mag     after the factory sensitivity adjustment, in the AHRS axes, NaN when not new
+    temp    raw temperature counts
+    overflow magnetic sensor overflow (ST2 HOFL)
+
+    import logreader
+    for chunk in logreader.stream('log.bin'):
+        ...
+    data = logreader.load('log.bin')
+"""
+import numpy as np
+
+HEADER = np.dtype([('magic', 'S4'), ('version', '<u2'), ('size', '<u2'), ('capacity', '<u4'),
+                   ('head', '<u4'), ('total', '<u4'), ('accelSSF', '<f4'), ('gyroSSF', '<f4'),
+                   ('asa', '<f4', 3)])
+HEADERSIZE = 64
+
+RECORD = np.dtype([('ticks', '<u4'), ('motion', '>i2', 7), ('mag', '<i2', 3), ('st2', 'u1'),
+                   ('flags', 'u1'), ('pad', 'u1', 2), ('sequence', '<u4')])
+
+TICKS_PERIOD = 1 << 30 # utime.ticks_us wraps at 2**30 on the ESP32
+
+
+def header( filename ):
+    h = np.fromfile(filename, dtype=HEADER, count=1)[0]
+    if h['magic'] != b'RBLG' or h['version'] not in (1, 2) or h['size'] != RECORD.itemsize:
+        raise ValueError("{} is not a version 1 or 2 sensor log".format(filename))
+    return h
+
+
+def stream( filename, chunk=100000 ):
+    """ yields the records oldest first in chunks of at most chunk records """
+    h = header(filename)
+    capacity, head, total = int(h['capacity']), int(h['head']), int(h['total'])
+    records = np.memmap(filename, dtype=RECORD, mode='r', offset=HEADERSIZE, shape=(capacity,))
+
+    if h['version'] == 1:
+        # the ring has wrapped when more than capacity records were written
+        order = (head if total > capacity else 0) + np.arange(min(total, capacity))
+        order %= capacity
+    else:
+        # the written records by block sequence, a block torn by a power cut
+        # keeps the rest of its older records, they sort before the newer ones
+        sequence = np.asarray(records['sequence'])
+        order = np.flatnonzero(sequence)
+        order = order[np.argsort(sequence[order], kind='stable')]
+    count = len(order)
+
+    t0 = None
+    previous = None
+    elapsed = 0
+    for start in range(0, count, chunk):
+        r = np.asarray(records[order[start:start + chunk]])
+
+        ticks = r['ticks'].astype(np.int64)
+        steps = np.diff(ticks, prepend=ticks[0] if previous is None else previous) % TICKS_PERIOD
+        previous = ticks[-1]
+        micros = elapsed + np.cumsum(steps)
+        elapsed = micros[-1]
+        if t0 is None:
+            t0 = micros[0]
+
+        motion = r['motion'].astype(np.float64)
+        raw = r['mag'].astype(np.float64)
+        asa = h['asa'].astype(np.float64)
+
+        # the axes and sensitivity adjustment of AHRS.readMag
+        mag = np.stack((raw[:, 1] * asa[1], raw[:, 0] * asa[0], -raw[:, 2] * asa[2]), axis=1)
+        mag[(r['flags'] & 1) == 0] = np.nan
+
+        yield {
+            't': (micros - t0) / 1e6,
+            'accel': motion[:, 0:3] / float(h['accelSSF']),
+            'gyro': motion[:, 4:7] / float(h['gyroSSF']),
+            'mag': mag,
+            'temp': motion[:, 3],
+            'overflow': (r['st2'] & 0x08) != 0,
+        }
+
+
+def load( filename ):
+    """ the whole log as one dict of arrays """
+    chunks = list(stream(filename))
+    if not chunks:
+        return None
+    return {key: np.concatenate([c[key] for c in chunks]) for key in chunks[0]}
+
+
+def tocsv( filename, csvname ):
+    """ converts a log to the csv format of replay.load """
+    data = load(filename)
+    rows = np.column_stack((data['t'], data['accel'], data['gyro'], data['mag']))
+    np.savetxt(csvname, rows, delimiter=',', fmt='%.6f',
+        header='t,ax,ay,az,gx,gy,gz,mx,my,mz', comments='')
+
+
+if __name__ == '__main__':
+    import sys
+    if len(sys.argv) < 3:
+        print("usage: py ./tools/replay/logreader.py log.bin log.csv")
+        sys.exit(1)
+    tocsv(sys.argv[1], sys.argv[2])
@@ -0,0 +1,550 @@
+"""
+Vectorized replay of the AHRS Madgwick filter on the host
+
+Runs recorded accel/gyro/mag streams through the same math as
+src/fusion/madgwick.py for many parameter sets at once: beta, betaHigh,
+declination and the magnetometer calibration, the 9 value magbias of
+AHRS.readMag or the 12 value magcal of AHRS.calibrateMag. The filter is
+recursive in time, so the loop runs over the samples. It runs in C, see
+kernel.c, built with the host C compiler on first use. Without a compiler
+the state of all sets is one (4, P) NumPy block updated in place through
+preallocated temporaries, and a handful of sets goes through the device
+kernels themselves, on Python floats.
+
+The gyro bias is corrected as on the device, by fusion.gyrobias.GyroBias
+with a fusion.gyrotemp.GyroTemperature table when the recording has the die
+temperature. It does not depend on the parameter sets, so it runs once, see
+unbias().
+
+The gain is scheduled as by the default Madgwick engine: betaHigh while
+converging after the start and after a disturbance, decaying back to beta,
+and no accel correction for samples whose accel norm is off 1g by more than
+reject. The schedule only depends on the accel norm and the sample times, so
+it is worked out once for all parameter sets by schedule().
+
+    import replay
+    data = replay.load('mission.csv')
+    result = replay.run(data, beta=np.linspace(0.05, 1.0, 40))
+    print(replay.report(result))
+"""
+import os
+import sys
+import ctypes
+import subprocess
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'simulator'))
+import sim
+
+sim.install()
+from array import array
+from qmath import batch
+from fusion.madgwick import update, updateIMU
+from fusion.gyrobias import GyroBias
+from fusion.gyrotemp import GyroTemperature
+
+# the defaults of fusion.madgwick.Madgwick
+BETA = np.sqrt(3.0 / 4.0) * np.radians(10)
+BETAHIGH = np.sqrt(3.0 / 4.0) * np.radians(90)
+CONVERGE = 2.0
+HOLD = 1.0
+BOOST = 0.1
+REJECT = 0.3
+
+# magbias that leaves the magnetometer untouched
+NOBIAS = (0, 0, 0, 1, 1, 1, 1, 1, 1)
+
+
+def load( filename ):
+    """
+    reads a csv recording with the columns
+        t, ax, ay, az, gx, gy, gz, mx, my, mz [, yaw, pitch, roll]
+    t in seconds, accel in g, gyro in degrees per second, mag after the factory
+    sensitivity adjustment but before the magbias. Empty mag fields mark samples
+    without a new magnetometer measurement. The optional reference attitude is in
+    degrees, empty fields are ignored.
+    returns a dict of arrays
+    """
+    rows = np.genfromtxt(filename, delimiter=',', skip_header=1, dtype=np.float64)
+    data = {
+        't': rows[:, 0],
+        'accel': rows[:, 1:4],
+        'gyro': rows[:, 4:7],
+        'mag': rows[:, 7:10],
+    }
+    if rows.shape[1] >= 13:
+        data['reference'] = rows[:, 10:13]
+    return data
+
+
+def _column( value, p ):
+    value = np.asarray(value, dtype=np.float64)
+    return np.broadcast_to(value, (p,) + value.shape[1:]) if value.ndim else np.full(p, float(value))
+
+
+def schedule( t, accel, converge=CONVERGE, hold=HOLD, boost=BOOST, reject=REJECT ):
+    """
+    the gain schedule of Madgwick.gain for the sample times t and the raw accel (N, 3)
+    returns the share of betaHigh - beta added to beta per sample, and the mask of the rejected samples
+    """
+    dt = np.diff(t, prepend=t[0])
+    dt[0] = 0.0001
+    deviation = np.abs(np.sqrt((accel * accel).sum(axis=1)) - 1.0)
+    disturbed = deviation > boost
+    rejected = deviation > reject
+    share = np.zeros(len(t))
+    remaining = converge
+    for i in range(len(t)):
+        if disturbed[i] and remaining < hold:
+            remaining = hold
+        if rejected[i] or remaining <= 0:
+            continue
+        remaining -= dt[i]
+        share[i] = min(1.0, max(0.0, remaining) / hold)
+    return share, rejected
+
+
+def unbias( data, estimate ):
+    """
+    the gyro of data in radians per second, corrected sample by sample by
+    estimate, a fusion.gyrobias.GyroBias, as AHRS does before the fusion.
+    With the raw die temperature 'temp' of logreader the bias follows a
+    GyroTemperature table, created when estimate has none, and the
+    temperature is handed over once a second as by AHRS.updateTemperature
+    """
+    temp = data.get('temp')
+    if temp is not None and estimate.table is None:
+        estimate.table = GyroTemperature()
+    t = data['t'].tolist()
+    handed = None
+    v = array('f', [0.0] * 6)
+    out = []
+    for i, (a, g) in enumerate(zip(data['accel'].tolist(), np.radians(data['gyro']).tolist())):
+        if temp is not None and (handed is None or t[i] - handed >= 1.0):
+            handed = t[i]
+            estimate.temperature(temp[i] / 333.87 + 21)
+        v[0] = a[0]
+        v[1] = a[1]
+        v[2] = a[2]
+        v[3] = g[0]
+        v[4] = g[1]
+        v[5] = g[2]
+        estimate.update(v)
+        out.append(v[3:6])
+    return np.array(out, dtype=np.float64).reshape(-1, 3)
+
+
+def _forms( *terms ):
+    """
+    the 4 x 4 symmetric matrices B of the quadratic forms q B q, each given as
+    a dict of (i, j): the coefficient of q[i] q[j]
+    """
+    b = np.zeros((len(terms), 4, 4))
+    for k, form in enumerate(terms):
+        for (i, j), c in form.items():
+            b[k, i, j] += c / 2
+            b[k, j, i] += c / 2
+    return b
+
+# The objective function of the Madgwick update as quadratic forms of q, their
+# constant terms and gradients. The gravity errors fg, the earth field errors fb
+# by _2bx and by _2bz, and the rotation matrix of q taking the magnetometer to
+# the earth frame, hx hy _2bz from its rows. The kernels of fusion.madgwick are
+# these written out term by term.
+_GRAVITY = ({(1, 3): 2, (0, 2): -2}, {(0, 1): 2, (2, 3): 2}, {(1, 1): -2, (2, 2): -2})
+_BX = ({(2, 2): -1, (3, 3): -1}, {(1, 2): 1, (0, 3): -1}, {(0, 2): 1, (1, 3): 1})
+_BZ = ({(1, 3): 1, (0, 2): -1}, {(0, 1): 1, (2, 3): 1}, {(1, 1): -1, (2, 2): -1})
+_ROTATION = ({(0, 0): 1, (1, 1): 1, (2, 2): -1, (3, 3): -1}, {(1, 2): 2, (0, 3): -2}, {(0, 2): 2, (1, 3): 2},
+             {(0, 3): 2, (1, 2): 2}, {(0, 0): 1, (1, 1): -1, (2, 2): 1, (3, 3): -1}, {(0, 1): -2, (2, 3): 2},
+             {(1, 3): 2, (0, 2): -2}, {(0, 1): 2, (2, 3): 2}, {(0, 0): 1, (1, 1): -1, (2, 2): -1, (3, 3): 1})
+_B = _forms(*(_GRAVITY + _BX + _BZ + _ROTATION))
+_W = _B.reshape(len(_B), 16)                # the forms from the 16 products q[i] q[j]
+_J = 2 * _B[:9].reshape(36, 4)              # the gradients of the errors, 4 rows each
+_GC = np.array([[0.0], [0.0], [1.0]])       # the constant terms of fg
+_XC = np.array([[0.5], [0.0], [0.0]])       # of fb by _2bx
+_ZC = np.array([[0.0], [0.0], [0.5]])       # of fb by _2bz
+_ONES = np.ones(4)                          # sums the 4 rows of a block in one matmul
+CHUNK = 256     # samples prepared at once
+KERNELS = 4     # sets up to which the device kernels beat the blocks
+
+
+def run( data, beta=BETA, betaHigh=BETAHIGH, declination=0.0, magbias=NOBIAS, q0=(1.0, 0.0, 0.0, 0.0), every=10,
+         history=False, converge=CONVERGE, hold=HOLD, boost=BOOST, reject=REJECT, magcal=None, gyrobias=True ):
+    """
+    replays data for P parameter sets, P is the longest of beta (P,), betaHigh (P,),
+    declination (P,), magbias (P, 9) and magcal (P, 12), scalars and single sets are broadcast
+    betaHigh = beta is a fixed gain, reject=np.inf turns the rejection off
+    converge, hold, boost, reject: the gain schedule of fusion.madgwick.Madgwick, shared by all sets
+    magcal: offset x, y, z and the soft iron matrix row by row, used instead of magbias as by AHRS
+    gyrobias: True corrects the gyro with a fresh GyroBias, False not at all, or the GyroBias to use
+    every: the attitude is compared with the reference every n samples
+    history: keep the yaw, pitch, roll of every compared sample, (N, P, 3)
+    returns a dict with the final quaternions 'q' (P, 4) and the error statistics
+
+    The sets run through the C loop, without a compiler up to KERNELS sets run
+    through the update kernels of fusion.madgwick and more are the columns of
+    NumPy blocks. Either way the attitude is compared once per CHUNK samples.
+    """
+    magbias = np.asarray(magbias, dtype=np.float64)
+    sizes = [np.size(beta), np.size(betaHigh), np.size(declination), magbias.size // 9]
+    if magcal is not None:
+        magcal = np.asarray(magcal, dtype=np.float64)
+        sizes.append(magcal.size // 12)
+    p = max(sizes)
+    beta = _column(beta, p)
+    betaHigh = _column(betaHigh, p)
+    declination = _column(declination, p)
+    magbias = np.broadcast_to(magbias.reshape(-1, 9), (p, 9))
+
+    # the magnetometer calibration as an offset (P, 3) and a matrix (P, 3, 3), calibrated = matrix (mag - offset)
+    if magcal is not None:
+        magcal = np.broadcast_to(magcal.reshape(-1, 12), (p, 12))
+        offset = magcal[:, 0:3].copy()
+        matrix = magcal[:, 3:12].reshape(p, 3, 3).copy()
+    else:
+        offset = magbias[:, 0:3].copy()
+        matrix = np.zeros((p, 3, 3))
+        matrix[:, [0, 1, 2], [0, 1, 2]] = magbias[:, 6:9] / magbias[:, 3:6]
+
+    t = data['t']
+    dt = np.diff(t, prepend=t[0])
+    dt[0] = 0.0001 # as AHRS.deltat, the 1st reading is invalid in any case
+
+    # parameter independent preprocessing for all samples at once
+    accel = data['accel']
+    share, rejected = schedule(t, accel, converge, hold, boost, reject)
+    valid = (accel != 0).any(axis=1)
+    if gyrobias is True:
+        gyrobias = GyroBias()
+    gyro = unbias(data, gyrobias) if gyrobias else np.radians(data['gyro'])
+    mag = data['mag']
+    hasmag = ~np.isnan(mag).any(axis=1)
+    compared = np.arange(len(t)) % every == 0
+    compared &= valid
+
+    if _compiled() is not None:
+        Stepper = _Compiled
+    else:
+        Stepper = _Kernels if p <= KERNELS else _Blocks
+    stepper = Stepper(q0, beta, betaHigh - beta, offset, matrix)
+    statistics = _Statistics(data.get('reference'), declination, history)
+    for c0 in range(0, len(t), CHUNK):
+        c1 = min(c0 + CHUNK, len(t))
+        index = np.flatnonzero(compared[c0:c1]) if statistics.active else np.zeros(0, dtype=int)
+        snapshots = stepper.chunk(accel[c0:c1], gyro[c0:c1], mag[c0:c1], hasmag[c0:c1], valid[c0:c1], dt[c0:c1],
+            share[c0:c1], rejected[c0:c1], index)
+        statistics.add(c0 + index, snapshots)
+
+    result = {'q': stepper.quaternions(), 'beta': beta, 'betaHigh': betaHigh, 'declination': declination,
+              'magbias': magbias, 'magcal': magcal, 'rejected': int(rejected.sum())}
+    statistics.finish(result)
+    return result
+
+
+class _Statistics(object):
+    """ the errors against the reference and the history, from the attitudes compared in a chunk """
+
+    def __init__( self, reference, declination, history ):
+        self.reference = reference
+        self.declination = declination
+        self.kept = [] if history else None
+        self.active = reference is not None or history
+        self.sumsq = np.zeros((len(declination), 3))
+        self.count = np.zeros(3)
+        self.worst = np.zeros((len(declination), 3))
+
+    def add( self, index, snapshots ):
+        """ snapshots: the quaternions (K, P, 4) at the samples index (K,) """
+        if not len(index):
+            return
+        ypr = batch.euler(snapshots)
+        ypr[..., 0] += self.declination
+        if self.kept is not None:
+            self.kept.append(ypr)
+        if self.reference is not None:
+            reference = self.reference[index]
+            known = ~np.isnan(reference)
+            e = np.where(known[:, None, :], wrap(ypr - np.where(known, reference, 0.0)[:, None, :]), 0.0)
+            self.sumsq += (e * e).sum(axis=0)
+            self.count += known.sum(axis=0)
+            np.maximum(self.worst, np.abs(e).max(axis=0), out=self.worst)
+
+    def finish( self, result ):
+        if self.reference is not None:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                result['rms'] = np.sqrt(self.sumsq / self.count)
+            result['max'] = self.worst
+        if self.kept is not None:
+            result['ypr'] = np.concatenate(self.kept) if self.kept else np.zeros((0, len(self.declination), 3))
+
+
+class _Kernels(object):
+    """ a few sets, each through update and updateIMU on lists of floats """
+
+    def __init__( self, q0, beta, boosted, offset, matrix ):
+        self.sets = [([float(x) for x in q0], b, h, o, w) for b, h, o, w in
+                     zip(beta.tolist(), boosted.tolist(), offset.tolist(), matrix.reshape(-1, 9).tolist())]
+
+    def chunk( self, accel, gyro, mag, hasmag, valid, dt, share, rejected, index ):
+        sets = self.sets
+        snapshots = np.empty((len(index), len(sets), 4))
+        index = index.tolist()
+        at = 0
+        v = [0.0] * 9
+        for j, (a, g, m, new, ok, h, f, skip) in enumerate(zip(accel.tolist(), gyro.tolist(), mag.tolist(),
+                hasmag.tolist(), valid.tolist(), dt.tolist(), share.tolist(), rejected.tolist())):
+            if ok:
+                v[0:3] = a
+                v[3:6] = g
+                for q, beta, boosted, offset, w in sets:
+                    gain = 0.0 if skip else beta + boosted * f
+                    if new:
+                        x = m[0] - offset[0]
+                        y = m[1] - offset[1]
+                        z = m[2] - offset[2]
+                        v[6] = w[0] * x + w[1] * y + w[2] * z
+                        v[7] = w[3] * x + w[4] * y + w[5] * z
+                        v[8] = w[6] * x + w[7] * y + w[8] * z
+                        update(q, v, gain, h)
+                    else:
+                        updateIMU(q, v, gain, h)
+            if at < len(index) and index[at] == j:
+                snapshots[at] = [s[0] for s in sets]
+                at += 1
+        return snapshots
+
+    def quaternions( self ):
+        return np.array([s[0] for s in self.sets])
+
+
+COMPILED = True  # run the sets through kernel.c when it can be built
+_library = None  # the loaded kernel.c, False when it cannot be built
+
+
+def _compiled():
+    """ the ctypes library of kernel.c, built with $CC or cc on first use, None without a compiler """
+    global _library
+    if not COMPILED:
+        return None
+    if _library is None:
+        _library = False
+        here = os.path.dirname(os.path.abspath(__file__))
+        source = os.path.join(here, 'kernel.c')
+        library = os.path.join(here, 'kernel.so')
+        try:
+            if not os.path.exists(library) or os.path.getmtime(library) < os.path.getmtime(source):
+                subprocess.run([os.environ.get('CC', 'cc'), '-O3', '-march=native', '-fno-math-errno', '-shared',
+                    '-fPIC', '-o', library, source, '-lm'], check=True, capture_output=True)
+            kernel = ctypes.CDLL(library)
+        except (OSError, subprocess.CalledProcessError):
+            return None
+        doubles = np.ctypeslib.ndpointer(np.float64, flags='C_CONTIGUOUS')
+        flags = np.ctypeslib.ndpointer(np.uint8, flags='C_CONTIGUOUS')
+        longs = np.ctypeslib.ndpointer(ctypes.c_long, flags='C_CONTIGUOUS')
+        kernel.replay.restype = None
+        kernel.replay.argtypes = [ctypes.c_long, ctypes.c_long, doubles, doubles, doubles, flags, flags, doubles,
+            doubles, doubles, doubles, doubles, doubles, doubles, ctypes.c_long, longs, doubles]
+        _library = kernel
+    return _library or None
+
+
+class _Compiled(object):
+    """ all sets through the C loop, one call per chunk, the sets in columns as kernel.c takes them """
+
+    def __init__( self, q0, beta, boosted, offset, matrix ):
+        self.q = np.empty((4, len(beta)))
+        self.q[:] = np.asarray(q0, dtype=np.float64)[:, None]
+        self.beta = np.ascontiguousarray(beta)
+        self.boosted = np.ascontiguousarray(boosted)
+        self.offset = np.ascontiguousarray(offset.T)
+        self.matrix = np.ascontiguousarray(matrix.reshape(len(beta), 9).T)
+
+    def chunk( self, accel, gyro, mag, hasmag, valid, dt, share, rejected, index ):
+        p = self.q.shape[1]
+        snapshots = np.empty((len(index), p, 4))
+        # the kernel skips a zero accel as the device does, valid is only needed by the blocks
+        _compiled().replay(len(dt), p, np.ascontiguousarray(accel), np.ascontiguousarray(gyro),
+            np.ascontiguousarray(mag), np.ascontiguousarray(hasmag).view(np.uint8),
+            np.ascontiguousarray(rejected).view(np.uint8), np.ascontiguousarray(dt), np.ascontiguousarray(share),
+            self.beta, self.boosted, self.offset, self.matrix, self.q, len(index),
+            np.ascontiguousarray(index, dtype=ctypes.c_long), snapshots)
+        return snapshots
+
+    def quaternions( self ):
+        return self.q.T.copy()
+
+
+class _Blocks(object):
+    """ many sets, the columns of NumPy blocks """
+
+    def __init__( self, q0, beta, boosted, offset, matrix ):
+        p = len(beta)
+        self.p = p
+        self.beta = beta
+        self.boosted = boosted
+        self.offset = offset.T.copy()                   # (3, P)
+        self.matrix = matrix.transpose(1, 2, 0).copy()  # (3, 3, P)
+        self.q = np.empty((4, p))
+        self.q[:] = np.asarray(q0, dtype=np.float64)[:, None]
+        self.integrated = np.empty((4, p))
+        self.products = np.empty((16, p))
+        self.forms = np.empty((len(_W), p))
+        self.gradients = np.empty((36, p))
+        self.terms = np.empty((36, p))
+        self.errors = np.empty((9, p))
+        self.rotated = np.empty((9, p))
+        self.field = np.empty((3, p))
+        self.bx = np.empty((3, p))
+        self.bz = np.empty((3, p))
+        self.step = np.empty((4, p))
+        self.squares = np.empty((4, p))
+        self.length = np.empty(p)
+        self.gain = np.empty(p)
+        self._2bx = np.empty(p)
+
+    def chunk( self, accel, gyro, mag, hasmag, valid, dt, share, rejected, index ):
+        p = self.p
+        q = self.q
+        beta = self.beta
+        boosted = self.boosted
+        integrated = self.integrated
+        products = self.products
+        forms = self.forms
+        gradients = self.gradients
+        terms = self.terms
+        errors = self.errors
+        rotated = self.rotated
+        field = self.field
+        bx = self.bx
+        bz = self.bz
+        step = self.step
+        squares = self.squares
+        length = self.length
+        gain = self.gain
+        _2bx = self._2bx
+
+        norm = np.sqrt((accel * accel).sum(axis=1))
+        accel = accel / np.where(valid, norm, 1)[:, None]
+        gravity = _GC - accel[:, :, None]
+        # q + 0.5 q * (0, g) dt as one matrix per sample
+        gx, gy, gz = (0.5 * dt * gyro[:, k] for k in range(3))
+        one = np.ones(len(dt))
+        gyros = np.stack((
+            np.stack((one, -gx, -gy, -gz), axis=-1),
+            np.stack((gx, one, gz, -gy), axis=-1),
+            np.stack((gy, -gz, one, gx), axis=-1),
+            np.stack((gz, gy, -gx, one), axis=-1)), axis=1)
+        # the normalised magnetometer of every set, a zero field leaves q unchanged as on the device
+        mags = np.einsum('ijp,njp->nip', self.matrix, mag[:, :, None] - self.offset[None])
+        norms = np.sqrt((mags * mags).sum(axis=1))
+        dead = (norms == 0) & hasmag[:, None]
+        mags /= np.where(norms == 0, 1.0, norms)[:, None, :]
+
+        snapshots = np.empty((len(index), p, 4))
+        at = 0
+        for j in range(len(dt)):
+            if valid[j]:
+                if not rejected[j]:
+                    np.multiply(q[:, None, :], q[None, :, :], out=products.reshape(4, 4, p))
+                    if hasmag[j]:
+                        m = mags[j]
+                        np.matmul(_W, products, out=forms)
+                        np.matmul(_J, q, out=gradients)
+                        # hx, hy, _2bz, the magnetometer in the earth frame
+                        np.multiply(forms[9:18].reshape(3, 3, p), m[None, :, :], out=rotated.reshape(3, 3, p))
+                        np.add(rotated[0::3], rotated[1::3], out=field)
+                        field += rotated[2::3]
+                        np.hypot(field[0], field[1], out=_2bx)
+                        _2bz = field[2]
+                        # the errors, weighted by the factors of their gradients
+                        np.add(forms[0:3], gravity[j], out=errors[0:3])
+                        np.add(forms[3:6], _XC, out=bx)
+                        bx *= _2bx
+                        np.add(forms[6:9], _ZC, out=bz)
+                        bz *= _2bz
+                        bx += bz
+                        bx -= m
+                        np.multiply(bx, _2bx, out=errors[3:6])
+                        np.multiply(bx, _2bz, out=errors[6:9])
+                        rows = 9
+                    else:
+                        np.matmul(_W[0:3], products, out=forms[0:3])
+                        np.matmul(_J[0:12], q, out=gradients[0:12])
+                        np.add(forms[0:3], gravity[j], out=errors[0:3])
+                        rows = 3
+                    np.multiply(gradients[:4 * rows].reshape(rows, 4, p), errors[:rows, None, :],
+                        out=terms[:4 * rows].reshape(rows, 4, p))
+                    np.sum(terms[:4 * rows].reshape(rows, 4, p), axis=0, out=step)
+
+                    # normalise step magnitude, a zero step means we are already at the minimum
+                    np.multiply(step, step, out=squares)
+                    np.matmul(_ONES, squares, out=length)
+                    np.sqrt(length, out=length)
+                    np.maximum(length, 1e-300, out=length)
+                    if share[j]:
+                        np.multiply(boosted, share[j], out=gain)
+                        gain += beta
+                        np.divide(gain, length, out=gain)
+                    else:
+                        np.divide(beta, length, out=gain)
+                    gain *= dt[j]
+                    step *= gain
+
+                np.matmul(gyros[j], q, out=integrated)
+                if not rejected[j]:
+                    integrated -= step
+                np.multiply(integrated, integrated, out=squares)
+                np.matmul(_ONES, squares, out=length)
+                np.sqrt(length, out=length)
+                if hasmag[j] and dead[j].any():
+                    integrated /= length
+                    q[:] = np.where(dead[j], q, integrated)
+                else:
+                    np.divide(integrated, length, out=q)
+
+            if at < len(index) and index[at] == j:
+                snapshots[at] = q.T
+                at += 1
+        return snapshots
+
+    def quaternions( self ):
+        return self.q.T.copy()
+
+
+def euler( q1, q2, q3, q4, declination=0.0 ):
+    """ yaw, pitch and roll in degrees, (P, 3), the same convention as AHRS """
+    ypr = batch.euler(np.stack((q1, q2, q3, q4), axis=-1))
+    ypr[:, 0] += declination
+    return ypr
+
+
+def wrap( angle ):
+    """ wraps degrees to -180..180 """
+    return (angle + 180.0) % 360.0 - 180.0
+
+
+def report( result ):
+    """ a table of the parameter sets sorted by the heading rms error """
+    lines = ["   beta  betaHigh  declination   yaw rms  yaw max  pitch rms  roll rms"]
+    order = np.argsort(result['rms'][:, 0])
+    for i in order:
+        lines.append("{:7.3f} {:9.3f} {:12.2f} {:9.2f} {:8.2f} {:10.2f} {:9.2f}".format(
+            result['beta'][i], result['betaHigh'][i], result['declination'][i], result['rms'][i, 0], result['max'][i, 0],
+            result['rms'][i, 1], result['rms'][i, 2]))
+    return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+    if len(sys.argv) < 2:
+        print("usage: py ./tools/replay/replay.py recording.csv [beta_min beta_max steps]")
+        sys.exit(1)
+    data = load(sys.argv[1])
+    lo, hi, steps = (float(sys.argv[2]), float(sys.argv[3]), int(sys.argv[4])) if len(sys.argv) > 4 else (0.02, 1.0, 50)
+    start = time.perf_counter()
+    result = run(data, beta=np.linspace(lo, hi, steps))
+    elapsed = time.perf_counter() - start
+    print("{} samples x {} parameter sets in {:.1f}s".format(len(data['t']), steps, elapsed))
+    if 'rms' in result:
+        print(report(result))
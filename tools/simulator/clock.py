@@ -0,0 +1,40 @@
+"""
+The simulator clock
+
+Virtual by default: time only moves with the modelled I2C wire time, the
+utime sleeps and explicit advance() calls, so a run is deterministic and
+independent of the host speed. realtime() switches to the host clock.
+"""
+import time
+
+_virtual = True
+_now = 0.0
+_start = time.perf_counter()
+
+
+def realtime():
+    global _virtual
+    _virtual = False
+
+def virtual():
+    global _virtual, _now
+    _virtual = True
+    _now = 0.0
+
+def now():
+    """ seconds since the start """
+    if _virtual:
+        return _now
+    return time.perf_counter() - _start
+
+def advance( seconds ):
+    """ moves the virtual clock, e.g. by the modelled CPU time of a step """
+    global _now
+    if _virtual:
+        _now += seconds
+
+def sleep( seconds ):
+    if _virtual:
+        advance(seconds)
+    else:
+        time.sleep(seconds)
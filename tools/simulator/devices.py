@@ -0,0 +1,273 @@
+"""
+Register map models of the devices on the RoboBuoy I2C bus
+
+The sensors replay a motion source (see motion.py) against the simulator clock:
+the MPU9250 output registers and FIFO update at the configured sample rate and
+the AK8963 measures at 8 or 100Hz with the DRDY, DOR and HOFL status bits and
+the data protection of the real part, so drivers that skip ST2 or poll too fast
+misbehave here as they would on the boat.
+"""
+from struct import pack, pack_into
+import clock
+import motion
+
+
+class Registers(object):
+    """ a 256 byte register file with auto increment """
+
+    def __init__( self ):
+        self.regs = bytearray(256)
+
+    def present( self ):
+        """ False while the device does not answer on the bus """
+        return True
+
+    def read( self, reg, n ):
+        self.update(reg, n)
+        return self.regs[reg:reg + n]
+
+    def write( self, reg, data ):
+        self.regs[reg:reg + len(data)] = data
+
+    def update( self, reg, n ):
+        """ hook to refresh the registers before a read """
+        pass
+
+
+def _int16( x ):
+    return max(-32768, min(32767, int(round(x))))
+
+
+class MPU9250(Registers):
+    """
+    accel, temperature and gyro output registers 0x3B..0x48, the full scale
+    ranges, sample rate divider, H_RESET, the I2C bypass and the FIFO
+    source: a motion source, default a level boat at rest
+    temperature: die temperature in degrees C, may be changed while running
+    tempco: gyro bias drift in degrees per second per degree C away from 25C
+    """
+
+    def __init__( self, source=None, temperature=25.0, tempco=(0.0, 0.0, 0.0) ):
+        Registers.__init__(self)
+        self.source = source or motion.still()
+        self.temperature = temperature
+        self.tempco = tempco
+        self.reset()
+
+    def reset( self ):
+        self.regs[:] = bytes(256)
+        self.regs[0x6B] = 0x01 # PWR_MGMT_1 clock source auto
+        self.regs[0x75] = 0x71 # WHO_AM_I
+        self.latched = None
+        self.fifo = bytearray()
+        self.fifoTime = clock.now()
+
+    def bypass( self ):
+        """ True when INT_PIN_CFG BYPASS_EN connects the AK8963 to the bus """
+        return self.regs[0x37] & 0x02 == 0x02
+
+    def rate( self ):
+        """ sample rate in Hz, the divider only applies with the DLPF enabled """
+        if 0 < self.regs[0x1A] & 0x07 < 7:
+            return 1000.0 / (1 + self.regs[0x19])
+        return 8000.0
+
+    def sample( self, t ):
+        """ the raw accel, temperature and gyro counts at time t """
+        accel, gyro, _ = self.source.at(t)
+        a = 16384 >> ((self.regs[0x1C] >> 3) & 3)
+        g = 131.0 / (1 << ((self.regs[0x1B] >> 3) & 3))
+        drift = self.temperature - 25.0
+        tx, ty, tz = self.tempco
+        return (_int16(accel[0] * a), _int16(accel[1] * a), _int16(accel[2] * a),
+            _int16((self.temperature - 21.0) * 333.87),
+            _int16((gyro[0] + tx * drift) * g), _int16((gyro[1] + ty * drift) * g), _int16((gyro[2] + tz * drift) * g))
+
+    def read( self, reg, n ):
+        if reg == 0x74: # FIFO_R_W does not auto increment, it pops the FIFO
+            self.fill()
+            data = self.fifo[:n]
+            del self.fifo[:n]
+            return data + bytes(n - len(data))
+        return Registers.read(self, reg, n)
+
+    def write( self, reg, data ):
+        if reg == 0x6B and data[0] & 0x80: # PWR_MGMT_1 H_RESET
+            self.reset()
+            return
+        Registers.write(self, reg, data)
+        if reg <= 0x6A < reg + len(data) and self.regs[0x6A] & 0x04: # USER_CTRL FIFO_RST
+            self.regs[0x6A] &= ~0x04
+            self.fifo = bytearray()
+            self.fifoTime = clock.now()
+
+    def update( self, reg, n ):
+        if reg <= 0x48 and reg + n > 0x3B:
+            rate = self.rate()
+            index = int(clock.now() * rate)
+            if index != self.latched:
+                self.latched = index
+                pack_into('>hhhhhhh', self.regs, 0x3B, *self.sample(index / rate))
+        if reg <= 0x73 and reg + n > 0x72:
+            self.fill()
+            pack_into('>H', self.regs, 0x72, len(self.fifo))
+
+    def fill( self ):
+        """ pushes the samples taken since the last fill, accel and gyro only """
+        period = 1.0 / self.rate()
+        samples = int((clock.now() - self.fifoTime) / period)
+        if not (self.regs[0x6A] & 0x40 and self.regs[0x23] & 0x78 == 0x78):
+            self.fifoTime += samples * period
+            return
+        for _ in range(samples):
+            self.fifoTime += period
+            stop = self.regs[0x1A] & 0x40 # FIFO_MODE, stop writing when full
+            if stop and len(self.fifo) >= 512:
+                continue
+            ax, ay, az, _, gx, gy, gz = self.sample(self.fifoTime)
+            self.fifo += pack('>hhhhhh', ax, ay, az, gx, gy, gz)
+            if stop:
+                del self.fifo[512:] # the FIFO fills up to its last byte, part of a sample
+            else:
+                del self.fifo[:-504]
+
+
+class AK8963(Registers):
+    """
+    magnetometer behind the MPU9250 bypass, present only while host.bypass()
+    source: a motion source, the field is taken in the AHRS axes and mapped to
+        the sensor axes HX = y, HY = x, HZ = -z
+    asa: fuse ROM sensitivity adjustment values, readable in fuse ROM mode only
+    """
+
+    def __init__( self, source=None, host=None, asa=(0xB0, 0xB2, 0xA8) ):
+        Registers.__init__(self)
+        self.source = source or motion.still()
+        self.host = host
+        self.asa = bytes(asa)
+        self.reset()
+
+    def reset( self ):
+        self.regs[:] = bytes(256)
+        self.regs[0x00] = 0x48 # WIA
+        self.regs[0x01] = 0x9A # INFO
+        self.start = clock.now()
+        self.measured = 0       # index of the last measurement since the mode change
+        self.protected = False  # data read started, registers locked until ST2 is read
+
+    def present( self ):
+        return self.host is None or self.host.bypass()
+
+    def mode( self ):
+        return self.regs[0x0A] & 0x0F
+
+    def write( self, reg, data ):
+        if reg == 0x0B and data[0] & 0x01: # CNTL2 SRST
+            self.reset()
+            return
+        Registers.write(self, reg, data)
+        if reg <= 0x0A < reg + len(data):
+            self.start = clock.now()
+            self.measured = 0
+            self.protected = False
+
+    def read( self, reg, n ):
+        self.update(reg, n)
+        data = bytearray(self.regs[reg:reg + n])
+        if reg <= 0x12 and reg + n > 0x10 and self.mode() != 0x0F:
+            for r in range(max(reg, 0x10), min(reg + n, 0x13)):
+                data[r - reg] = 0 # the fuse ROM reads as zero outside fuse ROM mode
+
+        if reg <= 0x08 and reg + n > 0x03:
+            self.regs[0x02] &= ~0x03 # reading the data clears DRDY and DOR
+            self.protected = True
+        if reg <= 0x09 < reg + n:
+            self.regs[0x02] &= ~0x03
+            self.protected = False  # reading ST2 ends the data protection
+        return data
+
+    def update( self, reg, n ):
+        self.regs[0x10:0x13] = self.asa
+        mode = self.mode()
+        if mode in (0x02, 0x06):  # continuous measurement 1 and 2, 8 and 100Hz
+            index = int((clock.now() - self.start) * (8.0 if mode == 0x02 else 100.0))
+        elif mode == 0x01:        # single measurement, done after 7.2ms
+            index = 1 if clock.now() - self.start >= 0.0072 else 0
+        else:
+            return
+        if index <= self.measured:
+            return
+        self.measured = index
+        if mode == 0x01:
+            self.regs[0x0A] &= 0xF0 # back to power down
+        if self.protected:
+            return # skipped, the data registers are locked
+        if self.regs[0x02] & 0x01:
+            self.regs[0x02] |= 0x02 # DOR, the previous measurement was not read
+        self.measure()
+        self.regs[0x02] |= 0x01   # DRDY
+
+    def measure( self ):
+        _, _, (x, y, z) = self.source.at(clock.now())
+        bit16 = self.regs[0x0A] & 0x10
+        limit = 32760 if bit16 else 8190
+        raw = []
+        for field, asa in ((y, self.asa[0]), (x, self.asa[1]), (-z, self.asa[2])):
+            counts = field / ((asa - 128) * 0.5 / 128 + 1)
+            raw.append(counts if bit16 else counts / 4)
+        st2 = bit16
+        if any(abs(v) > limit for v in raw):
+            st2 |= 0x08 # HOFL, the data is invalid
+            raw = [max(-limit, min(limit, v)) for v in raw]
+        pack_into('<hhhB', self.regs, 0x03, _int16(raw[0]), _int16(raw[1]), _int16(raw[2]), st2)
+
+
+class Clash(object):
+    """
+    two devices at one address, present when either is. Reads answer only while
+    exactly one of them is present, otherwise both drive the bus and the
+    transaction fails
+    """
+
+    def __init__( self, *devices ):
+        self.devices = devices
+
+    def present( self ):
+        return any(device.present() for device in self.devices)
+
+    def _one( self ):
+        present = [device for device in self.devices if device.present()]
+        if len(present) != 1:
+            raise OSError(5) # EIO, garbled by the collision
+        return present[0]
+
+    def read( self, reg, n ):
+        return self._one().read(reg, n)
+
+    def write( self, reg, data ):
+        for device in self.devices:
+            if device.present():
+                device.write(reg, data)
+
+
+class IP5306(Registers):
+    """
+    the power management SOC, battery level in 25% steps and charge status
+    level, charging and full may be changed while running
+    """
+
+    LEVELS = ((0, 0xF0), (25, 0xE0), (50, 0xC0), (75, 0x80), (100, 0x00))
+
+    def __init__( self, level=75, charging=False, full=False ):
+        Registers.__init__(self)
+        self.level = level
+        self.charging = charging
+        self.full = full
+
+    def update( self, reg, n ):
+        self.regs[0x70] = 0x08 if self.charging else 0x00
+        self.regs[0x71] = 0x08 if self.full else 0x00
+        for level, bits in self.LEVELS:
+            if self.level <= level:
+                self.regs[0x78] = bits
+                break
@@ -0,0 +1,69 @@
+"""
+A simulated machine.I2C bus
+
+Devices are attached by address and answer register reads and writes.
+Every transaction is counted in total and per device, and its duration on the
+wire is modelled from the bus frequency and added to the simulator clock.
+"""
+import clock
+
+
+class FakeI2C(object):
+
+    default = None  # the bus machine.I2C() hands out, set by sim.bus()
+
+    def __init__( self, id=0, scl=None, sda=None, freq=400000 ):
+        self.freq = freq
+        self.devices = {}
+        self.reset()
+
+    def reset( self ):
+        """ clears the transaction counters """
+        self.transactions = 0
+        self.bytes = 0
+        self.bits = 0
+        self.stats = {}   # address: [transactions, bytes, bits]
+
+    def attach( self, address, device ):
+        self.devices[address] = device
+        return device
+
+    def busTime( self ):
+        """ modelled time in seconds spent on the wire since the last reset """
+        return self.bits / self.freq
+
+    def _device( self, addr ):
+        device = self.devices.get(addr)
+        if device is None or not device.present():
+            raise OSError(19) # ENODEV, as MicroPython reports a missing device
+        return device
+
+    def _count( self, addr, nbytes, restart ):
+        # start + address + register byte, a repeated start + address for reads,
+        # then the payload. Each byte is 9 clocks including the ACK, plus start/stop
+        bits = 2 + 9 * (2 + nbytes) + (10 if restart else 0)
+        self.transactions += 1
+        self.bytes += nbytes
+        self.bits += bits
+        stats = self.stats.setdefault(addr, [0, 0, 0])
+        stats[0] += 1
+        stats[1] += nbytes
+        stats[2] += bits
+        clock.advance(bits / self.freq)
+
+    def scan( self ):
+        return sorted(addr for addr, device in self.devices.items() if device.present())
+
+    def readfrom_mem( self, addr, memaddr, nbytes, addrsize=8 ):
+        data = self._device(addr).read(memaddr, nbytes)
+        self._count(addr, nbytes, True)
+        return bytes(data)
+
+    def readfrom_mem_into( self, addr, memaddr, buf, addrsize=8 ):
+        data = self._device(addr).read(memaddr, len(buf))
+        buf[:] = data
+        self._count(addr, len(buf), True)
+
+    def writeto_mem( self, addr, memaddr, buf, addrsize=8 ):
+        self._device(addr).write(memaddr, bytes(buf))
+        self._count(addr, len(buf), False)
@@ -0,0 +1,84 @@
+"""
+A simulated machine.UART receiving a byte stream at the line rate
+
+Bytes fed in arrive one character time (10 bits) apart on the simulator clock
+and wait in a receive buffer of rxbuf bytes, as in the ESP32 UART driver.
+Bytes arriving while the buffer is full are lost and counted, so a driver that
+polls too rarely misbehaves here as it would on the boat.
+"""
+import clock
+
+
+class FakeUART(object):
+
+    default = None  # the port machine.UART() hands out, set by sim.uart()
+
+    def __init__( self, id=2, baudrate=9600, rxbuf=256, **kwargs ):
+        self.baudrate = baudrate
+        self.rxbuf = rxbuf
+        self.stream = bytearray()   # everything fed, in arrival order
+        self.start = clock.now()    # arrival of stream[0]
+        self.received = 0           # bytes of stream that have arrived
+        self.rx = bytearray()       # the receive buffer
+        self.lost = 0
+        self.written = bytearray()  # what the driver sent
+
+    def init( self, baudrate=None, **kwargs ):
+        """ a new line rate, for what arrives from now on """
+        if baudrate:
+            self.receive()
+            del self.stream[:self.received]
+            self.received = 0
+            self.start = clock.now()
+            self.baudrate = baudrate
+
+    def feed( self, data ):
+        """ queues data to arrive after what is already queued, or from now when idle """
+        self.receive()
+        if self.received == len(self.stream):
+            del self.stream[:]
+            self.received = 0
+            self.start = clock.now()
+        self.stream += data
+
+    def pending( self ):
+        """ bytes fed that have not arrived yet """
+        self.receive()
+        return len(self.stream) - self.received
+
+    def receive( self ):
+        arrived = min(len(self.stream), int((clock.now() - self.start) * self.baudrate / 10))
+        new = arrived - self.received
+        if new <= 0:
+            return
+        take = min(new, self.rxbuf - len(self.rx))
+        self.rx += self.stream[self.received:self.received + take]
+        self.lost += new - take
+        self.received = arrived
+
+    def any( self ):
+        self.receive()
+        return len(self.rx)
+
+    def read( self, nbytes=None ):
+        self.receive()
+        n = len(self.rx) if nbytes is None else min(nbytes, len(self.rx))
+        if not n:
+            return None
+        data = bytes(self.rx[:n])
+        del self.rx[:n]
+        return data
+
+    def readinto( self, buf, nbytes=None ):
+        self.receive()
+        n = min(len(buf) if nbytes is None else nbytes, len(self.rx))
+        if not n:
+            return None
+        buf[:n] = self.rx[:n]
+        del self.rx[:n]
+        return n
+
+    def write( self, data ):
+        self.written += data
+        clock.advance(len(data) * 10 / self.baudrate)
+        return len(data)
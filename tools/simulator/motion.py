@@ -0,0 +1,140 @@
+"""
+Synthetic boat motion with known truth
+
+A boat turning slowly while rolling and pitching in waves. Each sample carries the
+true attitude and the ideal sensor readings in the frame the fusion engines use:
+accel in g, gyro in radians per second, mag as the earth field seen by the sensor.
+Gyro bias and noise are added so the engines have something to correct.
+
+Recording, synthetic() and still() turn motion into sources for the simulated
+sensors in devices.py, which replay it against the simulator clock.
+"""
+import random
+from bisect import bisect_right
+from math import sin, cos, sqrt, radians, degrees, atan2, asin
+
+# earth field with a 60 degree inclination, arbitrary units
+FIELD = (cos(radians(60)), 0.0, -sin(radians(60)))
+
+
+def qmul( a, b ):
+    return (a[0] * b[0] - a[1] * b[1] - a[2] * b[2] - a[3] * b[3],
+            a[0] * b[1] + a[1] * b[0] + a[2] * b[3] - a[3] * b[2],
+            a[0] * b[2] - a[1] * b[3] + a[2] * b[0] + a[3] * b[1],
+            a[0] * b[3] + a[1] * b[2] - a[2] * b[1] + a[3] * b[0])
+
+def toSensor( q, v ):
+    """ rotates the earth frame vector v into the sensor frame of q """
+    w, x, y, z = q
+    conj = (w, -x, -y, -z)
+    r = qmul(qmul(conj, (0.0, v[0], v[1], v[2])), q)
+    return r[1], r[2], r[3]
+
+def ypr( q ):
+    """ yaw, pitch and roll in degrees, the same convention as AHRS """
+    return (degrees(atan2(2.0 * (q[1] * q[2] + q[0] * q[3]), q[0] * q[0] + q[1] * q[1] - q[2] * q[2] - q[3] * q[3])),
+            degrees(-asin(max(-1.0, min(1.0, 2.0 * (q[1] * q[3] - q[0] * q[2]))))),
+            degrees(atan2(2.0 * (q[0] * q[1] + q[2] * q[3]), q[0] * q[0] - q[1] * q[1] - q[2] * q[2] + q[3] * q[3])))
+
+
+def boat( seconds=60, rate=100, yaw=90, bias=(0.5, -0.3, 0.4), gyroNoise=0.05, accelNoise=0.01, magNoise=0.01,
+          slam=None, seed=1 ):
+    """
+    returns a list of samples (t, accel, gyro, mag, q) at rate Hz
+    yaw: initial heading in degrees
+    bias and gyroNoise in degrees per second, accelNoise in g, magNoise relative to the field
+    slam: time in seconds of a wave slam, a 0.3s burst of acceleration and a sudden heel
+    """
+    rnd = random.Random(seed)
+    dt = 1.0 / rate
+    b = [radians(x) for x in bias]
+    q = (cos(radians(yaw) / 2), 0.0, 0.0, sin(radians(yaw) / 2))
+    samples = []
+
+    for i in range(int(seconds * rate)):
+        t = i * dt
+
+        # body rates: a slow turn with roll and pitch from the waves
+        wx = radians(12) * cos(2 * 3.14159 * 0.25 * t)
+        wy = radians(6) * cos(2 * 3.14159 * 0.17 * t + 1.0)
+        wz = radians(8) * sin(2 * 3.14159 * 0.01 * t)
+        shock = (0.0, 0.0, 0.0)
+        if slam is not None and slam <= t < slam + 0.3:
+            wx += radians(60)
+            shock = (0.8, 0.5, 1.5)
+
+        accel = toSensor(q, (0.0, 0.0, 1.0))
+        mag = toSensor(q, FIELD)
+        samples.append((t,
+            tuple(accel[k] + shock[k] + rnd.gauss(0, accelNoise) for k in range(3)),
+            (wx + b[0] + rnd.gauss(0, radians(gyroNoise)),
+             wy + b[1] + rnd.gauss(0, radians(gyroNoise)),
+             wz + b[2] + rnd.gauss(0, radians(gyroNoise))),
+            tuple(mag[k] + rnd.gauss(0, magNoise) for k in range(3)),
+            q))
+
+        # integrate the true attitude
+        dq = qmul(q, (0.0, wx, wy, wz))
+        q = tuple(q[k] + 0.5 * dq[k] * dt for k in range(4))
+        norm = 1 / sqrt(sum(x * x for x in q))
+        q = tuple(x * norm for x in q)
+
+    return samples
+
+
+class Recording(object):
+    """
+    a motion source for the simulated sensors, replaying data in the format of
+    tools/replay (replay.load, logreader.load): a dict of t in seconds, accel in g,
+    gyro in degrees per second and mag in the AHRS axes, NaN when not new.
+    at(t) returns the sample in effect at t, holding the last magnetometer reading
+    loop: start over at the end instead of holding the last sample
+    """
+
+    def __init__( self, data, loop=True ):
+        self.t = [float(x) for x in data['t']]
+        self.accel = [tuple(float(x) for x in a) for a in data['accel']]
+        self.gyro = [tuple(float(x) for x in g) for g in data['gyro']]
+        self.mag = []
+        held = (0.0, 0.0, 0.0)
+        for m in data['mag']:
+            if m[0] == m[0]: # not NaN
+                held = tuple(float(x) for x in m)
+            self.mag.append(held)
+        self.loop = loop
+        self.duration = self.t[-1] - self.t[0] + (self.t[-1] - self.t[-2] if len(self.t) > 1 else 0.0)
+
+    def at( self, t ):
+        t += self.t[0]
+        if self.loop and self.duration > 0:
+            t = self.t[0] + (t - self.t[0]) % self.duration
+        i = max(0, bisect_right(self.t, t) - 1)
+        return self.accel[i], self.gyro[i], self.mag[i]
+
+
+def still( yaw=0.0, field=300.0 ):
+    """ a level boat at rest heading yaw degrees, mag in raw counts """
+    q = (cos(radians(yaw) / 2), 0.0, 0.0, sin(radians(yaw) / 2))
+    source = Recording({
+        't': [0.0],
+        'accel': [toSensor(q, (0.0, 0.0, 1.0))],
+        'gyro': [(0.0, 0.0, 0.0)],
+        'mag': [tuple(x * field for x in toSensor(q, FIELD))],
+    })
+    source.truth = [q]
+    return source
+
+def synthetic( field=300.0, **kwargs ):
+    """
+    boat() as a Recording, with the gyro in degrees per second and the unit
+    earth field scaled to field raw counts. The truth is kept in .truth
+    """
+    samples = boat(**kwargs)
+    source = Recording({
+        't': [s[0] for s in samples],
+        'accel': [s[1] for s in samples],
+        'gyro': [tuple(degrees(x) for x in s[2]) for s in samples],
+        'mag': [tuple(x * field for x in s[3]) for s in samples],
+    })
+    source.truth = [s[4] for s in samples]
+    return source
@@ -0,0 +1,28 @@
+"""
+CPython stand in for the MicroPython machine module
+I2C returns the simulated bus built by sim.bus(), see tools/simulator/fakei2c.py
+UART returns the simulated port built by sim.uart(), see tools/simulator/fakeuart.py
+"""
+import fakei2c
+import fakeuart
+
+def I2C( *args, **kwargs ):
+    return fakei2c.FakeI2C.default or fakei2c.FakeI2C(*args, **kwargs)
+
+def UART( *args, **kwargs ):
+    return fakeuart.FakeUART.default or fakeuart.FakeUART(*args, **kwargs)
+
+class Pin(object):
+
+    IN = 0
+    OUT = 1
+    PULL_UP = 2
+
+    def __init__( self, id, mode=None, pull=None ):
+        self.id = id
+        self._value = 1
+
+    def value( self, v=None ):
+        if v is not None:
+            self._value = v
+        return self._value
@@ -0,0 +1,13 @@
+"""
+CPython stand in for the MicroPython micropython module
+the code emitters are no-ops on the host
+"""
+
+def const( value ):
+    return value
+
+def native( f ):
+    return f
+
+def viper( f ):
+    return f
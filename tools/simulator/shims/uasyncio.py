@@ -0,0 +1,51 @@
+"""
+CPython stand in for the MicroPython uasyncio module, driven by the simulator clock
+
+run() uses an event loop whose time is clock.now(). When nothing is ready the
+virtual clock jumps to the next timer instead of waiting for it, and the time
+skipped is counted in the idle of the loop, so a coroutine that blocks in the
+utime sleeps does not count as idle.
+"""
+import selectors
+from asyncio import *
+from asyncio import Runner, SelectorEventLoop, get_running_loop
+import clock
+
+
+class _Selector(selectors.DefaultSelector):
+
+    def __init__( self, loop ):
+        selectors.DefaultSelector.__init__(self)
+        self.loop = loop
+
+    def select( self, timeout=None ):
+        if clock._virtual and timeout:
+            clock.advance(timeout)
+            self.loop.idle += timeout
+            timeout = 0
+        return selectors.DefaultSelector.select(self, timeout)
+
+
+class _Loop(SelectorEventLoop):
+
+    def __init__( self ):
+        self.idle = 0.0     # seconds the loop slept with nothing to run
+        SelectorEventLoop.__init__(self, _Selector(self))
+
+    def time( self ):
+        return clock.now()
+
+
+def run( main ):
+    with Runner(loop_factory=_Loop) as runner:
+        return runner.run(main)
+
+def idle():
+    """ seconds the running loop slept so far """
+    return get_running_loop().idle
+
+async def sleep_ms( ms ):
+    await sleep(ms / 1000)
+
+async def wait_for_ms( awaitable, timeout ):
+    return await wait_for(awaitable, timeout / 1000)
@@ -0,0 +1,4 @@
+"""
+CPython stand in for the MicroPython ustruct module
+"""
+from struct import *
@@ -0,0 +1,27 @@
+"""
+CPython stand in for the MicroPython utime module, driven by the simulator clock
+"""
+import clock
+
+TICKS_PERIOD = 1 << 30 # as on the ESP32
+
+def ticks_us():
+    return int(clock.now() * 1000000) % TICKS_PERIOD
+
+def ticks_ms():
+    return int(clock.now() * 1000) % TICKS_PERIOD
+
+def ticks_diff( a, b ):
+    return ((a - b + TICKS_PERIOD // 2) % TICKS_PERIOD) - TICKS_PERIOD // 2
+
+def ticks_add( ticks, delta ):
+    return (ticks + delta) % TICKS_PERIOD
+
+def sleep_us( us ):
+    clock.sleep(us / 1000000)
+
+def sleep_ms( ms ):
+    clock.sleep(ms / 1000)
+
+def sleep( s ):
+    clock.sleep(s)
@@ -0,0 +1,103 @@
+"""
+Runs the device code from ./src on CPython against a simulated I2C bus
+
+    import sim
+    sim.install()
+    bus = sim.bus(motion.synthetic(seconds=60))
+    from drivers.ahrs import AHRS
+    ahrs = AHRS(i2c=bus)
+
+Time comes from clock.py and is virtual unless install(realtime=True): it moves
+with the modelled wire time of every transaction and with the utime sleeps, so
+runs are deterministic and bus traffic per step can be checked exactly.
+"""
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(HERE, '..', '..', 'src')
+
+
+def install( realtime=False ):
+    """ puts the MicroPython shims and ./src on the import path """
+    import builtins
+    for name in ('ptr', 'ptr8', 'ptr16', 'ptr32', 'uint'):
+        if not hasattr(builtins, name):
+            setattr(builtins, name, object) # viper type annotations
+    for path in (HERE, os.path.join(HERE, 'shims'), SRC):
+        path = os.path.normpath(path)
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    if realtime:
+        import clock
+        clock.realtime()
+
+
+def bus( source=None, freq=400000, temperature=25.0, battery=75, imus=1 ):
+    """
+    returns a simulated bus with the MPU9250 at 0x69, the AK8963 behind its bypass
+    at 0x0C and the IP5306 at 0x75, both sensors replaying source (see motion.py).
+    imus=2 adds a second MPU9250 at 0x68 with its own AK8963, which clashes at 0x0C
+    when both bypasses are open, as on the real bus.
+    The bus also becomes the one machine.I2C() returns
+    """
+    install()
+    from fakei2c import FakeI2C
+    from devices import MPU9250, AK8963, IP5306, Clash
+    i2c = FakeI2C(freq=freq)
+    mpu = i2c.attach(0x69, MPU9250(source, temperature))
+    i2c.attach(0x0C, AK8963(source, host=mpu))
+    if imus > 1:
+        second = i2c.attach(0x68, MPU9250(source, temperature))
+        i2c.attach(0x0C, Clash(i2c.devices[0x0C], AK8963(source, host=second)))
+    i2c.attach(0x75, IP5306(battery))
+    FakeI2C.default = i2c
+    return i2c
+
+
+def uart( data=b'', baudrate=38400, rxbuf=1024 ):
+    """
+    returns a simulated UART that receives data at baudrate from now on, more
+    can be fed later. The port also becomes the one machine.UART() returns
+    """
+    install()
+    from fakeuart import FakeUART
+    port = FakeUART(baudrate=baudrate, rxbuf=rxbuf)
+    port.feed(data)
+    FakeUART.default = port
+    return port
+
+
+def floats( module, *names ):
+    """
+    an upper bound of the float objects one call of the functions names in
+    src/module.py creates on ports that box floats: every arithmetic result,
+    float function call and array element read. 'Class.method' names a method.
+    The functions must be straight line code, without loops
+    """
+    import ast
+    with open(os.path.join(SRC, module.replace('.', os.sep) + '.py')) as file:
+        tree = ast.parse(file.read())
+    functions = {}
+    for node in tree.body:
+        if isinstance(node, ast.FunctionDef):
+            functions[node.name] = node
+        elif isinstance(node, ast.ClassDef):
+            for method in node.body:
+                if isinstance(method, ast.FunctionDef):
+                    functions[node.name + '.' + method.name] = method
+    calls = ('sqrt', 'abs', 'min', 'max', 'sin', 'cos', 'atan2', 'asin', 'acos', 'radians', 'degrees', 'float')
+    count = 0
+    for name in names:
+        for node in ast.walk(functions[name]):
+            if isinstance(node, (ast.For, ast.While, ast.comprehension)):
+                raise ValueError(name + " loops")
+            if isinstance(node, (ast.BinOp, ast.AugAssign)):
+                count += 1
+            elif isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+                count += 1
+            elif isinstance(node, ast.Subscript) and isinstance(node.ctx, ast.Load):
+                count += 1
+            elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in calls:
+                count += 1
+    return count
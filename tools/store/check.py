@@ -0,0 +1,118 @@
+"""
+Checks of src/store on the host, in a temporary directory
+
+gyrotemp: a table of GYROTEMP bins, as fusion.gyrotemp.GyroTemperature()
+    dumps it, survives save and load. One bin more raises ValueError and
+    leaves the file on flash as it was.
+recorder: store.recorder.Recorder fills a ring of RING blocks past the wrap
+    and loses power short of a header update, the saved head is stale.
+    tools/replay/logreader.py reads every record written back in order,
+    then after a restart that recovers the head and loses power again.
+
+    py ./tools/store/check.py
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'simulator'))
+import sim
+
+sim.install()
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'replay'))
+import clock
+import uasyncio
+import logreader
+from store import ahrs as store
+from store import recorder
+from fusion.gyrotemp import GyroTemperature
+
+RING = 4    # blocks
+
+
+def table( nodes ):
+    """ a dump of a learned GyroTemperature with nodes bins """
+    return (-10.0, 5.0, [0.001 * k for k in range(3 * nodes)], [float(k + 1) for k in range(nodes)])
+
+def gyrotemp( filename ):
+    learned = GyroTemperature()
+    assert learned.nodes == store.GYROTEMP, learned.nodes
+    store.load(filename)
+    store.select('imu0')
+    store.gyrotemp(table(store.GYROTEMP))
+    store.save(filename)
+    store.load(filename)
+    low, step, values, weight = store.gyrotemp()
+    expected = table(store.GYROTEMP)
+    assert (low, step) == expected[:2] and len(weight) == store.GYROTEMP
+    assert max(abs(a - b) for a, b in zip(values + weight, expected[2] + expected[3])) < 1e-6
+    learned.restore(store.gyrotemp())
+    assert list(learned.weight) == expected[3]
+    print("gyrotemp: {} bins saved and loaded".format(store.GYROTEMP))
+
+    with open(filename, 'rb') as file:
+        before = file.read()
+    store.gyrotemp(table(store.GYROTEMP + 1))
+    try:
+        store.save(filename)
+    except ValueError as e:
+        print("gyrotemp: {} bins raise ValueError: {}".format(store.GYROTEMP + 1, e))
+    else:
+        raise AssertionError("a table of {} bins was saved".format(store.GYROTEMP + 1))
+    with open(filename, 'rb') as file:
+        assert file.read() == before, "the file changed"
+
+class Sensor(object):
+    """ the scale factors the recorder puts in the header """
+    accelSSF = 16384.0
+    gyroSSF = 131.0
+    asax = asay = asaz = 1.0
+
+async def record( log, blocks, counter ):
+    """ blocks of records with an increasing gyro x, then a power cut: the file is closed without the header """
+    motion = bytearray(14)
+    magdata = bytearray(7)
+    writer = uasyncio.create_task(log.writerTask())
+    for _ in range(blocks * recorder.BLOCK):
+        counter[0] += 1
+        motion[8:10] = counter[0].to_bytes(2, 'big')
+        log.append(motion, magdata, False)
+        clock.advance(0.01)
+        await uasyncio.sleep_ms(1)
+    # the full block goes to the writer with the next record
+    log.next()
+    while log.pending is not None:
+        await uasyncio.sleep_ms(1)
+    writer.cancel()
+    log.file.close()
+    log.file = None
+
+def written( filename ):
+    data = logreader.load(filename)
+    return (data['gyro'][:, 0] * Sensor.gyroSSF).round().astype(int).tolist(), data['t']
+
+def ring( filename ):
+    counter = [0]
+    log = recorder.Recorder(Sensor(), filename, capacity=RING * recorder.BLOCK)
+    blocks = recorder.HEADEREVERY + RING - 1
+    uasyncio.run(record(log, blocks, counter))
+    saved = logreader.header(filename)['head'] // recorder.BLOCK
+    assert saved != log.head // recorder.BLOCK, "the saved head is not stale"
+    values, t = written(filename)
+    assert values == list(range(counter[0] - RING * recorder.BLOCK + 1, counter[0] + 1)), values[::recorder.BLOCK]
+    assert (t[1:] > t[:-1]).all()
+    print("recorder: {} blocks in a ring of {}, saved head at block {} instead of {}, read back in order".format(
+        blocks, RING, saved, log.head // recorder.BLOCK))
+
+    log = recorder.Recorder(Sensor(), filename, capacity=RING * recorder.BLOCK)
+    assert log.open()
+    assert log.head == (blocks % RING) * recorder.BLOCK and log.total == blocks * recorder.BLOCK, (log.head, log.total)
+    uasyncio.run(record(log, 2, counter))
+    values, t = written(filename)
+    assert values == list(range(counter[0] - RING * recorder.BLOCK + 1, counter[0] + 1)), values[::recorder.BLOCK]
+    print("recorder: restarted at the recovered head, 2 blocks more read back in order")
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as directory:
+        gyrotemp(os.path.join(directory, store.FILENAME))
+        ring(os.path.join(directory, 'log.bin'))
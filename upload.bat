@@ -11,6 +11,11 @@ rem ampy rmdir /ui
 
 ampy mkdir /store
 ampy mkdir /drivers
+ampy mkdir /fusion
+ampy mkdir /navigation
+ampy mkdir /qmath
+ampy mkdir /system
+ampy mkdir /control
 
 
 
@@ -23,13 +28,45 @@ rem ampy put ./src/bitmaps /bitmaps
 
 echo uploading store
 ampy put ./src/store/ahrs.py /store/ahrs.py
+ampy put ./src/store/recorder.py /store/recorder.py
 
 echo uploading drivers
 ampy put ./src/drivers/ahrs.py /drivers/ahrs.py
 ampy put ./src/drivers/i2c.py /drivers/i2c.py
+ampy put ./src/drivers/bus.py /drivers/bus.py
+ampy put ./src/drivers/gps.py /drivers/gps.py
+ampy put ./src/drivers/ubx.py /drivers/ubx.py
+
+echo uploading fusion
+ampy put ./src/fusion/madgwick.py /fusion/madgwick.py
+ampy put ./src/fusion/mahony.py /fusion/mahony.py
+ampy put ./src/fusion/magcal.py /fusion/magcal.py
+ampy put ./src/fusion/gyrobias.py /fusion/gyrobias.py
+ampy put ./src/fusion/gyrotemp.py /fusion/gyrotemp.py
+
+echo uploading navigation
+ampy put ./src/navigation/declination.py /navigation/declination.py
+ampy put ./src/navigation/geodesy.py /navigation/geodesy.py
+ampy put ./src/navigation/route.py /navigation/route.py
+rem the declination table from tools/declination/wmmgrid.py, not in the tree until generated
+if exist src\declination.bin ampy put ./src/declination.bin /declination.bin
+if not exist src\declination.bin echo no src\declination.bin, the heading stays magnetic
+
+echo uploading control
+ampy put ./src/control/pid.py /control/pid.py
+ampy put ./src/control/heading.py /control/heading.py
+
+echo uploading qmath
+ampy put ./src/qmath/quaternion.py /qmath/quaternion.py
+
+echo uploading system
+ampy put ./src/system/timing.py /system/timing.py
+ampy put ./src/system/scheduler.py /system/scheduler.py
 
 rem echo uploading networking
 rem ampy put ./src/networking /networking
+ampy mkdir /networking
+ampy put ./src/networking/telemetry.py /networking/telemetry.py
 
 echo uploading main 
 ampy put ./src/main.py /main.py